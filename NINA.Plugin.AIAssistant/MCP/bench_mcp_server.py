@@ -0,0 +1,557 @@
+#!/usr/bin/env python3
+"""
+NINA Advanced API MCP Server benchmarks
+Measures the hot paths of nina_advanced_api_mcp_server.py in-process, call latency and
+throughput against the local API simulator (in-process and over stdio), and startup time
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Awaitable, Callable, Optional
+
+import nina_advanced_api_mcp_server as nina
+import nina_api_simulator as simulator
+
+# In-process runs record nothing either (see SERVER_ENV)
+nina.session_store.path = ""
+nina.image_index.path = ""
+
+# Keep per-call log lines out of the measurements
+for name in ("nina-mcp-server", "nina-api-simulator", "httpx"):
+    logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def measure(func: Callable[[], Any], iterations: int) -> dict:
+    """Time a callable and record the memory it allocates per call"""
+    func()  # warm up
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    snapshot_before = tracemalloc.take_snapshot()
+    func()
+    snapshot_after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    allocations = sum(
+        stat.count_diff for stat in snapshot_after.compare_to(snapshot_before, "filename")
+        if stat.count_diff > 0
+    )
+
+    return {
+        "iterations": iterations,
+        "mean_us": elapsed / iterations * 1e6,
+        "peak_kib": (peak - before) / 1024,
+        "allocated_blocks": allocations,
+    }
+
+
+def percentiles(samples: list[float]) -> dict:
+    """Mean and p50/p95/p99 of per-call durations given in seconds, in microseconds"""
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e6
+
+    return {"mean_us": sum(ordered) / len(ordered) * 1e6, "p50_us": pick(0.50), "p95_us": pick(0.95),
+            "p99_us": pick(0.99)}
+
+
+async def measure_async(func: Callable[[], Awaitable], iterations: int, memory: bool = True) -> dict:
+    """Per-call latency percentiles of a coroutine function, run sequentially on the caller's loop"""
+    await func()  # warm up
+
+    samples = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        call_start = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    results = {"iterations": iterations, **percentiles(samples), "calls_per_s": iterations / elapsed}
+
+    if memory:
+        tracemalloc.start()
+        await func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results["peak_kib"] = peak / 1024
+    return results
+
+
+async def measure_concurrent(func: Callable[[], Awaitable], calls: int, concurrency: int) -> dict:
+    """Throughput of a coroutine function with `concurrency` callers sharing `calls` calls"""
+    await func()  # warm up
+
+    samples = []
+    remaining = calls
+
+    async def caller():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            call_start = time.perf_counter()
+            await func()
+            samples.append(time.perf_counter() - call_start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {"iterations": calls, **percentiles(samples), "calls_per_s": calls / elapsed}
+
+
+def run_sync(coro_func: Callable[[], Any]) -> Callable[[], Any]:
+    """Wrap an async callable so it can be measured synchronously"""
+    loop = asyncio.new_event_loop()
+    return lambda: loop.run_until_complete(coro_func())
+
+
+def bench_list_tools(iterations: int) -> dict:
+    """list_tools: rebuilding the catalog per call vs serving the cached one"""
+    return {
+        "rebuild_per_call": measure(nina.build_tool_catalog, iterations),
+        "cached_list": measure(run_sync(nina.handle_list_tools), iterations),
+    }
+
+
+# Representative argument values per JSON schema type
+SAMPLE_VALUES = {"string": "Sample", "number": 1.5, "integer": 2, "boolean": True}
+
+
+def sample_arguments(spec: nina.ToolSpec) -> dict:
+    """Build a plausible argument dict for a tool from its schema"""
+    return {name: SAMPLE_VALUES.get(schema.get("type"), "") for name, schema in spec.properties.items()}
+
+
+def linear_dispatch(tool_name: str, args: dict):
+    """Baseline: resolve a tool by comparing names in registry order, like an if/elif chain"""
+    for spec, binder in LINEAR_TABLE:
+        if tool_name == spec.name:
+            return binder(args)
+    return None
+
+
+LINEAR_TABLE = [(spec, spec.compile_binder()) for spec in nina.TOOL_SPECS]
+
+
+def bench_dispatch(iterations: int) -> dict:
+    """Tool name to endpoint resolution for every registered tool"""
+    results = {}
+    for spec in nina.TOOL_SPECS:
+        args = sample_arguments(spec)
+        name = spec.name
+        results[name] = {
+            "linear_scan": measure(lambda: linear_dispatch(name, args), iterations),
+            "dispatch_table": measure(lambda: nina.map_tool_to_endpoint(name, args), iterations),
+        }
+
+    summary = {}
+    for case in ("linear_scan", "dispatch_table"):
+        timings = {name: result[case]["mean_us"] for name, result in results.items()}
+        slowest = max(timings, key=timings.get)
+        summary[case] = {
+            "iterations": iterations,
+            "mean_us": sum(timings.values()) / len(timings),
+            "peak_kib": max(result[case]["peak_kib"] for result in results.values()),
+            "allocated_blocks": max(result[case]["allocated_blocks"] for result in results.values()),
+            "slowest_tool": slowest,
+            "slowest_us": timings[slowest],
+        }
+        summary[f"{case} ({slowest})"] = results[slowest][case]
+
+    return {**summary, "per_tool": results}
+
+
+def sample_camera_info() -> dict:
+    """A camera/info response shaped like NINA's"""
+    response = {
+        "TargetTemp": -10.0, "AtTargetTemp": True, "CanSetTemperature": True, "HasShutter": False,
+        "Temperature": -9.8, "Gain": 100, "DefaultGain": 100, "ElectronsPerADU": 0.25, "BinX": 1, "BinY": 1,
+        "Offset": 50, "DefaultOffset": 50, "USBLimit": 40, "IsSubSampleEnabled": False, "CameraState": "Idle",
+        "XSize": 6248, "YSize": 4176, "PixelSize": 3.76, "Battery": -1, "BitDepth": 16, "BinningModes": [
+            {"Name": f"{n}x{n}", "X": n, "Y": n} for n in range(1, 5)
+        ], "CoolerOn": True, "CoolerPower": 42.5, "DewHeaterOn": False, "ExposureMax": 3600, "ExposureMin": 3.2e-05,
+        "Gains": [], "Offsets": [], "CanSubSample": True, "IsExposing": False, "ExposureEndTime": "0001-01-01T00:00:00",
+        "LastDownloadTime": 1.23, "SensorType": "Monochrome", "BayerOffsetX": 0, "BayerOffsetY": 0,
+        "ReadoutModes": ["Normal", "High Speed"], "ReadoutMode": 0, "SupportedActions": [], "CanSetGain": True,
+        "CanSetOffset": True, "CanSetUSBLimit": True, "Connected": True, "Name": "ZWO ASI2600MM Pro",
+        "DisplayName": "ZWO ASI2600MM Pro", "Description": "ZWO ASI Camera", "DriverInfo": "ZWO native driver",
+        "DriverVersion": "1.31", "DeviceId": "ZWO ASI2600MM Pro #1",
+    }
+    return {"Response": response, "Error": "", "StatusCode": 200, "Success": True, "Type": "API"}
+
+
+def sample_sequence(depth: int = 4, breadth: int = 5) -> dict:
+    """A nested sequence/json response: containers of instructions, conditions and triggers"""
+    def container(level: int, index: int) -> dict:
+        node = {
+            "Name": f"Container {level}.{index}", "Status": "CREATED", "Strategy": "SequentialStrategy",
+            "Conditions": [{"Name": "Loop For Iterations", "Iterations": 10, "CompletedIterations": 0}],
+            "Triggers": [{"Name": "Meridian Flip", "MinutesAfterMeridian": 5, "Status": "CREATED"}],
+        }
+        if level < depth:
+            node["Items"] = [container(level + 1, i) for i in range(breadth)]
+        else:
+            node["Items"] = [
+                {"Name": "Take Exposure", "ExposureTime": 300, "Gain": -1, "Offset": -1, "Binning": {"X": 1, "Y": 1},
+                 "ImageType": "LIGHT", "ExposureCount": 0, "Status": "CREATED"}
+                for _ in range(breadth)
+            ]
+        return node
+
+    return {"Response": [container(1, 0)], "Error": "", "StatusCode": 200, "Success": True, "Type": "API"}
+
+
+def bench_payload(iterations: int) -> dict:
+    """Result encoding: Python repr vs compact JSON, with and without field projection"""
+    camera = sample_camera_info()
+    sequence = sample_sequence()
+    fields = ["Temperature", "CoolerPower"]
+    cases = {
+        "camera_info str()": lambda: str(camera),
+        "camera_info to_json": lambda: nina.to_json(camera),
+        "camera_info fields projection": lambda: nina.to_json(nina.project_fields(camera, fields)),
+        "sequence_json str()": lambda: str(sequence),
+        "sequence_json to_json": lambda: nina.to_json(sequence),
+    }
+    results = {}
+    for case, encode in cases.items():
+        results[case] = {**measure(encode, iterations), "bytes": len(encode().encode())}
+    return results
+
+
+# NINA API stand-in used by the roundtrip, throughput and stdio benchmarks
+SIMULATOR_CONFIG = simulator.SimulatorConfig(latency_ms=0, jitter_ms=0)
+CONCURRENCY_LEVELS = (1, 4, 16, 64)
+# Minimum simulated API latency for the throughput benchmark. The simulator shares the server's
+# event loop, so without latency to overlap every call is CPU-bound and concurrency only adds overhead
+THROUGHPUT_LATENCY_MS = 10.0
+STARTUP_RUNS = 5
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nina_advanced_api_mcp_server.py")
+BRIDGE_SCRIPT = os.path.join(os.path.dirname(SERVER_SCRIPT), "nina_mcp_bridge.py")
+# Environment for every server and daemon the benchmarks start, keeping simulated equipment out of the
+# user's session history and image index
+SERVER_ENV = {**os.environ, "NINA_MCP_SESSION_DB": "", "NINA_MCP_IMAGE_INDEX": ""}
+
+
+@asynccontextmanager
+async def local_api(config: simulator.SimulatorConfig = SIMULATOR_CONFIG):
+    """Run the API simulator and point the in-process server at it"""
+    api = await simulator.SimulatorServer(config).start()
+    nina.BASE_URL = api.base_url
+    nina.http_client = nina.create_http_client()
+    nina.response_cache.clear()
+    try:
+        await nina.handle_call_tool("nina_connect_camera", {})
+        yield api
+    finally:
+        await nina.http_client.aclose()
+        await api.close()
+
+
+class Uncoalesced:
+    """SingleFlight stand-in that sends every request, so concurrent identical calls all reach the API"""
+
+    async def run(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        return await fetch()
+
+
+@contextmanager
+def no_reuse():
+    """Make every call reach the API: cache TTLs of 0 for all devices and no request coalescing"""
+    ttls, coalescing = nina.response_cache.ttls, nina.single_flight
+    nina.response_cache.ttls, nina.single_flight = {}, Uncoalesced()
+    try:
+        yield
+    finally:
+        nina.response_cache.ttls, nina.single_flight = ttls, coalescing
+
+
+def call_tool(name: str, arguments: Optional[dict] = None) -> Callable[[], Awaitable]:
+    return lambda: nina.handle_call_tool(name, arguments or {})
+
+
+async def _roundtrip(iterations: int) -> dict:
+    async with local_api():
+        results = {
+            "list_tools": await measure_async(nina.handle_list_tools, iterations),
+            "call_tool camera_info (cached)": await measure_async(call_tool("nina_get_camera_info"), iterations),
+        }
+        with no_reuse():
+            for name in ("camera_info", "version", "sequence_json", "observatory_status"):
+                tool = f"nina_{name}" if name == "sequence_json" else f"nina_get_{name}"
+                results[f"call_tool {name} (uncached)"] = await measure_async(call_tool(tool), iterations)
+        return results
+
+
+def bench_roundtrip(iterations: int) -> dict:
+    """list_tools and call_tool in-process, end to end against the API simulator"""
+    return asyncio.run(_roundtrip(max(1, iterations // 10)))
+
+
+async def _throughput(iterations: int) -> dict:
+    config = simulator.SimulatorConfig(latency_ms=max(SIMULATOR_CONFIG.latency_ms, THROUGHPUT_LATENCY_MS),
+                                       jitter_ms=SIMULATOR_CONFIG.jitter_ms)
+    async with local_api(config) as api:
+        results = {}
+        with no_reuse():
+            for name in ("nina_get_version", "nina_get_camera_info"):
+                single = None
+                for concurrency in CONCURRENCY_LEVELS:
+                    calls = max(iterations // 10, concurrency * 4)
+                    requests = api.requests
+                    stats = await measure_concurrent(call_tool(name), calls, concurrency)
+                    # Includes the warm-up call; anything less than one request per call means calls were shared
+                    stats["api_requests"] = api.requests - requests
+                    single = single or stats["calls_per_s"]
+                    stats["speedup"] = stats["calls_per_s"] / single
+                    if stats["speedup"] < 1:
+                        pool = nina.POOL_SETTINGS["max_connections"]
+                        stats["note"] = (f"slower than x1: callers beyond the {pool:.0f} pooled connections wait "
+                                         "for one, or the run is CPU-bound (raise --api-latency-ms)")
+                    results[f"call_tool {name} x{concurrency}"] = stats
+        return results
+
+
+def bench_throughput(iterations: int) -> dict:
+    """call_tool calls per second at increasing concurrency against the API simulator
+
+    Every call reaches the simulator (no cache, no coalescing), which adds at
+    least THROUGHPUT_LATENCY_MS per request so concurrent calls can overlap.
+    """
+    return asyncio.run(_throughput(iterations))
+
+
+@asynccontextmanager
+async def mcp_session(env: Optional[dict] = None, script: str = SERVER_SCRIPT):
+    """Spawn the server (or another stdio MCP script) and yield an initialized client session"""
+    from mcp import ClientSession
+    from mcp.client.stdio import StdioServerParameters, stdio_client
+
+    params = StdioServerParameters(command=sys.executable, args=[script], env={**SERVER_ENV, **(env or {})})
+    with open(os.devnull, "w") as errlog:
+        async with stdio_client(params, errlog=errlog) as (read, write):
+            async with ClientSession(read, write) as client:
+                await client.initialize()
+                yield client
+
+
+async def _stdio(iterations: int) -> dict:
+    async with local_api() as api, mcp_session({"NINA_MCP_BASE_URL": api.base_url}) as client:
+        cases = {
+            "list_tools": client.list_tools,
+            "call_tool camera_info (cached)": lambda: client.call_tool("nina_get_camera_info", {}),
+            "call_tool version": lambda: client.call_tool("nina_get_version", {}),
+            "call_tool sequence_json": lambda: client.call_tool("nina_sequence_json", {}),
+        }
+        await client.call_tool("nina_connect_camera", {})
+        return {case: await measure_async(func, iterations, memory=False) for case, func in cases.items()}
+
+
+def bench_stdio(iterations: int) -> dict:
+    """Call latency over a real stdio MCP session with the server as a subprocess"""
+    return asyncio.run(_stdio(max(1, iterations // 10)))
+
+
+def time_python(*args: str) -> float:
+    """Wall time of a Python subprocess run from the server's directory"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], cwd=os.path.dirname(SERVER_SCRIPT), env=SERVER_ENV, check=True,
+                   capture_output=True)
+    return time.perf_counter() - start
+
+
+def import_breakdown() -> dict[str, float]:
+    """Cumulative import time in seconds of each module the server imports directly (python -X importtime)"""
+    module = os.path.splitext(os.path.basename(SERVER_SCRIPT))[0]
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=os.path.dirname(SERVER_SCRIPT), env=SERVER_ENV, check=True, capture_output=True,
+                            text=True)
+    breakdown, children = {}, {}
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"; nested imports are indented by
+        # two spaces and listed before the module that imported them
+        _, sep, fields = line.partition("import time:")
+        self_us, _, rest = fields.partition("|")
+        cumulative, _, name = rest.partition("|")
+        if not sep or not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children[name.strip()] = int(cumulative) / 1e6
+        elif depth == 0:
+            if name.strip() == module:
+                breakdown = {**children, "(module body)": int(self_us) / 1e6}
+            children = {}
+    return breakdown
+
+
+async def _handshakes(runs: int, env: Optional[dict] = None, script: str = SERVER_SCRIPT) -> list[float]:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        async with mcp_session(env, script):
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bridge_handshakes(runs: int) -> list[float]:
+    """Spawn-to-initialize times through nina_mcp_bridge.py to an already running daemon"""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    daemon = subprocess.Popen([sys.executable, SERVER_SCRIPT, "--daemon", "--port", str(port)], env=SERVER_ENV,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port)).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+        env = {"NINA_MCP_DAEMON_PORT": str(port), "NINA_MCP_DAEMON_AUTOSTART": "0"}
+        return asyncio.run(_handshakes(runs, env, BRIDGE_SCRIPT))
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+
+def bench_startup(iterations: int) -> dict:
+    """Time from spawning the server to a completed MCP initialize, with an import-time breakdown"""
+    module = os.path.splitext(os.path.basename(SERVER_SCRIPT))[0]
+    with open(SERVER_SCRIPT) as f:
+        source = f.read()
+
+    runs = {
+        "python interpreter": lambda: time_python("-c", "pass"),
+        "python + import server module": lambda: time_python("-c", f"import {module}"),
+    }
+    results = {case: {"iterations": STARTUP_RUNS, **percentiles([run() for _ in range(STARTUP_RUNS)])}
+               for case, run in runs.items()}
+    handshakes = {
+        "spawn to initialize": lambda: asyncio.run(_handshakes(STARTUP_RUNS)),
+        "spawn bridge to warm daemon": lambda: bridge_handshakes(STARTUP_RUNS),
+    }
+    for case, run in handshakes.items():
+        results[case] = {"iterations": STARTUP_RUNS, **percentiles(run())}
+    # Scripts run as __main__ are compiled on every start (no .pyc cache)
+    results["compile server script"] = measure(lambda: compile(source, SERVER_SCRIPT, "exec"), 10)
+
+    for name, seconds in sorted(import_breakdown().items(), key=lambda item: item[1], reverse=True):
+        if seconds >= 0.001:
+            results[f"  import {name}"] = {"iterations": 1, "mean_us": seconds * 1e6}
+    return results
+
+
+BENCHMARKS = {
+    "list_tools": bench_list_tools,
+    "dispatch": bench_dispatch,
+    "payload": bench_payload,
+    "roundtrip": bench_roundtrip,
+    "throughput": bench_throughput,
+    "stdio": bench_stdio,
+    "startup": bench_startup,
+}
+
+# Result columns: stat key, heading, format
+COLUMNS = (
+    ("mean_us", "mean (us)", ".1f"),
+    ("p50_us", "p50 (us)", ".1f"),
+    ("p95_us", "p95 (us)", ".1f"),
+    ("p99_us", "p99 (us)", ".1f"),
+    ("calls_per_s", "calls/s", ".0f"),
+    ("speedup", "vs x1", ".2f"),
+    ("api_requests", "API reqs", ""),
+    ("peak_kib", "peak (KiB)", ".1f"),
+    ("allocated_blocks", "blocks", ""),
+    ("bytes", "bytes", ""),
+)
+
+
+def print_results(name: str, results: dict):
+    """Print one benchmark's results as a table, with only the columns it reports"""
+    rows = {case: stats for case, stats in results.items() if "mean_us" in stats}
+    columns = [column for column in COLUMNS if any(column[0] in stats for stats in rows.values())]
+    print(f"\n== {name} ==")
+    print(f"{'case':<44}" + "".join(f"{heading:>12}" for _, heading, _ in columns))
+    for case, stats in rows.items():
+        print(f"{case:<44}" + "".join(
+            f"{format(stats[key], spec) if key in stats else '':>12}" for key, _, spec in columns
+        ))
+    for case, stats in rows.items():
+        if "note" in stats:
+            print(f"  ! {case}: {stats['note']}")
+
+
+def compare_results(baseline: dict, results: dict, threshold: float):
+    """Print p50 (or mean) changes against a previous --json run, flagging slowdowns beyond threshold"""
+    print(f"\n== comparison (regression threshold {threshold:.0%}) ==")
+    print(f"{'case':<56}{'baseline':>12}{'current':>12}{'change':>10}")
+    regressions = 0
+    for name, cases in results.items():
+        for case, stats in cases.items():
+            before = baseline.get(name, {}).get(case)
+            if not isinstance(before, dict) or "mean_us" not in stats or "mean_us" not in before:
+                continue
+            key = "p50_us" if "p50_us" in stats and "p50_us" in before else "mean_us"
+            change = stats[key] / before[key] - 1 if before[key] else 0.0
+            flag = " !" if change > threshold else ""
+            regressions += bool(flag)
+            print(f"{name + ': ' + case:<56}{before[key]:>12.1f}{stats[key]:>12.1f}{change:>+10.1%}{flag}")
+    print(f"{regressions} regression(s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the NINA Advanced API MCP server")
+    parser.add_argument("benchmarks", nargs="*", metavar="BENCHMARK",
+                        help=f"Benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("-n", "--iterations", type=int, default=1000, help="Iterations per case")
+    parser.add_argument("--json", dest="json_path", help="Also write results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="Compare against results saved earlier with --json")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative slowdown reported as a regression by --compare (default: 0.10)")
+    parser.add_argument("--api-latency-ms", type=float, default=SIMULATOR_CONFIG.latency_ms,
+                        help="Latency the API simulator adds to every request")
+    parser.add_argument("--api-jitter-ms", type=float, default=SIMULATOR_CONFIG.jitter_ms,
+                        help="Random extra simulator latency")
+    args = parser.parse_args()
+    SIMULATOR_CONFIG.latency_ms = args.api_latency_ms
+    SIMULATOR_CONFIG.jitter_ms = args.api_jitter_ms
+
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    results = {}
+    for name in args.benchmarks or BENCHMARKS:
+        results[name] = BENCHMARKS[name](args.iterations)
+        print_results(name, results[name])
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare_results(json.load(f), results, args.threshold)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,19 +5,49 @@ Exposes NINA Advanced API endpoints as MCP tools via stdio transport
 """
 
 import asyncio
+import base64
 import httpx
+import itertools
+import json
 import logging
-from typing import Any, Optional
+import math
+import operator
+import os
+import random
+import re
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import cached_property, lru_cache, partial
+from string import Formatter
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional
+from urllib.parse import urlsplit, urlunsplit
 from mcp.server.models import InitializationOptions
 from mcp.server import NotificationOptions, Server
 from mcp.server.stdio import stdio_server
 from mcp.types import (
+    ImageContent,
+    Resource,
     Tool,
     TextContent,
     INVALID_PARAMS,
     INTERNAL_ERROR
 )
 
+if TYPE_CHECKING:
+    # Imported where used, so they stay out of startup
+    import sqlite3
+    from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson  # optional, faster JSON encoder
+except ImportError:
+    orjson = None
+
 # Configure logging to stderr (stdout is reserved for MCP protocol)
 logging.basicConfig(
     level=logging.INFO,
@@ -26,1030 +56,4242 @@ logging.basicConfig(
 )
 logger = logging.getLogger("nina-mcp-server")
 
-# NINA Advanced API base URL
-BASE_URL = "http://localhost:1888/v2/api"
+# NINA Advanced API base URL (NINA_MCP_BASE_URL points the server at another host or the simulator)
+BASE_URL = os.environ.get("NINA_MCP_BASE_URL", "http://localhost:1888/v2/api")
+
+
+def _env_float_map(name: str, defaults: dict[str, float]) -> dict[str, float]:
+    """Apply "key=value,key=value" overrides from an environment variable to a float map"""
+    values = dict(defaults)
+    for item in os.environ.get(name, "").split(","):
+        key, sep, value = item.partition("=")
+        if not sep:
+            continue
+        try:
+            values[key.strip()] = float(value)
+        except ValueError:
+            logger.warning(f"Ignoring invalid {name} entry: {item}")
+    return values
+
+
+# Seconds that *_info responses are cached, per device class ("list" covers every *_list
+# endpoint). Override with e.g. NINA_MCP_CACHE_TTL="camera=5,weather=60"; 0 disables caching.
+CACHE_TTLS = _env_float_map("NINA_MCP_CACHE_TTL", {
+    "camera": 2.0,
+    "telescope": 1.0,
+    "focuser": 2.0,
+    "filterwheel": 5.0,
+    "rotator": 2.0,
+    "flatdevice": 5.0,
+    "switch": 5.0,
+    "weather": 30.0,
+    "safetymonitor": 5.0,
+    "guider": 1.0,
+    "dome": 2.0,
+    "framing": 5.0,
+    "list": 30.0,
+})
+
+# Responses are streamed and rejected beyond this size so one huge payload can't exhaust memory
+MAX_RESPONSE_BYTES = int(os.environ.get("NINA_MCP_MAX_RESPONSE_BYTES", 32 * 1024 * 1024))
+
+# List and sequence results larger than this (in JSON characters) are returned in pages
+MAX_RESULT_CHARS = int(os.environ.get("NINA_MCP_MAX_RESULT_CHARS", 16 * 1024))
+
+# Connection pool for the NINA API, e.g. NINA_MCP_POOL="max_connections=32,keepalive_expiry=60"
+POOL_SETTINGS = _env_float_map("NINA_MCP_POOL", {
+    "max_connections": 16,
+    "max_keepalive_connections": 8,
+    "keepalive_expiry": 30.0,
+})
+
+# Timeouts in seconds: "connect" applies to every call, the others are read timeouts per tool
+# class (reads, commands, background jobs; 0 waits indefinitely), e.g. NINA_MCP_TIMEOUTS="read=5"
+TIMEOUT_SETTINGS = _env_float_map("NINA_MCP_TIMEOUTS", {
+    "connect": 2.0,
+    "read": 10.0,
+    "command": 30.0,
+    "job": 0.0,
+})
+
+# Deadline margins for tools whose duration comes from their arguments
+CAPTURE_DOWNLOAD_MARGIN = 60.0  # seconds on top of the exposure time for readout and download
+WAIT_SLACK = 10.0  # seconds on top of nina_wait's duration
+
+# nina_wait_until: default and longest timeout, and the range of the backoff between checks (seconds)
+WAIT_UNTIL_TIMEOUT = 120.0
+WAIT_UNTIL_MAX_TIMEOUT = 3600.0
+WAIT_UNTIL_POLL_MIN = 0.25
+WAIT_UNTIL_POLL_MAX = 5.0
+
+# Macros: optional JSON file holding user-defined macros, default deadline of a whole run (seconds),
+# and the size above which a step's result is cut short in the trace
+MACROS_FILE = os.environ.get("NINA_MCP_MACROS_FILE", "")
+MACRO_TIMEOUT = 4 * 3600.0
+MACRO_RESULT_CHARS = 2000
+
+# Per-tool deadline overrides in seconds, e.g. NINA_MCP_TOOL_TIMEOUTS="nina_start_autofocus=1200". An
+# override is the whole deadline, not a margin on top of an exposure time; 0 removes the deadline
+TOOL_TIMEOUT_OVERRIDES = _env_float_map("NINA_MCP_TOOL_TIMEOUTS", {})
+
+# HTTP/2 needs the optional h2 package and only helps behind a TLS-terminating proxy
+HTTP2_ENABLED = os.environ.get("NINA_MCP_HTTP2", "").lower() in ("1", "true", "yes")
+
+# Read-only calls are retried with jittered exponential backoff on transport errors and 502/503/504
+READ_RETRIES = int(os.environ.get("NINA_MCP_READ_RETRIES", 2))
+RETRY_BACKOFF = 0.1  # seconds before the first retry
+RETRY_BACKOFF_MAX = 2.0
+RETRYABLE_STATUS = frozenset({502, 503, 504})
+
+# Per-tool metrics keep the last METRICS_WINDOW latencies for percentiles plus a fixed histogram
+METRICS_WINDOW = max(1, int(os.environ.get("NINA_MCP_METRICS_WINDOW", 512)))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Optional Prometheus text file with the per-tool metrics, rewritten at most every METRICS_FILE_INTERVAL seconds
+METRICS_FILE = os.environ.get("NINA_MCP_METRICS_FILE", "")
+METRICS_FILE_INTERVAL = 10.0
+
+# Daemon mode (--daemon) listens on localhost only unless told otherwise. Requests must be addressed to
+# this machine by a local name (DNS rebinding protection); add other Host names clients use, e.g. when
+# listening on 0.0.0.0, with NINA_MCP_DAEMON_ALLOWED_HOSTS="observatory-pc,192.168.1.20"
+DAEMON_HOST = os.environ.get("NINA_MCP_DAEMON_HOST", "127.0.0.1")
+DAEMON_PORT = int(os.environ.get("NINA_MCP_DAEMON_PORT", 8765))
+DAEMON_ALLOWED_HOSTS = [name.strip() for name in os.environ.get("NINA_MCP_DAEMON_ALLOWED_HOSTS", "").split(",")
+                        if name.strip()]
+
+# Opt-in background poller keeping equipment info fresh (NINA_MCP_POLL=1); seconds between polls per device state
+POLL_ENABLED = os.environ.get("NINA_MCP_POLL", "").lower() in ("1", "true", "yes")
+POLL_INTERVALS = _env_float_map("NINA_MCP_POLL_INTERVALS", {
+    "active": 1.0,        # busy (exposing, slewing, moving, settling) or recently commanded
+    "idle": 10.0,         # connected and idle
+    "disconnected": 30.0,
+})
+POLL_ACTIVE_AFTER_COMMAND = 15.0  # seconds a device stays at the active rate after a command
+
+# Opt-in NINA event stream (NINA_MCP_EVENTS=1, needs the websockets package); the URL defaults to
+# the /v2/socket endpoint next to BASE_URL
+EVENTS_ENABLED = os.environ.get("NINA_MCP_EVENTS", "").lower() in ("1", "true", "yes")
+EVENTS_URL = os.environ.get("NINA_MCP_EVENTS_URL", "")
+EVENT_LOG_SIZE = max(1, int(os.environ.get("NINA_MCP_EVENT_LOG_SIZE", 500)))
+EVENT_RECONNECT_MAX = 30.0  # longest wait in seconds between reconnection attempts
+
+# nina_get_image_stats: frames are binned to at most IMAGE_ANALYSIS_SIZE pixels on their longer side
+# while they stream in (needs NumPy); previews are NINA's own scaled JPEGs
+IMAGE_ANALYSIS_SIZE = 1024
+IMAGE_PREVIEW_SIZE = 256
+IMAGE_PREVIEW_QUALITY = 70
+IMAGE_PREVIEW_MAX_BYTES = 2 * 1024 * 1024
+
+# nina_scan_images: default capture directory, statistics index kept between runs (empty keeps it in memory
+# only) and worker processes (0 uses all cores but one, leaving one for NINA)
+IMAGE_DIRECTORY = os.environ.get("NINA_MCP_IMAGE_DIR", "")
+IMAGE_INDEX_FILE = os.environ.get(
+    "NINA_MCP_IMAGE_INDEX", os.path.join(os.path.expanduser("~"), ".nina_mcp_image_index.json")
+)
+IMAGE_SCAN_WORKERS = int(os.environ.get("NINA_MCP_IMAGE_WORKERS", 0)) or max(1, (os.cpu_count() or 2) - 1)
+
+# Session history: SQLite file recording equipment info, captures, autofocus runs, guiding, weather rule
+# changes and events (empty disables it). Info is recorded at most every SESSION_INFO_INTERVAL seconds
+# per device, and rows are written in batches every SESSION_FLUSH_INTERVAL seconds. Rows older than
+# SESSION_RETENTION_DAYS (0 keeps everything) are deleted every SESSION_PRUNE_INTERVAL seconds. At most
+# SESSION_MAX_PENDING rows wait to be written; beyond that the oldest are dropped
+SESSION_DB = os.environ.get("NINA_MCP_SESSION_DB", os.path.join(os.path.expanduser("~"), ".nina_mcp_session.db"))
+SESSION_INFO_INTERVAL = float(os.environ.get("NINA_MCP_SESSION_INFO_INTERVAL", 30))
+SESSION_FLUSH_INTERVAL = 2.0
+SESSION_RETENTION_DAYS = float(os.environ.get("NINA_MCP_SESSION_RETENTION_DAYS", 30))
+SESSION_PRUNE_INTERVAL = 3600.0
+SESSION_MAX_PENDING = 10000
+
+# Guider sampling for nina_guiding_summary, from startup with NINA_MCP_GUIDER_SAMPLING=1 or else from the
+# tool's first call: seconds between guider reads while guiding and otherwise, samples kept (3 hours at
+# 2 s), and the guide error in arcseconds under which a dither has settled
+GUIDER_SAMPLING_ENABLED = os.environ.get("NINA_MCP_GUIDER_SAMPLING", "").lower() in ("1", "true", "yes")
+GUIDER_SAMPLE_INTERVAL = float(os.environ.get("NINA_MCP_GUIDER_INTERVAL", 2.0))
+GUIDER_IDLE_INTERVAL = 10.0
+GUIDER_BUFFER_SIZE = max(16, int(os.environ.get("NINA_MCP_GUIDER_SAMPLES", 5400)))
+GUIDER_SETTLE_ARCSEC = float(os.environ.get("NINA_MCP_GUIDER_SETTLE_ARCSEC", 1.5))
+GUIDER_DITHER_MERGE = 10.0  # seconds within which dither signals (event, state change) count as one dither
+
+# Weather sampling for nina_weather_trend, from startup with NINA_MCP_WEATHER_SAMPLING=1 or else from the
+# tool's first call: seconds between weather and safety monitor reads, samples kept (24 hours at 60 s),
+# rules checked on every sample (e.g. NINA_MCP_WEATHER_RULES="Humidity>90,rate(Pressure)<-2", rates per
+# hour), the seconds of samples a rate is fitted over, and the samples in a row an active rule must fail
+# before it clears, so noise around a threshold doesn't toggle it on every sample
+WEATHER_SAMPLING_ENABLED = os.environ.get("NINA_MCP_WEATHER_SAMPLING", "").lower() in ("1", "true", "yes")
+WEATHER_SAMPLE_INTERVAL = float(os.environ.get("NINA_MCP_WEATHER_INTERVAL", 60.0))
+WEATHER_BUFFER_SIZE = max(16, int(os.environ.get("NINA_MCP_WEATHER_SAMPLES", 1440)))
+WEATHER_RULES = os.environ.get("NINA_MCP_WEATHER_RULES", "")
+WEATHER_RATE_WINDOW = max(900.0, 5 * WEATHER_SAMPLE_INTERVAL)
+WEATHER_RULE_CLEAR_SAMPLES = 3
+
+class NinaServer(Server):
+    """MCP server whose initialize response also advertises resource subscriptions
+
+    The SDK leaves `subscribe` out even when a subscribe handler is registered.
+    Every transport (stdio, streamable HTTP, SSE) builds its initialize
+    response from create_initialization_options().
+    """
+
+    def create_initialization_options(self, notification_options: Optional[NotificationOptions] = None,
+                                      experimental_capabilities: Optional[dict] = None) -> InitializationOptions:
+        options = super().create_initialization_options(notification_options, experimental_capabilities)
+        options.server_version = "1.0.0"
+        if options.capabilities.resources is not None:
+            options.capabilities.resources.subscribe = True
+        return options
+
 
 # Create MCP server instance
-server = Server("nina-advanced-api-server")
+server = NinaServer("nina-advanced-api-server")
 
-# HTTP client for API calls
-http_client = httpx.AsyncClient(timeout=30.0)
 
+def build_timeouts() -> dict[str, httpx.Timeout]:
+    """httpx timeouts for each tool class"""
+    connect = TIMEOUT_SETTINGS["connect"]
+    command = TIMEOUT_SETTINGS["command"] or None
+    return {
+        name: httpx.Timeout(connect=connect, read=TIMEOUT_SETTINGS[name] or None, write=command, pool=command)
+        for name in ("read", "command", "job")
+    }
 
-@server.list_tools()
-async def handle_list_tools() -> list[Tool]:
-    """List all available NINA Advanced API tools"""
-    
-    tools = [
-        # System
-        Tool(
-            name="nina_get_version",
-            description="Get NINA application version",
-            inputSchema={
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        ),
-        
-        # Camera
-        Tool(
-            name="nina_connect_camera",
-            description="Connect to a camera device",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "device_id": {"type": "string", "description": "Device ID to connect to"}
-                },
-                "required": ["device_id"]
-            }
-        ),
-        Tool(
-            name="nina_disconnect_camera",
-            description="Disconnect the camera",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_get_camera_info",
-            description="Get camera information and status",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_list_cameras",
-            description="List all available cameras",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_capture_image",
-            description="Capture an image with the camera",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "exposure_time": {"type": "number", "description": "Exposure time in seconds"},
-                    "binning": {"type": "integer", "description": "Binning factor (1, 2, 3, 4)", "default": 1},
-                    "gain": {"type": "integer", "description": "Gain value", "default": 0}
-                },
-                "required": ["exposure_time"]
-            }
-        ),
-        Tool(
-            name="nina_start_cooling",
-            description="Start camera cooling to target temperature",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "temperature": {"type": "number", "description": "Target temperature in Celsius"},
-                    "duration": {"type": "integer", "description": "Duration in minutes", "default": 0}
-                },
-                "required": ["temperature"]
-            }
-        ),
-        Tool(
-            name="nina_stop_cooling",
-            description="Stop camera cooling",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_set_binning",
-            description="Set camera binning",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "binning": {"type": "integer", "description": "Binning factor (1, 2, 3, 4)"}
-                },
-                "required": ["binning"]
-            }
-        ),
-        Tool(
-            name="nina_control_dew_heater",
-            description="Control camera dew heater",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "on": {"type": "boolean", "description": "Turn heater on (true) or off (false)"}
-                },
-                "required": ["on"]
-            }
-        ),
-        Tool(
-            name="nina_set_gain",
-            description="Set camera gain",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "gain": {"type": "integer", "description": "Gain value"}
-                },
-                "required": ["gain"]
-            }
-        ),
-        Tool(
-            name="nina_set_offset",
-            description="Set camera offset",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "offset": {"type": "integer", "description": "Offset value"}
-                },
-                "required": ["offset"]
-            }
-        ),
-        Tool(
-            name="nina_start_warming",
-            description="Start warming camera to ambient temperature",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "duration": {"type": "integer", "description": "Warming duration in minutes"}
-                },
-                "required": ["duration"]
-            }
-        ),
-        
-        # Mount (Telescope)
-        Tool(
-            name="nina_connect_telescope",
-            description="Connect to telescope mount",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "device_id": {"type": "string", "description": "Device ID to connect to"}
-                },
-                "required": ["device_id"]
-            }
-        ),
-        Tool(
-            name="nina_disconnect_telescope",
-            description="Disconnect telescope mount",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_get_telescope_info",
-            description="Get telescope mount information and coordinates",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_list_telescopes",
-            description="List all available telescope mounts",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_slew_telescope",
-            description="Slew telescope to coordinates",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "ra": {"type": "number", "description": "Right Ascension in hours (0-24)"},
-                    "dec": {"type": "number", "description": "Declination in degrees (-90 to +90)"}
-                },
-                "required": ["ra", "dec"]
-            }
-        ),
-        Tool(
-            name="nina_park_telescope",
-            description="Park the telescope mount",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_unpark_telescope",
-            description="Unpark the telescope mount",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_stop_telescope",
-            description="Stop telescope movement immediately",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        
-        # Focuser
-        Tool(
-            name="nina_connect_focuser",
-            description="Connect to focuser",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "device_id": {"type": "string", "description": "Device ID to connect to"}
-                },
-                "required": ["device_id"]
-            }
-        ),
-        Tool(
-            name="nina_disconnect_focuser",
-            description="Disconnect focuser",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_get_focuser_info",
-            description="Get focuser position and status",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_list_focusers",
-            description="List all available focusers",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_move_focuser",
-            description="Move focuser to absolute position",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "position": {"type": "integer", "description": "Target position"}
-                },
-                "required": ["position"]
-            }
-        ),
-        Tool(
-            name="nina_start_autofocus",
-            description="Start autofocus routine",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "method": {"type": "string", "description": "Autofocus method", "default": ""}
-                },
-                "required": []
-            }
-        ),
-        Tool(
-            name="nina_cancel_autofocus",
-            description="Cancel running autofocus",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_get_autofocus_status",
-            description="Get autofocus routine status",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_halt_focuser",
-            description="Halt focuser movement immediately",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        
-        # Filter Wheel
-        Tool(
-            name="nina_connect_filterwheel",
-            description="Connect to filter wheel",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "device_id": {"type": "string", "description": "Device ID to connect to"}
-                },
-                "required": ["device_id"]
-            }
-        ),
-        Tool(
-            name="nina_disconnect_filterwheel",
-            description="Disconnect filter wheel",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_get_filterwheel_info",
-            description="Get filter wheel information and current filter",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_list_filterwheels",
-            description="List all available filter wheels",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_change_filter",
-            description="Change to specified filter",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "filter": {"type": "string", "description": "Filter name"}
-                },
-                "required": ["filter"]
-            }
-        ),
-        
-        # Rotator
-        Tool(
-            name="nina_connect_rotator",
-            description="Connect to rotator",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "device_id": {"type": "string", "description": "Device ID to connect to"}
-                },
-                "required": ["device_id"]
-            }
-        ),
-        Tool(
-            name="nina_disconnect_rotator",
-            description="Disconnect rotator",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_list_rotators",
-            description="List all available rotators",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_get_rotator_info",
-            description="Get rotator angle and status",
-            inputSchema={"type": "object", "properties": {}, "required": []}
+
+TIMEOUTS = build_timeouts()
+
+
+class TransportStats:
+    """Request, connection and retry counters for the NINA API client"""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self.retries = 0
+
+    async def trace(self, event: str, info: dict):
+        """httpcore trace hook; sees one connect per new connection and one header send per request"""
+        if event == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+        elif event.endswith(".send_request_headers.complete"):
+            self.requests += 1
+
+    def stats(self) -> dict:
+        reused = max(0, self.requests - self.connections_opened)
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "connections_reused": reused,
+            "reuse_ratio": round(reused / self.requests, 3) if self.requests else 0.0,
+            "retries": self.retries,
+            "http2": HTTP2_ENABLED,
+            "pool": POOL_SETTINGS,
+            "timeouts": TIMEOUT_SETTINGS,
+        }
+
+
+transport_stats = TransportStats()
+
+
+@dataclass
+class CallStats:
+    """Upstream work done on behalf of one tool call, collected through current_call"""
+    upstream_requests: int = 0
+    upstream_bytes: int = 0
+    upstream_seconds: float = 0.0  # summed over parallel requests
+    cache_hits: int = 0
+
+
+# Set by handle_call_tool; tasks spawned during the call share the same CallStats
+current_call: ContextVar[Optional[CallStats]] = ContextVar("current_call", default=None)
+
+
+class ToolMetrics:
+    """Counters, a latency histogram and a ring buffer of recent latencies for one tool
+
+    Memory is fixed per tool: the ring keeps the last `window` latencies and
+    overwrites the oldest one.
+    """
+
+    def __init__(self, window: int):
+        self.calls = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.upstream_requests = 0
+        self.upstream_bytes = 0
+        self.upstream_seconds = 0.0
+        self.cache_hits = 0
+        self.latency_sum = 0.0
+        self.buckets = array("Q", bytes(8 * (len(LATENCY_BUCKETS) + 1)))  # the last bucket is +Inf
+        self.recent = array("d", bytes(8 * window))
+
+    def record(self, seconds: float, failed: bool, bytes_in: int, bytes_out: int, call: CallStats):
+        self.recent[self.calls % len(self.recent)] = seconds
+        self.calls += 1
+        self.errors += failed
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        self.upstream_requests += call.upstream_requests
+        self.upstream_bytes += call.upstream_bytes
+        self.upstream_seconds += call.upstream_seconds
+        self.cache_hits += call.cache_hits
+        self.latency_sum += seconds
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def snapshot(self, histogram: bool = False) -> dict:
+        recent = sorted(self.recent[:min(self.calls, len(self.recent))])
+
+        def pick(q: float) -> float:
+            return round(recent[min(len(recent) - 1, int(q * len(recent)))] * 1000, 2) if recent else 0.0
+
+        snapshot = {
+            "calls": self.calls,
+            "errors": self.errors,
+            "mean_ms": round(self.latency_sum / self.calls * 1000, 2) if self.calls else 0.0,
+            "p50_ms": pick(0.50),
+            "p95_ms": pick(0.95),
+            "p99_ms": pick(0.99),
+            "max_ms": pick(1.0),
+            "upstream_ms": round(self.upstream_seconds / self.calls * 1000, 2) if self.calls else 0.0,
+            "upstream_requests": self.upstream_requests,
+            "upstream_bytes": self.upstream_bytes,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "cache_hits": self.cache_hits,
+        }
+        if histogram:
+            bounds = [str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"]
+            snapshot["latency_histogram"] = dict(zip(bounds, self.buckets))
+        return snapshot
+
+
+class ServerMetrics:
+    """Per-tool metrics for every call handled by the server
+
+    Percentiles and max cover the last METRICS_WINDOW calls of a tool; the
+    counters and histogram cover everything since start (or the last reset).
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self.started = time.time()
+        self.tools: dict[str, ToolMetrics] = {}
+        self._written = 0.0
+
+    def record(self, name: str, seconds: float, failed: bool, bytes_in: int, bytes_out: int, call: CallStats):
+        tool = self.tools.get(name)
+        if tool is None:
+            tool = self.tools[name] = ToolMetrics(self.window)
+        tool.record(seconds, failed, bytes_in, bytes_out, call)
+
+        if METRICS_FILE and time.monotonic() - self._written >= METRICS_FILE_INTERVAL:
+            self._written = time.monotonic()
+            self.write_prometheus(METRICS_FILE)
+
+    def snapshot(self, tool: Optional[str] = None) -> dict:
+        if tool:
+            if tool not in self.tools:
+                raise ValueError(f"No calls recorded for {tool}")
+            return {tool: self.tools[tool].snapshot(histogram=True)}
+        ranked = sorted(self.tools.items(), key=lambda item: item[1].latency_sum, reverse=True)
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "calls": sum(metrics.calls for metrics in self.tools.values()),
+            "errors": sum(metrics.errors for metrics in self.tools.values()),
+            "tools": {name: metrics.snapshot() for name, metrics in ranked},
+        }
+
+    def reset(self):
+        self.started = time.time()
+        self.tools.clear()
+
+    def prometheus(self) -> str:
+        """The metrics in Prometheus text exposition format"""
+        counters = (
+            ("calls_total", "Tool calls handled", "calls"),
+            ("errors_total", "Tool calls that failed or returned an API error", "errors"),
+            ("request_bytes_total", "Bytes of tool arguments received", "bytes_in"),
+            ("response_bytes_total", "Bytes of tool results returned", "bytes_out"),
+            ("upstream_requests_total", "NINA API requests made", "upstream_requests"),
+            ("upstream_bytes_total", "Bytes received from the NINA API", "upstream_bytes"),
+            ("upstream_seconds_total", "Time spent waiting on the NINA API", "upstream_seconds"),
+            ("cache_hits_total", "Responses served from the cache or a shared request", "cache_hits"),
+        )
+        lines = []
+        for suffix, help_text, attribute in counters:
+            lines += [f"# HELP nina_mcp_tool_{suffix} {help_text}", f"# TYPE nina_mcp_tool_{suffix} counter"]
+            lines += [f'nina_mcp_tool_{suffix}{{tool="{name}"}} {getattr(metrics, attribute)}'
+                      for name, metrics in self.tools.items()]
+
+        lines += ["# HELP nina_mcp_tool_latency_seconds Tool call latency",
+                  "# TYPE nina_mcp_tool_latency_seconds histogram"]
+        for name, metrics in self.tools.items():
+            cumulative = 0
+            for bound, count in zip([*LATENCY_BUCKETS, "+Inf"], metrics.buckets):
+                cumulative += count
+                lines.append(f'nina_mcp_tool_latency_seconds_bucket{{tool="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'nina_mcp_tool_latency_seconds_sum{{tool="{name}"}} {metrics.latency_sum}')
+            lines.append(f'nina_mcp_tool_latency_seconds_count{{tool="{name}"}} {metrics.calls}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Atomically replace a Prometheus text file (e.g. for node_exporter's textfile collector)"""
+        try:
+            with open(path + ".tmp", "w") as f:
+                f.write(self.prometheus())
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {path}: {error_text(e)}")
+
+
+server_metrics = ServerMetrics(METRICS_WINDOW)
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """HTTP client with the configured pool limits, keep-alive and timeouts"""
+    http2 = HTTP2_ENABLED
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("NINA_MCP_HTTP2 is set but the h2 package is not installed; using HTTP/1.1")
+            http2 = False
+
+    return httpx.AsyncClient(
+        timeout=TIMEOUTS["command"],
+        limits=httpx.Limits(
+            max_connections=int(POOL_SETTINGS["max_connections"]),
+            max_keepalive_connections=int(POOL_SETTINGS["max_keepalive_connections"]),
+            keepalive_expiry=POOL_SETTINGS["keepalive_expiry"]
         ),
-        Tool(
-            name="nina_move_rotator",
-            description="Move rotator to angle",
+        http2=http2
+    )
+
+
+# HTTP client for API calls, created on first use: building it imports httpcore (and trio when
+# installed) and loads the CA bundle, which would otherwise delay the MCP handshake
+http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """The shared HTTP client, created on first call"""
+    global http_client
+    if http_client is None:
+        http_client = create_http_client()
+    return http_client
+
+
+def error_text(error: BaseException) -> str:
+    """Readable message for an exception, even when it carries none"""
+    return str(error) or type(error).__name__
+
+
+def to_json(value: Any) -> str:
+    """Serialize a tool result as compact JSON"""
+    if orjson is not None:
+        return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def from_json(data: bytes) -> Any:
+    """Decode a JSON response body"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def project_fields(value: Any, fields: list[str]) -> Any:
+    """Keep only the given keys of a result (inside the NINA envelope and for each list item)"""
+    if isinstance(value, list):
+        return [project_fields(item, fields) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if "Response" in value and "Success" in value:
+        return {**value, "Response": project_fields(value["Response"], fields)}
+    return {key: value[key] for key in fields if key in value}
+
+
+async def call_nina_api(endpoint: str, timeout: Any = httpx.USE_CLIENT_DEFAULT, retries: int = 0) -> Any:
+    """GET a NINA Advanced API endpoint and return the decoded JSON body
+
+    Only pass retries for idempotent reads; commands must not be repeated.
+    """
+    url = f"{BASE_URL}/{endpoint}"
+    logger.info(f"API call: {url}")
+
+    for attempt in range(retries + 1):
+        try:
+            return await _fetch_json(url, timeout)
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            retryable = isinstance(e, httpx.TransportError) or e.response.status_code in RETRYABLE_STATUS
+            if attempt == retries or not retryable:
+                raise
+            delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** attempt) * random.uniform(0.5, 1.5)
+            transport_stats.retries += 1
+            logger.warning(f"Retrying {url} in {delay:.2f}s after: {error_text(e)}")
+            await asyncio.sleep(delay)
+
+
+async def _fetch_json(url: str, timeout: Any) -> Any:
+    call = current_call.get()
+    start = time.perf_counter()
+    body = bytearray()
+    try:
+        trace = {"trace": transport_stats.trace}
+        async with get_http_client().stream("GET", url, timeout=timeout, extensions=trace) as response:
+            response.raise_for_status()
+
+            declared = int(response.headers.get("content-length") or 0)
+            if declared > MAX_RESPONSE_BYTES:
+                raise ValueError(f"Response of {declared} bytes exceeds the {MAX_RESPONSE_BYTES} byte limit")
+
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) > MAX_RESPONSE_BYTES:
+                    raise ValueError(f"Response exceeds the {MAX_RESPONSE_BYTES} byte limit")
+    finally:
+        if call is not None:
+            call.upstream_requests += 1
+            call.upstream_bytes += len(body)
+            call.upstream_seconds += time.perf_counter() - start
+
+    return from_json(body)
+
+
+async def stream_nina_api(endpoint: str, sink: Callable[[bytes], None], timeout: Any = httpx.USE_CLIENT_DEFAULT) -> str:
+    """GET an endpoint that returns raw bytes (images), handing each chunk to sink as it arrives
+
+    Returns the response's content type. NINA reports errors as a JSON envelope, which is raised.
+    """
+    url = f"{BASE_URL}/{endpoint}"
+    logger.info(f"API stream: {url}")
+    call = current_call.get()
+    start = time.perf_counter()
+    received = 0
+    try:
+        trace = {"trace": transport_stats.trace}
+        async with get_http_client().stream("GET", url, timeout=timeout, extensions=trace) as response:
+            response.raise_for_status()
+            content_type = response.headers.get("content-type", "application/octet-stream").split(";")[0]
+            if content_type == "application/json":
+                body = await response.aread()
+                received = len(body)
+                unwrap_response(from_json(body))
+                raise ValueError(f"NINA returned JSON instead of image data for {endpoint}")
+
+            async for chunk in response.aiter_bytes():
+                received += len(chunk)
+                sink(chunk)
+    finally:
+        if call is not None:
+            call.upstream_requests += 1
+            call.upstream_bytes += received
+            call.upstream_seconds += time.perf_counter() - start
+    return content_type
+
+
+@lru_cache(maxsize=1)
+def image_analysis():
+    """The NumPy-based nina_image_analysis module, or None without NumPy (imported on first use)"""
+    try:
+        import nina_image_analysis
+    except ImportError as e:
+        logger.warning(f"Image statistics unavailable: {error_text(e)}")
+        return None
+    return nina_image_analysis
+
+
+class ImageResult(dict):
+    """A tool result that also carries images, sent to MCP clients as image content
+
+    Everywhere else (batches, macros, jobs) it is an ordinary dict.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.images: list[ImageContent] = []
+
+
+class ResponseCache:
+    """TTL read-through cache of API responses keyed by endpoint
+
+    Entries are grouped by device class so a mutating call can drop them.
+    Concurrent misses are coalesced by the fetch function (see SingleFlight).
+    """
+
+    def __init__(self, ttls: dict[str, float]):
+        self.ttls = ttls
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: dict[str, tuple[float, str, Any]] = {}
+        self._generations: dict[str, int] = {}
+
+    def ttl_for(self, device: str, kind: str) -> float:
+        """Lifetime for an endpoint of the given device class and kind ("info" or "list")"""
+        return self.ttls.get("list" if kind == "list" else device, 0.0)
+
+    def generation(self, device: str) -> int:
+        """Counter bumped every time the device's responses are invalidated"""
+        return self._generations.get(device, 0)
+
+    async def get(self, endpoint: str, device: str, ttl: float, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached response for an endpoint, fetching it on a miss"""
+        entry = self._entries.get(endpoint)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            call = current_call.get()
+            if call is not None:
+                call.cache_hits += 1
+            return entry[2]
+
+        self.misses += 1
+        generation = self._generations.get(device, 0)
+        result = await fetch()
+        self.put(endpoint, device, ttl, result, generation)
+        return result
+
+    def put(self, endpoint: str, device: str, ttl: float, value: Any, generation: int):
+        """Store a response fetched at the given device generation
+
+        Nothing is stored if the device was invalidated since, so a response
+        that raced with a mutating call on the same device is never served.
+        """
+        if self._generations.get(device, 0) == generation:
+            self._entries[endpoint] = (time.monotonic() + ttl, device, value)
+
+    def invalidate(self, *devices: str):
+        """Drop every cached response for the given device classes"""
+        for device in devices:
+            self._generations[device] = self._generations.get(device, 0) + 1
+        stale = [endpoint for endpoint, entry in self._entries.items() if entry[1] in devices]
+        for endpoint in stale:
+            del self._entries[endpoint]
+        self.invalidations += 1
+
+    def clear(self):
+        """Drop every cached response"""
+        self.invalidate(*{entry[1] for entry in self._entries.values()}, *self._generations)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "ttl_seconds": self.ttls,
+        }
+
+
+response_cache = ResponseCache(CACHE_TTLS)
+
+
+class SingleFlight:
+    """Coalesces identical concurrent reads
+
+    A caller asking for a key that is already being fetched waits for that
+    request instead of sending its own. Waiters are shielded, so one caller
+    hitting its deadline doesn't cancel the request for the others.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.coalesced = 0
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    async def run(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.requests += 1
+            task = self._inflight[key] = asyncio.ensure_future(fetch())
+            task.add_done_callback(partial(self._done, key))
+        else:
+            self.coalesced += 1
+            call = current_call.get()
+            if call is not None:
+                call.cache_hits += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here in case every waiter gave up
+
+    def stats(self) -> dict:
+        """Upstream requests sent and saved"""
+        total = self.requests + self.coalesced
+        return {
+            "upstream_requests": self.requests,
+            "coalesced": self.coalesced,
+            "saved_ratio": round(self.coalesced / total, 3) if total else 0.0,
+            "in_flight": len(self._inflight),
+        }
+
+
+single_flight = SingleFlight()
+
+
+def flatten_items(payload: Any) -> list:
+    """Turn a list or a sequence tree into a flat list of page items
+
+    Sequence containers are walked depth-first; each node loses its child
+    "Items" and gains its "Path" (child indexes from the root) instead.
+    """
+    if not isinstance(payload, list):
+        payload = [payload]
+    if not any(isinstance(node, dict) and isinstance(node.get("Items"), list) for node in payload):
+        return payload
+
+    items = []
+    stack = [(str(index), node) for index, node in reversed(list(enumerate(payload)))]
+    while stack:
+        path, node = stack.pop()
+        if not isinstance(node, dict):
+            items.append(node)
+            continue
+        items.append({"Path": path, **{key: value for key, value in node.items() if key != "Items"}})
+        children = node.get("Items")
+        if isinstance(children, list):
+            stack.extend((f"{path}/{index}", child) for index, child in reversed(list(enumerate(children))))
+    return items
+
+
+class ResultPager:
+    """Splits large list/sequence results into pages addressed by continuation cursors
+
+    The flattened items of a paged result are kept (for a limited time and
+    number of results) so later pages come from the same snapshot without
+    another API call. Each snapshot remembers the tool and arguments that
+    produced it, and its cursors are only accepted by the same call.
+    """
+
+    def __init__(self, max_chars: int, max_snapshots: int = 8, retention: float = 600.0):
+        self.max_chars = max_chars
+        self.max_snapshots = max_snapshots
+        self.retention = retention
+        self._snapshots: OrderedDict[str, tuple[float, str, str, list]] = OrderedDict()
+        self._ids = itertools.count(1)
+
+    def first_page(self, result: Any, tool: str, arguments: dict) -> Any:
+        """Return small results unchanged and the first page of large ones
+
+        The size is measured item by item and only up to one page, so a large
+        result is never serialized in full just to find out it needs paging.
+        """
+        if isinstance(result, dict) and result.get("Success") is False:
+            return result
+        items = flatten_items(unwrap_response(result))
+        end = self._page_end(items, 0)
+        if end == len(items):
+            return result
+
+        snapshot = f"p{next(self._ids)}"
+        self._snapshots[snapshot] = (time.monotonic() + self.retention, tool, self._arguments_key(arguments), items)
+        while len(self._snapshots) > self.max_snapshots:
+            self._snapshots.popitem(last=False)
+        return self._page(snapshot, items, 0, end)
+
+    def next_page(self, cursor: str, tool: str, arguments: dict) -> dict:
+        """Return the page a continuation cursor points at
+
+        The cursor must come from the same tool. Arguments passed along with it
+        must match the ones of the first call; passing only the cursor is fine.
+        """
+        snapshot, _, offset = cursor.partition(":")
+        entry = self._snapshots.get(snapshot)
+        if entry is None or entry[0] < time.monotonic() or not offset.isdigit():
+            raise ValueError(f"Cursor {cursor} is invalid or expired; call the tool again without a cursor")
+        _, owner, key, items = entry
+        if owner != tool:
+            raise ValueError(f"Cursor {cursor} belongs to {owner}, not {tool}")
+        given = self._arguments_key(arguments)
+        if given != self._arguments_key({}) and given != key:
+            raise ValueError(f"Cursor {cursor} was issued for {owner} with different arguments; pass only the "
+                             f"cursor, or call the tool again without one")
+        return self._page(snapshot, items, int(offset), self._page_end(items, int(offset)))
+
+    @staticmethod
+    def _arguments_key(arguments: dict) -> str:
+        """Canonical form of a call's arguments, ignoring the cursor"""
+        return json.dumps({name: value for name, value in arguments.items() if name != "cursor"},
+                          sort_keys=True, default=str)
+
+    def _page_end(self, items: list, offset: int) -> int:
+        """Index after the last item of the page starting at offset (at least one item per page)"""
+        end = offset
+        size = 0
+        while end < len(items):
+            size += len(to_json(items[end])) + 1
+            if size > self.max_chars and end > offset:
+                break
+            end += 1
+        return end
+
+    @staticmethod
+    def _page(snapshot: str, items: list, offset: int, end: int) -> dict:
+        return {
+            "items": items[offset:end],
+            "offset": offset,
+            "total": len(items),
+            "next_cursor": f"{snapshot}:{end}" if end < len(items) else None,
+        }
+
+
+result_pager = ResultPager(MAX_RESULT_CHARS)
+
+
+# Fallback argument values used when a tool is called without an argument
+_TYPE_DEFAULTS = {"string": "", "number": 0, "integer": 0, "boolean": False}
+
+# Last endpoint path segments of tools that only read state from NINA
+_READ_ACTIONS = frozenset({"info", "list", "channels", "autofocus-status", "json", "version", "now"})
+
+# Read actions whose results can grow large enough to need paging
+_PAGED_ACTIONS = frozenset({"list", "channels", "json"})
+
+# Device classes whose state also changes when a tool of another class runs
+_SIDE_EFFECTS = {
+    "plate-solve": ("telescope",),
+    "framing": ("telescope",),
+}
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    """Declarative description of a single MCP tool and its API endpoint
+
+    The endpoint is a template such as "equipment/focuser/move?position={position}"
+    whose placeholders name tool arguments. Missing arguments fall back to
+    `defaults`, then the schema default, then a zero value for the schema type.
+    Tools whose endpoint can't be expressed as a template provide `bind`.
+
+    Long-running tools are started as background jobs (see JobTable), and
+    server-side tools have no endpoint and are executed by `handler`. A job
+    with `done_events` finishes when NINA announces one of them on the event
+    stream (see EventStream), rather than as soon as the API call returns.
+
+    `timeout` is the call's deadline in seconds, or, when `timeout_arg` names
+    a duration argument (e.g. the exposure time), the margin added to it.
+    Tools without one use the deadline of their class (see TimeoutPolicy).
+    """
+    name: str
+    endpoint: Optional[str]
+    description: str
+    properties: dict = field(default_factory=dict)
+    required: tuple = ()
+    defaults: dict = field(default_factory=dict)
+    bind: Optional[Callable[[dict], str]] = None
+    long_running: bool = False
+    cancel_endpoint: Optional[str] = None
+    handler: Optional[Callable[[dict], Awaitable[Any]]] = None
+    timeout: Optional[float] = None
+    timeout_arg: Optional[str] = None
+    done_events: tuple = ()
+
+    def to_tool(self) -> Tool:
+        """Build the MCP Tool object for this spec"""
+        description = self.description
+        if self.long_running:
+            description += " (runs as a background job and returns a job id; poll it with nina_job_status)"
+
+        properties = self.properties
+        if self.is_read:
+            properties = {**properties, "fields": _FIELDS}
+        if self.is_paged:
+            properties = {**properties, "cursor": _CURSOR}
+
+        return Tool(
+            name=self.name,
+            description=description,
             inputSchema={
                 "type": "object",
-                "properties": {
-                    "position": {"type": "number", "description": "Target angle in degrees"},
-                    "relative": {"type": "boolean", "description": "Relative movement", "default": False}
-                },
-                "required": ["position"]
+                "properties": properties,
+                "required": list(self.required)
             }
-        ),
-        Tool(
-            name="nina_halt_rotator",
-            description="Halt rotator movement",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_sync_rotator",
-            description="Sync rotator to mechanical position",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "position": {"type": "number", "description": "Mechanical position"}
-                },
-                "required": ["position"]
-            }
-        ),
-        Tool(
-            name="nina_set_rotator_reverse",
-            description="Set rotator reverse direction",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "reverse": {"type": "boolean", "description": "Reverse direction"}
-                },
-                "required": ["reverse"]
-            }
-        ),
-        
-        # Flat Panel
-        Tool(
-            name="nina_connect_flatpanel",
-            description="Connect to flat panel",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "device_id": {"type": "string", "description": "Device ID to connect to"}
-                },
-                "required": ["device_id"]
-            }
-        ),
-        Tool(
-            name="nina_disconnect_flatpanel",
-            description="Disconnect flat panel",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_list_flatpanels",
-            description="List all available flat panels",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_get_flatpanel_info",
-            description="Get flat panel status",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_set_flatpanel_light",
-            description="Control flat panel light",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "power": {"type": "boolean", "description": "Turn light on (true) or off (false)"}
-                },
-                "required": ["power"]
-            }
-        ),
-        Tool(
-            name="nina_set_flatpanel_cover",
-            description="Control flat panel cover",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "open": {"type": "boolean", "description": "Open cover (true) or close (false)"}
-                },
-                "required": ["open"]
-            }
-        ),
-        Tool(
-            name="nina_set_flatpanel_brightness",
-            description="Set flat panel brightness",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "brightness": {"type": "integer", "description": "Brightness value (0-100)"}
-                },
-                "required": ["brightness"]
-            }
-        ),
-        
-        # Switch
-        Tool(
-            name="nina_connect_switch",
-            description="Connect to switch device",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "device_id": {"type": "string", "description": "Device ID to connect to"}
-                },
-                "required": ["device_id"]
-            }
-        ),
-        Tool(
-            name="nina_disconnect_switch",
-            description="Disconnect switch device",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_list_switches",
-            description="List all available switches",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_get_switch_channels",
-            description="Get available switch channels",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_set_switch",
-            description="Set switch channel value",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "index": {"type": "integer", "description": "Channel index"},
-                    "value": {"type": "number", "description": "Value to set"}
-                },
-                "required": ["index", "value"]
-            }
-        ),
-        
-        # Weather
-        Tool(
-            name="nina_connect_weather",
-            description="Connect to weather station",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "device_id": {"type": "string", "description": "Device ID to connect to"}
-                },
-                "required": ["device_id"]
-            }
-        ),
-        Tool(
-            name="nina_disconnect_weather",
-            description="Disconnect weather station",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_get_weather_info",
-            description="Get current weather data",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_list_weather_sources",
-            description="List all available weather sources",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        
-        # Safety Monitor
-        Tool(
-            name="nina_connect_safetymonitor",
-            description="Connect to safety monitor",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "device_id": {"type": "string", "description": "Device ID to connect to"}
-                },
-                "required": ["device_id"]
-            }
-        ),
-        Tool(
-            name="nina_disconnect_safetymonitor",
-            description="Disconnect safety monitor",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_get_safetymonitor_info",
-            description="Get safety monitor status",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_list_safetymonitors",
-            description="List all available safety monitors",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        
-        # Guider
-        Tool(
-            name="nina_connect_guider",
-            description="Connect to guider",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "device_id": {"type": "string", "description": "Device ID to connect to"}
-                },
-                "required": ["device_id"]
-            }
-        ),
-        Tool(
-            name="nina_disconnect_guider",
-            description="Disconnect guider",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_get_guider_info",
-            description="Get guider status",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_list_guiders",
-            description="List all available guiders",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_start_guiding",
-            description="Start guiding",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_stop_guiding",
-            description="Stop guiding",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_dither",
-            description="Dither the guider",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "pixels": {"type": "number", "description": "Dither amount in pixels"}
-                },
-                "required": ["pixels"]
-            }
-        ),
-        
-        # Dome
-        Tool(
-            name="nina_connect_dome",
-            description="Connect to dome",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "device_id": {"type": "string", "description": "Device ID to connect to"}
-                },
-                "required": ["device_id"]
-            }
-        ),
-        Tool(
-            name="nina_disconnect_dome",
-            description="Disconnect dome",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_get_dome_info",
-            description="Get dome status",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_list_domes",
-            description="List all available domes",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_open_dome_shutter",
-            description="Open dome shutter",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_close_dome_shutter",
-            description="Close dome shutter",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_slew_dome",
-            description="Slew dome to azimuth",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "azimuth": {"type": "number", "description": "Azimuth in degrees (0-360)"}
-                },
-                "required": ["azimuth"]
-            }
-        ),
-        
-        # Sequences
-        Tool(
-            name="nina_sequence_start",
-            description="Start the current sequence",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "skipValidation": {"type": "boolean", "description": "Skip validation", "default": False}
-                },
-                "required": []
-            }
-        ),
-        Tool(
-            name="nina_sequence_stop",
-            description="Stop the running sequence",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_sequence_load",
-            description="Load a sequence from file",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "filepath": {"type": "string", "description": "Path to sequence file"}
-                },
-                "required": ["filepath"]
-            }
-        ),
-        Tool(
-            name="nina_sequence_json",
-            description="Get sequence as JSON",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        
-        # Plate Solving
-        Tool(
-            name="nina_platesolve_capsolve",
-            description="Capture image and solve plate",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "blind": {"type": "boolean", "description": "Use blind solve", "default": False}
-                },
-                "required": []
+        )
+
+    @cached_property
+    def path(self) -> str:
+        """Endpoint path without the query string"""
+        return (self.endpoint or "").partition("?")[0]
+
+    @cached_property
+    def device(self) -> str:
+        """Device class the tool acts on, e.g. "camera" for equipment/camera/..."""
+        parts = self.path.split("/")
+        if parts[0] == "equipment" and len(parts) > 1:
+            return parts[1]
+        return parts[0]
+
+    @cached_property
+    def is_read(self) -> bool:
+        """Whether the tool only reads state from NINA"""
+        return self.endpoint is not None and self.path.rsplit("/", 1)[-1] in _READ_ACTIONS
+
+    @cached_property
+    def timeout_class(self) -> str:
+        """Which TIMEOUTS entry applies to the tool's API call"""
+        if self.long_running:
+            return "job"
+        return "read" if self.is_read else "command"
+
+    @cached_property
+    def is_paged(self) -> bool:
+        """Whether large results of the tool are split into pages"""
+        return self.is_read and self.path.rsplit("/", 1)[-1] in _PAGED_ACTIONS
+
+    def argument_default(self, arg_name: str) -> Any:
+        """Value used for an argument the caller left out"""
+        schema = self.properties.get(arg_name, {})
+        return self.defaults.get(arg_name, schema.get("default", _TYPE_DEFAULTS.get(schema.get("type"))))
+
+    def compile_binder(self) -> Callable[[dict], str]:
+        """Compile the endpoint template into a function mapping arguments to an endpoint"""
+        if self.bind is not None:
+            return self.bind
+
+        template = []
+        bindings = []
+        for literal, arg_name, _, _ in Formatter().parse(self.endpoint):
+            template.append(literal.replace("{", "{{").replace("}", "}}"))
+            if arg_name is None:
+                continue
+            template.append("{}")
+            is_bool = self.properties.get(arg_name, {}).get("type") == "boolean"
+            bindings.append((arg_name, self.argument_default(arg_name), is_bool))
+
+        if not bindings:
+            endpoint = self.endpoint
+            return lambda args: endpoint
+
+        template = "".join(template)
+        bindings = tuple(bindings)
+
+        def binder(args: dict) -> str:
+            values = []
+            for arg_name, default, is_bool in bindings:
+                value = args.get(arg_name, default)
+                values.append(str(value).lower() if is_bool else value)
+            return template.format(*values)
+
+        return binder
+
+
+def _bind_autofocus(args: dict) -> str:
+    """Autofocus only passes a method when one was given"""
+    method = args.get('method', '')
+    if method:
+        return f"equipment/focuser/autofocus?method={method}"
+    return "equipment/focuser/autofocus"
+
+
+# Shared argument schemas
+_CURSOR = {
+    "type": "string",
+    "description": "Continuation cursor (next_cursor) from a previous paged result of this tool"
+}
+_FIELDS = {
+    "type": "array",
+    "items": {"type": "string"},
+    "description": "Only return these fields of the response, e.g. [\"Temperature\", \"CoolerPower\"]"
+}
+_DEVICE_ID = {"device_id": {"type": "string", "description": "Device ID to connect to"}}
+
+
+# Declarative tool registry (order is the order reported to clients)
+TOOL_SPECS: tuple[ToolSpec, ...] = (
+    # System
+    ToolSpec("nina_get_version", "version", "Get NINA application version", timeout=1.0),
+
+    # Camera
+    ToolSpec(
+        "nina_connect_camera",
+        "equipment/camera/connect?to={device_id}",
+        "Connect to a camera device",
+        _DEVICE_ID,
+        ("device_id",)
+    ),
+    ToolSpec("nina_disconnect_camera", "equipment/camera/disconnect", "Disconnect the camera"),
+    ToolSpec("nina_get_camera_info", "equipment/camera/info", "Get camera information and status"),
+    ToolSpec("nina_list_cameras", "equipment/camera/list", "List all available cameras"),
+    ToolSpec(
+        "nina_capture_image",
+        "equipment/camera/capture?exposuretime={exposure_time}&binning={binning}&gain={gain}&waitForResult=true",
+        "Capture an image with the camera",
+        {
+            "exposure_time": {"type": "number", "description": "Exposure time in seconds"},
+            "binning": {"type": "integer", "description": "Binning factor (1, 2, 3, 4)", "default": 1},
+            "gain": {"type": "integer", "description": "Gain value", "default": 0}
+        },
+        ("exposure_time",),
+        defaults={"exposure_time": 1},
+        long_running=True,
+        cancel_endpoint="equipment/camera/abort-exposure",
+        timeout=CAPTURE_DOWNLOAD_MARGIN,
+        timeout_arg="exposure_time",
+        done_events=("API-CAPTURE-FINISHED",)
+    ),
+    ToolSpec(
+        "nina_start_cooling",
+        "equipment/camera/cooling?temperature={temperature}&duration={duration}",
+        "Start camera cooling to target temperature",
+        {
+            "temperature": {"type": "number", "description": "Target temperature in Celsius"},
+            "duration": {"type": "integer", "description": "Duration in minutes", "default": 0}
+        },
+        ("temperature",),
+        defaults={"temperature": -10}
+    ),
+    ToolSpec("nina_stop_cooling", "equipment/camera/warmup", "Stop camera cooling"),
+    ToolSpec(
+        "nina_set_binning",
+        "equipment/camera/binning?x={binning}&y={binning}",
+        "Set camera binning",
+        {"binning": {"type": "integer", "description": "Binning factor (1, 2, 3, 4)"}},
+        ("binning",),
+        defaults={"binning": 1}
+    ),
+    ToolSpec(
+        "nina_control_dew_heater",
+        "equipment/camera/dew-heater?on={on}",
+        "Control camera dew heater",
+        {"on": {"type": "boolean", "description": "Turn heater on (true) or off (false)"}},
+        ("on",)
+    ),
+    ToolSpec(
+        "nina_set_gain",
+        "equipment/camera/gain?gain={gain}",
+        "Set camera gain",
+        {"gain": {"type": "integer", "description": "Gain value"}},
+        ("gain",)
+    ),
+    ToolSpec(
+        "nina_set_offset",
+        "equipment/camera/offset?offset={offset}",
+        "Set camera offset",
+        {"offset": {"type": "integer", "description": "Offset value"}},
+        ("offset",)
+    ),
+    ToolSpec(
+        "nina_start_warming",
+        "equipment/camera/warmup?duration={duration}",
+        "Start warming camera to ambient temperature",
+        {"duration": {"type": "integer", "description": "Warming duration in minutes"}},
+        ("duration",),
+        defaults={"duration": 10}
+    ),
+
+    # Mount (Telescope)
+    ToolSpec(
+        "nina_connect_telescope",
+        "equipment/telescope/connect?to={device_id}",
+        "Connect to telescope mount",
+        _DEVICE_ID,
+        ("device_id",)
+    ),
+    ToolSpec("nina_disconnect_telescope", "equipment/telescope/disconnect", "Disconnect telescope mount"),
+    ToolSpec(
+        "nina_get_telescope_info",
+        "equipment/telescope/info",
+        "Get telescope mount information and coordinates"
+    ),
+    ToolSpec("nina_list_telescopes", "equipment/telescope/list", "List all available telescope mounts"),
+    ToolSpec(
+        "nina_slew_telescope",
+        "equipment/telescope/slew?rightascension={ra}&declination={dec}",
+        "Slew telescope to coordinates",
+        {
+            "ra": {"type": "number", "description": "Right Ascension in hours (0-24)"},
+            "dec": {"type": "number", "description": "Declination in degrees (-90 to +90)"}
+        },
+        ("ra", "dec")
+    ),
+    ToolSpec("nina_park_telescope", "equipment/telescope/park", "Park the telescope mount"),
+    ToolSpec("nina_unpark_telescope", "equipment/telescope/unpark", "Unpark the telescope mount"),
+    ToolSpec("nina_stop_telescope", "equipment/telescope/abort-slew", "Stop telescope movement immediately"),
+
+    # Focuser
+    ToolSpec(
+        "nina_connect_focuser",
+        "equipment/focuser/connect?to={device_id}",
+        "Connect to focuser",
+        _DEVICE_ID,
+        ("device_id",)
+    ),
+    ToolSpec("nina_disconnect_focuser", "equipment/focuser/disconnect", "Disconnect focuser"),
+    ToolSpec("nina_get_focuser_info", "equipment/focuser/info", "Get focuser position and status"),
+    ToolSpec("nina_list_focusers", "equipment/focuser/list", "List all available focusers"),
+    ToolSpec(
+        "nina_move_focuser",
+        "equipment/focuser/move?position={position}",
+        "Move focuser to absolute position",
+        {"position": {"type": "integer", "description": "Target position"}},
+        ("position",)
+    ),
+    ToolSpec(
+        "nina_start_autofocus",
+        "equipment/focuser/autofocus",
+        "Start autofocus routine",
+        {"method": {"type": "string", "description": "Autofocus method", "default": ""}},
+        bind=_bind_autofocus,
+        long_running=True,
+        cancel_endpoint="equipment/focuser/autofocus-cancel",
+        timeout=900.0,
+        done_events=("AUTOFOCUS-FINISHED", "ERROR-AF")
+    ),
+    ToolSpec("nina_cancel_autofocus", "equipment/focuser/autofocus-cancel", "Cancel running autofocus"),
+    ToolSpec(
+        "nina_get_autofocus_status",
+        "equipment/focuser/autofocus-status",
+        "Get autofocus routine status"
+    ),
+    ToolSpec("nina_halt_focuser", "equipment/focuser/halt", "Halt focuser movement immediately"),
+
+    # Filter Wheel
+    ToolSpec(
+        "nina_connect_filterwheel",
+        "equipment/filterwheel/connect?to={device_id}",
+        "Connect to filter wheel",
+        _DEVICE_ID,
+        ("device_id",)
+    ),
+    ToolSpec("nina_disconnect_filterwheel", "equipment/filterwheel/disconnect", "Disconnect filter wheel"),
+    ToolSpec(
+        "nina_get_filterwheel_info",
+        "equipment/filterwheel/info",
+        "Get filter wheel information and current filter"
+    ),
+    ToolSpec("nina_list_filterwheels", "equipment/filterwheel/list", "List all available filter wheels"),
+    ToolSpec(
+        "nina_change_filter",
+        "equipment/filterwheel/set-filter?filter={filter}",
+        "Change to specified filter",
+        {"filter": {"type": "string", "description": "Filter name"}},
+        ("filter",)
+    ),
+
+    # Rotator
+    ToolSpec(
+        "nina_connect_rotator",
+        "equipment/rotator/connect?to={device_id}",
+        "Connect to rotator",
+        _DEVICE_ID,
+        ("device_id",)
+    ),
+    ToolSpec("nina_disconnect_rotator", "equipment/rotator/disconnect", "Disconnect rotator"),
+    ToolSpec("nina_list_rotators", "equipment/rotator/list", "List all available rotators"),
+    ToolSpec("nina_get_rotator_info", "equipment/rotator/info", "Get rotator angle and status"),
+    ToolSpec(
+        "nina_move_rotator",
+        "equipment/rotator/move?position={position}&relative={relative}",
+        "Move rotator to angle",
+        {
+            "position": {"type": "number", "description": "Target angle in degrees"},
+            "relative": {"type": "boolean", "description": "Relative movement", "default": False}
+        },
+        ("position",)
+    ),
+    ToolSpec("nina_halt_rotator", "equipment/rotator/halt", "Halt rotator movement"),
+    ToolSpec(
+        "nina_sync_rotator",
+        "equipment/rotator/sync?mechanicalposition={position}",
+        "Sync rotator to mechanical position",
+        {"position": {"type": "number", "description": "Mechanical position"}},
+        ("position",)
+    ),
+    ToolSpec(
+        "nina_set_rotator_reverse",
+        "equipment/rotator/reverse?reverse={reverse}",
+        "Set rotator reverse direction",
+        {"reverse": {"type": "boolean", "description": "Reverse direction"}},
+        ("reverse",)
+    ),
+
+    # Flat Panel
+    ToolSpec(
+        "nina_connect_flatpanel",
+        "equipment/flatdevice/connect?to={device_id}",
+        "Connect to flat panel",
+        _DEVICE_ID,
+        ("device_id",)
+    ),
+    ToolSpec("nina_disconnect_flatpanel", "equipment/flatdevice/disconnect", "Disconnect flat panel"),
+    ToolSpec("nina_list_flatpanels", "equipment/flatdevice/list", "List all available flat panels"),
+    ToolSpec("nina_get_flatpanel_info", "equipment/flatdevice/info", "Get flat panel status"),
+    ToolSpec(
+        "nina_set_flatpanel_light",
+        "equipment/flatdevice/set-light?power={power}",
+        "Control flat panel light",
+        {"power": {"type": "boolean", "description": "Turn light on (true) or off (false)"}},
+        ("power",)
+    ),
+    ToolSpec(
+        "nina_set_flatpanel_cover",
+        "equipment/flatdevice/set-cover?open={open}",
+        "Control flat panel cover",
+        {"open": {"type": "boolean", "description": "Open cover (true) or close (false)"}},
+        ("open",)
+    ),
+    ToolSpec(
+        "nina_set_flatpanel_brightness",
+        "equipment/flatdevice/set-brightness?brightness={brightness}",
+        "Set flat panel brightness",
+        {"brightness": {"type": "integer", "description": "Brightness value (0-100)"}},
+        ("brightness",),
+        defaults={"brightness": 50}
+    ),
+
+    # Switch
+    ToolSpec(
+        "nina_connect_switch",
+        "equipment/switch/connect?to={device_id}",
+        "Connect to switch device",
+        _DEVICE_ID,
+        ("device_id",)
+    ),
+    ToolSpec("nina_disconnect_switch", "equipment/switch/disconnect", "Disconnect switch device"),
+    ToolSpec("nina_list_switches", "equipment/switch/list", "List all available switches"),
+    ToolSpec("nina_get_switch_channels", "equipment/switch/channels", "Get available switch channels"),
+    ToolSpec(
+        "nina_set_switch",
+        "equipment/switch/set?index={index}&value={value}",
+        "Set switch channel value",
+        {
+            "index": {"type": "integer", "description": "Channel index"},
+            "value": {"type": "number", "description": "Value to set"}
+        },
+        ("index", "value")
+    ),
+
+    # Weather
+    ToolSpec(
+        "nina_connect_weather",
+        "equipment/weather/connect?to={device_id}",
+        "Connect to weather station",
+        _DEVICE_ID,
+        ("device_id",)
+    ),
+    ToolSpec("nina_disconnect_weather", "equipment/weather/disconnect", "Disconnect weather station"),
+    ToolSpec("nina_get_weather_info", "equipment/weather/info", "Get current weather data"),
+    ToolSpec("nina_list_weather_sources", "equipment/weather/list", "List all available weather sources"),
+
+    # Safety Monitor
+    ToolSpec(
+        "nina_connect_safetymonitor",
+        "equipment/safetymonitor/connect?to={device_id}",
+        "Connect to safety monitor",
+        _DEVICE_ID,
+        ("device_id",)
+    ),
+    ToolSpec(
+        "nina_disconnect_safetymonitor",
+        "equipment/safetymonitor/disconnect",
+        "Disconnect safety monitor"
+    ),
+    ToolSpec("nina_get_safetymonitor_info", "equipment/safetymonitor/info", "Get safety monitor status"),
+    ToolSpec(
+        "nina_list_safetymonitors",
+        "equipment/safetymonitor/list",
+        "List all available safety monitors"
+    ),
+
+    # Guider
+    ToolSpec(
+        "nina_connect_guider",
+        "equipment/guider/connect?to={device_id}",
+        "Connect to guider",
+        _DEVICE_ID,
+        ("device_id",)
+    ),
+    ToolSpec("nina_disconnect_guider", "equipment/guider/disconnect", "Disconnect guider"),
+    ToolSpec("nina_get_guider_info", "equipment/guider/info", "Get guider status"),
+    ToolSpec("nina_list_guiders", "equipment/guider/list", "List all available guiders"),
+    ToolSpec("nina_start_guiding", "equipment/guider/start-guiding", "Start guiding"),
+    ToolSpec("nina_stop_guiding", "equipment/guider/stop-guiding", "Stop guiding"),
+    ToolSpec(
+        "nina_dither",
+        "equipment/guider/dither?pixels={pixels}",
+        "Dither the guider",
+        {"pixels": {"type": "number", "description": "Dither amount in pixels"}},
+        ("pixels",),
+        defaults={"pixels": 5}
+    ),
+
+    # Dome
+    ToolSpec(
+        "nina_connect_dome",
+        "equipment/dome/connect?to={device_id}",
+        "Connect to dome",
+        _DEVICE_ID,
+        ("device_id",)
+    ),
+    ToolSpec("nina_disconnect_dome", "equipment/dome/disconnect", "Disconnect dome"),
+    ToolSpec("nina_get_dome_info", "equipment/dome/info", "Get dome status"),
+    ToolSpec("nina_list_domes", "equipment/dome/list", "List all available domes"),
+    ToolSpec("nina_open_dome_shutter", "equipment/dome/open-shutter", "Open dome shutter"),
+    ToolSpec("nina_close_dome_shutter", "equipment/dome/close-shutter", "Close dome shutter"),
+    ToolSpec(
+        "nina_slew_dome",
+        "equipment/dome/slew?azimuth={azimuth}",
+        "Slew dome to azimuth",
+        {"azimuth": {"type": "number", "description": "Azimuth in degrees (0-360)"}},
+        ("azimuth",)
+    ),
+
+    # Sequences
+    ToolSpec(
+        "nina_sequence_start",
+        "sequence/start?skipValidation={skipValidation}",
+        "Start the current sequence",
+        {"skipValidation": {"type": "boolean", "description": "Skip validation", "default": False}}
+    ),
+    ToolSpec("nina_sequence_stop", "sequence/stop", "Stop the running sequence"),
+    ToolSpec(
+        "nina_sequence_load",
+        "sequence/load?filepath={filepath}",
+        "Load a sequence from file",
+        {"filepath": {"type": "string", "description": "Path to sequence file"}},
+        ("filepath",)
+    ),
+    ToolSpec("nina_sequence_json", "sequence/json", "Get sequence as JSON"),
+
+    # Plate Solving
+    ToolSpec(
+        "nina_platesolve_capsolve",
+        "plate-solve/capsolve?blind={blind}",
+        "Capture image and solve plate",
+        {"blind": {"type": "boolean", "description": "Use blind solve", "default": False}},
+        timeout=300.0
+    ),
+    ToolSpec(
+        "nina_platesolve_sync",
+        "plate-solve/sync?blind={blind}",
+        "Plate solve and sync mount",
+        {"blind": {"type": "boolean", "description": "Use blind solve", "default": False}},
+        timeout=300.0
+    ),
+    ToolSpec(
+        "nina_platesolve_center",
+        "plate-solve/center?rightascension={ra}&declination={dec}",
+        "Center on coordinates using plate solving",
+        {
+            "ra": {"type": "number", "description": "Right Ascension in hours"},
+            "dec": {"type": "number", "description": "Declination in degrees"}
+        },
+        ("ra", "dec"),
+        long_running=True,
+        timeout=600.0
+    ),
+
+    # Framing Assistant
+    ToolSpec("nina_framing_get_info", "framing/info", "Get framing assistant information"),
+    ToolSpec(
+        "nina_framing_set_source",
+        "framing/set-source?source={source}",
+        "Set framing target source",
+        {"source": {"type": "string", "description": "Target name or coordinates"}},
+        ("source",)
+    ),
+    ToolSpec("nina_framing_slew", "framing/slew", "Slew to framing target"),
+
+    # Utility
+    ToolSpec("nina_time_now", "time/now", "Get current system time"),
+    ToolSpec(
+        "nina_wait",
+        "time/wait?seconds={seconds}",
+        "Wait for specified duration",
+        {"seconds": {"type": "integer", "description": "Seconds to wait"}},
+        ("seconds",),
+        defaults={"seconds": 1},
+        long_running=True,
+        timeout=WAIT_SLACK,
+        timeout_arg="seconds"
+    ),
+)
+
+
+class TimeoutPolicy:
+    """Computes the deadline of a tool call from the tool and its arguments"""
+
+    def __init__(self, overrides: dict[str, float]):
+        self.overrides = overrides
+
+    def deadline(self, spec: ToolSpec, args: dict) -> Optional[float]:
+        """Seconds the whole call (including retries) may take, or None for no limit
+
+        An override replaces the whole deadline, also for tools whose deadline
+        otherwise follows a duration argument.
+        """
+        if spec.name in self.overrides:
+            return self.overrides[spec.name] or None
+        timeout = spec.timeout
+
+        if spec.timeout_arg is not None:
+            try:
+                duration = float(args.get(spec.timeout_arg, spec.argument_default(spec.timeout_arg)))
+            except (TypeError, ValueError):
+                duration = 0.0
+            return max(0.0, duration) + (timeout or 0.0)
+
+        if timeout is None:
+            timeout = TIMEOUT_SETTINGS[spec.timeout_class]
+        return timeout or None
+
+
+timeout_policy = TimeoutPolicy(TOOL_TIMEOUT_OVERRIDES)
+
+
+async def with_deadline(awaitable: Awaitable[Any], deadline: Optional[float], spec: ToolSpec) -> Any:
+    """Await a tool call, cancelling it once its deadline passes"""
+    if deadline is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, deadline)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"{spec.name} did not finish within {deadline:g} s") from None
+
+
+def coalesced_read(spec: ToolSpec, endpoint: str, timeout: Any,
+                   retries: int = READ_RETRIES) -> Callable[[], Awaitable[Any]]:
+    """Fetch function for a read that shares one request with identical concurrent reads
+
+    The key includes the device's cache generation so a caller arriving after
+    a command on that device never joins a read that started before it.
+    """
+    key = f"{BASE_URL}/{endpoint}#{response_cache.generation(spec.device)}"
+    return partial(single_flight.run, key, partial(call_nina_api, endpoint, timeout, retries=retries))
+
+
+async def execute_api_tool(spec: ToolSpec, endpoint: str, arguments: Optional[dict] = None) -> Any:
+    """Call the API for a tool, serving *_info/*_list reads from the cache and invalidating it after writes"""
+    timeout = TIMEOUTS[spec.timeout_class]
+    deadline = timeout_policy.deadline(spec, arguments or {})
+
+    if spec.is_read:
+        kind = spec.path.rsplit("/", 1)[-1]
+        ttl = response_cache.ttl_for(spec.device, kind) if kind in ("info", "list") else 0.0
+        fetch = coalesced_read(spec, endpoint, timeout)
+        if ttl > 0:
+            result = await with_deadline(response_cache.get(endpoint, spec.device, ttl, fetch), deadline, spec)
+        else:
+            result = await with_deadline(fetch(), deadline, spec)
+        if kind == "info":
+            session_store.record_info(spec.device, result)
+        return result
+
+    try:
+        return await with_deadline(call_nina_api(endpoint, timeout), deadline, spec)
+    finally:
+        invalidate_after(spec)
+
+
+def invalidate_after(spec: ToolSpec):
+    """Drop cached responses made stale by a mutating tool and have the poller refresh them"""
+    if spec.device == "sequence":
+        response_cache.clear()
+        poller.wake(*OBSERVATORY_DEVICES)
+    else:
+        devices = (spec.device, *_SIDE_EFFECTS.get(spec.device, ()))
+        response_cache.invalidate(*devices)
+        poller.wake(*devices)
+
+
+# Concurrent API requests issued by one nina_batch call: default and largest accepted max_concurrency
+BATCH_CONCURRENCY = 8
+BATCH_MAX_CONCURRENCY = 64
+
+
+# Long-running tool calls run as background jobs so other calls keep being served
+MAX_FINISHED_JOBS = 100
+FINISHED_JOB_RETENTION = 3600.0  # seconds
+
+
+@dataclass
+class Job:
+    """A long-running tool call executing in the background
+
+    The job calls `endpoint`, or awaits `run()` for server-side work such as macros.
+    """
+    id: str
+    spec: ToolSpec
+    endpoint: Optional[str]
+    state: str = "running"
+    deadline: Optional[float] = None
+    created: float = field(default_factory=time.monotonic)
+    finished: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+    task: Optional[asyncio.Task] = None
+    run: Optional[Callable[[], Awaitable[Any]]] = None
+    arguments: dict = field(default_factory=dict)
+
+    def status(self) -> dict:
+        """Summary of the job without its result"""
+        end = self.finished if self.finished is not None else time.monotonic()
+        status = {
+            "job_id": self.id,
+            "tool": self.spec.name,
+            "state": self.state,
+            "elapsed_seconds": round(end - self.created, 1),
+        }
+        if self.deadline is not None:
+            status["deadline_seconds"] = round(self.deadline, 1)
+        if self.error is not None:
+            status["error"] = self.error
+        return status
+
+
+class JobTable:
+    """In-memory table of background jobs with bounded retention of finished jobs"""
+
+    def __init__(self, max_finished: int = MAX_FINISHED_JOBS, retention: float = FINISHED_JOB_RETENTION):
+        self.max_finished = max_finished
+        self.retention = retention
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._ids = itertools.count(1)
+
+    def start(self, spec: ToolSpec, endpoint: Optional[str], deadline: Optional[float] = None,
+              run: Optional[Callable[[], Awaitable[Any]]] = None, arguments: Optional[dict] = None) -> Job:
+        """Start calling the endpoint (or awaiting `run()`) in the background and return the job
+
+        Completion events don't say which request they belong to, so only one
+        job at a time may wait for a given event (e.g. one capture).
+        """
+        self._prune()
+        if spec.done_events:
+            running = next((job for job in self._jobs.values() if job.state == "running"
+                            and set(job.spec.done_events) & set(spec.done_events)), None)
+            if running is not None:
+                raise ValueError(f"{running.id} ({running.spec.name}) is still running; wait for it to finish "
+                                 f"or cancel it with nina_job_cancel before starting {spec.name}")
+
+        job = Job(id=f"job-{next(self._ids)}", spec=spec, endpoint=endpoint, deadline=deadline, run=run,
+                  arguments=arguments or {})
+        invalidate_after(spec)
+        job.task = asyncio.create_task(self._run(job))
+        job.task.add_done_callback(lambda task: self._finish(job, task))
+        self._jobs[job.id] = job
+
+        logger.info(f"Started {job.id} for {spec.name}")
+        return job
+
+    def get(self, job_id: str) -> Job:
+        """Look up a job by id"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise ValueError(f"Unknown job {job_id}")
+        return job
+
+    def busy(self, device: str) -> bool:
+        """Whether a running job is operating the given device class"""
+        return any(
+            job.state == "running" and device in (job.spec.device, *_SIDE_EFFECTS.get(job.spec.device, ()))
+            for job in self._jobs.values()
+        )
+
+    def list(self) -> list[Job]:
+        """All retained jobs, oldest first"""
+        self._prune()
+        return list(self._jobs.values())
+
+    async def cancel(self, job_id: str) -> Job:
+        """Cancel a running job and ask NINA to abort the operation where possible"""
+        job = self.get(job_id)
+        if job.state != "running":
+            return job
+
+        job.task.cancel()
+        await asyncio.gather(job.task, return_exceptions=True)
+        await self._abort(job)
+
+        return job
+
+    async def _run(self, job: Job) -> Any:
+        try:
+            return await with_deadline(self._call(job), job.deadline, job.spec)
+        except TimeoutError:
+            await self._abort(job)
+            raise
+
+    async def _call(self, job: Job) -> Any:
+        """Call the job's endpoint, then wait for NINA's completion event when the event stream is up"""
+        if job.run is not None:
+            return await job.run()
+
+        finished = event_stream.expect(job.spec.done_events)
+        try:
+            result = await call_nina_api(job.endpoint, timeout=TIMEOUTS["job"])
+            if finished is None or (isinstance(result, dict) and result.get("Success") is False):
+                return result
+            event = await finished
+        finally:
+            if finished is not None:
+                finished.cancel()
+
+        if event is None:
+            return result  # the stream dropped; fall back to the API response alone
+        if event["event"] in _ERROR_EVENTS:
+            raise ValueError(f"NINA reported {event['event']}: {to_json(event.get('data', {}))}")
+        return {**result, "Event": event} if isinstance(result, dict) else result
+
+    async def _abort(self, job: Job):
+        """Ask NINA to stop the operation behind a job, where the tool supports it"""
+        if not job.spec.cancel_endpoint:
+            return
+        try:
+            await call_nina_api(job.spec.cancel_endpoint)
+        except Exception as e:
+            logger.warning(f"Abort request for {job.id} failed: {error_text(e)}")
+
+    def _finish(self, job: Job, task: asyncio.Task):
+        job.finished = time.monotonic()
+        invalidate_after(job.spec)
+
+        if task.cancelled():
+            job.state = "cancelled"
+        elif isinstance(task.exception(), TimeoutError):
+            job.state = "timed_out"
+            job.error = error_text(task.exception())
+        elif task.exception() is not None:
+            logger.error(f"{job.id} failed: {error_text(task.exception())}")
+            job.state = "failed"
+            job.error = error_text(task.exception())
+        else:
+            job.state = "succeeded"
+            job.result = task.result()
+        if job.state != "cancelled":
+            session_store.record_result(job.spec, job.arguments, job.result, job.error)
+
+    def _prune(self):
+        now = time.monotonic()
+        finished = [job for job in self._jobs.values() if job.finished is not None]
+
+        expired = [job for job in finished if now - job.finished > self.retention]
+        excess = len(finished) - len(expired) - self.max_finished
+        if excess > 0:
+            expired += [job for job in finished if job not in expired][:excess]
+
+        for job in expired:
+            del self._jobs[job.id]
+
+
+jobs = JobTable()
+
+
+# Info field values marking a device as busy, so it is polled at the active rate
+_BUSY_FIELDS = {
+    "camera": (("IsExposing", (True,)),),
+    "telescope": (("Slewing", (True,)),),
+    "focuser": (("IsMoving", (True,)),),
+    "rotator": (("IsMoving", (True,)),),
+    "filterwheel": (("IsMoving", (True,)),),
+    "dome": (("Slewing", (True,)),),
+    "guider": (("State", ("Calibrating", "Settling", "Dithering")),),
+}
+
+# Info fields whose changes are announced to resource subscribers (numbers compared to one decimal)
+_WATCHED_FIELDS = {
+    "camera": ("Connected", "IsExposing", "CameraState", "CoolerOn", "Temperature"),
+    "telescope": ("Connected", "Slewing", "AtPark", "Tracking", "RightAscension", "Declination"),
+    "focuser": ("Connected", "IsMoving", "Position"),
+    "filterwheel": ("Connected", "IsMoving", "SelectedFilter"),
+    "rotator": ("Connected", "IsMoving", "Position"),
+    "flatdevice": ("Connected", "LightOn", "CoverState", "Brightness"),
+    "safetymonitor": ("Connected", "IsSafe"),
+    "guider": ("Connected", "State"),
+    "dome": ("Connected", "Slewing", "ShutterStatus", "AtPark"),
+}
+
+
+def _rounded(value: Any) -> Any:
+    if isinstance(value, float):
+        return round(value, 1)
+    return value
+
+
+class EquipmentPoller:
+    """Background refresh of every equipment info endpoint (opt-in via NINA_MCP_POLL)
+
+    Each device is polled at a rate that follows its state: active while it
+    is busy, running a job or was just commanded, idle when connected and
+    slow when disconnected. Responses are stored in the response cache for
+    a little longer than the poll interval, so *_info tools and the
+    observatory status answer from memory, and sessions subscribed to
+    nina://equipment/<device> are notified when a watched field changes.
+    """
+
+    def __init__(self, intervals: dict[str, float]):
+        self.intervals = intervals
+        self.polls = 0
+        self.failures = 0
+        self.changes = 0
+        self.snapshots: dict[str, dict] = {}
+        self._watched: dict[str, dict] = {}
+        self._active_until: dict[str, float] = {}
+        self._wake: dict[str, asyncio.Event] = {}
+        self._subscribers: dict[str, set] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """Start one polling loop per device class"""
+        if self._tasks:
+            return
+        for spec in OBSERVATORY_INFO_SPECS:
+            self._wake[spec.device] = asyncio.Event()
+            self._tasks.append(asyncio.create_task(self._run(spec)))
+        logger.info(f"Polling {len(self._tasks)} devices every {self.intervals['active']:g}-"
+                    f"{self.intervals['disconnected']:g} s")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._wake.clear()
+
+    def wake(self, *devices: str):
+        """Poll these devices now and at the active rate for a while (after a command)"""
+        until = time.monotonic() + POLL_ACTIVE_AFTER_COMMAND
+        for device in devices:
+            if device in self._wake:
+                self._active_until[device] = until
+                self._wake[device].set()
+
+    def interval_for(self, device: str, info: Any) -> float:
+        """Seconds until the next poll of a device with the given info"""
+        if not isinstance(info, dict) or not info.get("Connected"):
+            return self.intervals["disconnected"]
+        busy = any(info.get(name) in values for name, values in _BUSY_FIELDS.get(device, ()))
+        if busy or jobs.busy(device) or time.monotonic() < self._active_until.get(device, 0.0):
+            return self.intervals["active"]
+        return self.intervals["idle"]
+
+    async def _run(self, spec: ToolSpec):
+        device = spec.device
+        wake = self._wake[device]
+        while True:
+            wake.clear()
+            try:
+                interval = await self.poll(spec)
+            except Exception as e:
+                self.failures += 1
+                logger.debug(f"Polling {device} failed: {error_text(e)}")
+                interval = self.intervals["disconnected"]
+            try:
+                await asyncio.wait_for(wake.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def poll(self, spec: ToolSpec) -> float:
+        """Refresh one device's info and return the seconds until its next poll"""
+        generation = response_cache.generation(spec.device)
+        # No retries: a failed poll is simply repeated at the disconnected rate
+        result = await coalesced_read(spec, spec.endpoint, TIMEOUTS["read"], retries=0)()
+        self.polls += 1
+
+        session_store.record_info(spec.device, result)
+        info = unwrap_response(result)
+        interval = self.interval_for(spec.device, info)
+        if response_cache.ttl_for(spec.device, "info") > 0:
+            # Outlive the interval so reads between polls never go to NINA
+            response_cache.put(spec.endpoint, spec.device, interval + 1.0, result, generation)
+
+        self.snapshots[spec.device] = {"updated": time.time(), "interval": interval, "info": compact(info)}
+        fields = _WATCHED_FIELDS.get(spec.device, ("Connected",))
+        watched = {name: _rounded(info.get(name)) for name in fields} if isinstance(info, dict) else {}
+        previous = self._watched.get(spec.device)
+        self._watched[spec.device] = watched
+        if previous is not None and previous != watched:
+            self.changes += 1
+            await self.notify(equipment_uri(spec.device))
+        return interval
+
+    def subscribe(self, uri: str, session: Any):
+        self._subscribers.setdefault(uri, set()).add(session)
+
+    def unsubscribe(self, uri: str, session: Any):
+        self._subscribers.get(uri, set()).discard(session)
+
+    async def notify(self, uri: str):
+        """Send resources/updated to every session subscribed to the URI, dropping closed sessions"""
+        for session in list(self._subscribers.get(uri, ())):
+            try:
+                await session.send_resource_updated(uri)
+            except Exception as e:
+                logger.info(f"Dropping subscriber of {uri}: {error_text(e)}")
+                self.unsubscribe(uri, session)
+
+    def stats(self) -> dict:
+        """Poll counters and the current interval and age of each device's snapshot"""
+        now = time.time()
+        return {
+            "running": self.running,
+            "polls": self.polls,
+            "failures": self.failures,
+            "changes": self.changes,
+            "subscribers": sum(len(sessions) for sessions in self._subscribers.values()),
+            "devices": {
+                device: {"interval": snapshot["interval"], "age_seconds": round(now - snapshot["updated"], 1)}
+                for device, snapshot in self.snapshots.items()
+            },
+        }
+
+
+poller = EquipmentPoller(POLL_INTERVALS)
+
+
+def equipment_uri(device: str) -> str:
+    return f"nina://equipment/{device}"
+
+
+# Device class behind each event name prefix (MOUNT-PARKED -> telescope), and events named otherwise
+_EVENT_PREFIXES = {
+    "CAMERA": "camera", "MOUNT": "telescope", "FOCUSER": "focuser", "AUTOFOCUS": "focuser",
+    "FILTERWHEEL": "filterwheel", "ROTATOR": "rotator", "FLAT": "flatdevice", "SWITCH": "switch",
+    "WEATHER": "weather", "SAFETY": "safetymonitor", "GUIDER": "guider", "DOME": "dome", "SEQUENCE": "sequence",
+}
+_EVENT_DEVICES = {
+    "IMAGE-SAVE": "camera",
+    "API-CAPTURE-FINISHED": "camera",
+    "ERROR-AF": "focuser",
+    "ERROR-PLATESOLVE": "telescope",
+}
+
+# Events reporting that the operation a job waits for failed
+_ERROR_EVENTS = frozenset({"ERROR-AF", "ERROR-PLATESOLVE"})
+
+
+def event_device(name: str) -> Optional[str]:
+    """Device class an event is about, if any"""
+    return _EVENT_DEVICES.get(name) or _EVENT_PREFIXES.get(name.partition("-")[0])
+
+
+def events_url(base_url: str) -> str:
+    """NINA's WebSocket endpoint for an API base URL (http://host:1888/v2/api -> ws://host:1888/v2/socket)"""
+    url = urlsplit(base_url)
+    path = url.path.rstrip("/")
+    path = (path[:-len("/api")] if path.endswith("/api") else path) + "/socket"
+    return urlunsplit(("wss" if url.scheme == "https" else "ws", url.netloc, path, "", ""))
+
+
+class EventStream:
+    """Consumer of NINA's WebSocket event stream (opt-in via NINA_MCP_EVENTS)
+
+    Events are kept in a bounded log read by nina_get_events. Each event
+    drops the cached responses of the device it concerns and wakes the
+    poller, and jobs waiting for a completion event (see JobTable) are
+    released. The connection is re-established with backoff when it drops.
+    """
+
+    def __init__(self, size: int):
+        self.log: deque[dict] = deque(maxlen=size)
+        self.connected = False
+        self.url = ""
+        self.received = 0
+        self.reconnects = 0
+        self._ids = itertools.count(1)
+        self._waiters: list[tuple[Callable[[str], bool], asyncio.Future]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def last_id(self) -> int:
+        return self.log[-1]["id"] if self.log else 0
+
+    def start(self, url: str):
+        """Connect in the background; does nothing if the websockets package is missing"""
+        if self._task is not None:
+            return
+        try:
+            import websockets
+        except ImportError:
+            logger.error("NINA_MCP_EVENTS is set but the websockets package is not installed")
+            return
+        self.url = url
+        self._task = asyncio.create_task(self._run(websockets))
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self, websockets: Any):
+        backoff = RETRY_BACKOFF
+        while True:
+            try:
+                async with websockets.connect(self.url) as socket:
+                    self.connected = True
+                    backoff = RETRY_BACKOFF
+                    logger.info(f"Receiving NINA events from {self.url}")
+                    async for message in socket:
+                        self.handle(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                level = logging.WARNING if self.connected else logging.DEBUG
+                logger.log(level, f"NINA event stream {self.url} unavailable: {error_text(e)}")
+            finally:
+                if self.connected:
+                    self.connected = False
+                    self.reconnects += 1
+                self._release()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, EVENT_RECONNECT_MAX)
+
+    def handle(self, message: Any):
+        """Log one WebSocket message and apply the event it carries"""
+        try:
+            payload = from_json(message)
+        except ValueError:
+            return
+        response = payload.get("Response") if isinstance(payload, dict) else None
+        if not isinstance(response, dict) or "Event" not in response:
+            return
+
+        name = str(response["Event"])
+        event = {"id": next(self._ids), "time": time.time(), "event": name}
+        data = {key: value for key, value in response.items() if key != "Event"}
+        if data:
+            event["data"] = data
+        self.log.append(event)
+        self.received += 1
+
+        device = event_device(name)
+        session_store.record("event", device or "", data, name)
+        if name == "GUIDER-DITHER":
+            guider_sampler.mark_dither(event["time"])
+        if device is not None:
+            response_cache.invalidate(device)
+            poller.wake(device)
+
+        for match, future in self._waiters:
+            if not future.done() and match(name):
+                future.set_result(event)
+
+    def expect(self, names: tuple) -> Optional[asyncio.Future]:
+        """Future for the next event named in `names`, or None when the stream is down
+
+        The future resolves to None if the connection drops before the event arrives.
+        """
+        if not names:
+            return None
+        return self._expect(lambda name: name in names)
+
+    async def wait_device(self, device: str, timeout: float):
+        """Sleep up to `timeout` seconds, returning early when an event about the device class arrives"""
+        woken = self._expect(lambda name: event_device(name) == device)
+        if woken is None:
+            await asyncio.sleep(timeout)
+            return
+        try:
+            await asyncio.wait((woken,), timeout=timeout)
+        finally:
+            woken.cancel()
+
+    def _expect(self, match: Callable[[str], bool]) -> Optional[asyncio.Future]:
+        if not self.connected:
+            return None
+        waiter = (match, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        waiter[1].add_done_callback(lambda future: self._waiters.remove(waiter))
+        return waiter[1]
+
+    def _release(self):
+        for _, future in list(self._waiters):
+            if not future.done():
+                future.set_result(None)
+
+    def query(self, since: int = 0, prefix: str = "", limit: int = 50) -> list[dict]:
+        """Logged events newer than `since` whose name starts with `prefix`, at most `limit` of the latest"""
+        events = [event for event in self.log if event["id"] > since and event["event"].startswith(prefix)]
+        return events[-limit:] if limit > 0 else events
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self._task is not None,
+            "connected": self.connected,
+            "url": self.url,
+            "received": self.received,
+            "reconnects": self.reconnects,
+            "logged": len(self.log),
+        }
+
+
+event_stream = EventStream(EVENT_LOG_SIZE)
+
+
+# Tools whose results go into the session history, with the kind and device they are recorded under
+_SESSION_KINDS = {
+    "nina_capture_image": ("capture", "camera"),
+    "nina_get_image_stats": ("image", "camera"),
+    "nina_start_autofocus": ("autofocus", "focuser"),
+    "nina_start_guiding": ("guider", "guider"),
+    "nina_stop_guiding": ("guider", "guider"),
+    "nina_dither": ("guider", "guider"),
+}
+
+# Units accepted in relative times such as "90m" or "2h"
+_TIME_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_time(value: Any) -> Optional[float]:
+    """Unix time from an ISO 8601 timestamp (local time unless it has an offset) or a duration ago like "2h\""""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([smhd])", text)
+    if match:
+        return time.time() - float(match[1]) * _TIME_UNITS[match[2]]
+    try:
+        parsed = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Unrecognized time {value!r}; use ISO 8601 or a duration ago such as 90m, 2h or 1d") from None
+    return parsed.timestamp()
+
+
+def format_time(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).astimezone().isoformat(timespec="seconds")
+
+
+def json_path(sample: Any, field_name: str) -> str:
+    """SQLite JSON path of a dot-separated field, matching names case-insensitively against a sample record"""
+    keys = []
+    for name in field_name.split("."):
+        key = next((key for key in sample if key.casefold() == name.casefold()), name) \
+            if isinstance(sample, dict) else name
+        keys.append(key)
+        sample = sample.get(key) if isinstance(sample, dict) else None
+    return "$" + "".join('."' + key.replace('"', '') + '"' for key in keys)
+
+
+class SessionStore:
+    """Append-only SQLite history of equipment info, captures, autofocus runs, guiding and NINA events
+
+    Rows are queued in memory and written in batches on a dedicated thread,
+    so recording never blocks a tool call; queries write the queue first.
+    Rows past the retention window are pruned in the background.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS records (
+            id INTEGER PRIMARY KEY,
+            time REAL NOT NULL,
+            device TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            name TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS records_device_time ON records (device, time);
+        CREATE INDEX IF NOT EXISTS records_kind_time ON records (kind, time);
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.recorded = 0
+        self.pruned = 0
+        self.dropped = 0
+        self._pending: deque[tuple] = deque()
+        self._last_info: dict[str, float] = {}
+        self._next_prune = 0.0
+        self._executor: Optional["ThreadPoolExecutor"] = None
+        self._connection: Optional["sqlite3.Connection"] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, kind: str, device: str, data: Any, name: Optional[str] = None):
+        """Queue one record (kind: info, capture, image, autofocus, guider, weather or event)"""
+        if self.path:
+            self._pending.append((time.time(), device, kind, name, to_json(data)))
+            self._trim()
+
+    def _trim(self):
+        """Drop the oldest queued rows past SESSION_MAX_PENDING, when writes are failing or falling behind"""
+        overflow = len(self._pending) - SESSION_MAX_PENDING
+        if overflow <= 0:
+            return
+        if not self.dropped:
+            logger.warning(f"Session history queue is full ({SESSION_MAX_PENDING} rows); dropping the oldest")
+        for _ in range(overflow):
+            self._pending.popleft()
+        self.dropped += overflow
+
+    def record_info(self, device: str, result: Any):
+        """Record a device info response, at most once per SESSION_INFO_INTERVAL"""
+        now = time.monotonic()
+        if now - self._last_info.get(device, -SESSION_INFO_INTERVAL) < SESSION_INFO_INTERVAL:
+            return
+        if isinstance(result, dict) and result.get("Success") and isinstance(result.get("Response"), dict):
+            self._last_info[device] = now
+            self.record("info", device, compact(result["Response"]))
+
+    def record_result(self, spec: ToolSpec, arguments: dict, result: Any, error: Optional[str] = None):
+        """Record the outcome of a capture, image, autofocus or guider tool"""
+        if spec.name not in _SESSION_KINDS:
+            return
+        kind, device = _SESSION_KINDS[spec.name]
+        data: dict[str, Any] = {"arguments": {key: value for key, value in arguments.items() if key != "fields"}}
+        if isinstance(result, dict) and "Response" in result:
+            if result.get("Success") is False:
+                error = error or result.get("Error") or "NINA reported a failure"
+            else:
+                data["result"] = compact(result["Response"])
+                if result.get("Event"):
+                    data["event"] = result["Event"]
+        elif result is not None:
+            data["result"] = compact(result)
+        if error is not None:
+            data["error"] = error
+        self.record(kind, device, data, spec.name)
+
+    def start(self):
+        if self.path and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Recording session history to {self.path}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.path and self._pending:
+            import sqlite3
+            try:
+                await self.flush()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not write session history: {error_text(e)}")
+        if self._executor is not None:
+            await self._on_thread(self._close)
+            self._executor.shutdown()
+            self._executor = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(SESSION_FLUSH_INTERVAL)
+            import sqlite3  # here and in _connect rather than at startup
+            try:
+                await self.flush()
+                if SESSION_RETENTION_DAYS > 0 and time.monotonic() >= self._next_prune:
+                    self._next_prune = time.monotonic() + SESSION_PRUNE_INTERVAL
+                    await self._on_thread(self._prune, time.time() - SESSION_RETENTION_DAYS * 86400)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not write session history: {error_text(e)}")
+
+    async def flush(self):
+        """Write the queued records, putting them back in the queue if the write fails"""
+        rows, self._pending = list(self._pending), deque()
+        if rows:
+            try:
+                await self._on_thread(self._write, rows)
+            except Exception:
+                self._pending.extendleft(reversed(rows))
+                self._trim()
+                raise
+        if self.dropped:
+            logger.warning(f"Dropped {self.dropped} session history rows while the queue was full")
+            self.dropped = 0
+
+    async def select(self, sql: str, parameters: tuple) -> list[tuple]:
+        """Run a query after writing the queued records"""
+        if not self.path:
+            raise ValueError("Session history is disabled (NINA_MCP_SESSION_DB is empty)")
+        await self.flush()
+        return await self._on_thread(self._select, sql, parameters)
+
+    async def _on_thread(self, function: Callable, *args: Any) -> Any:
+        # The connection is only ever used from this one thread
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(1, thread_name_prefix="session-db")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(function, *args))
+
+    def _connect(self) -> "sqlite3.Connection":
+        if self._connection is None:
+            import sqlite3
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(self.SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def _write(self, rows: list[tuple]):
+        connection = self._connect()
+        with connection:
+            connection.executemany("INSERT INTO records (time, device, kind, name, data) VALUES (?, ?, ?, ?, ?)", rows)
+        self.recorded += len(rows)
+
+    def _prune(self, before: float):
+        """Delete rows recorded before the given time, and compact the file once a quarter of it is free"""
+        connection = self._connect()
+        with connection:
+            deleted = connection.execute("DELETE FROM records WHERE time < ?", (before,)).rowcount
+        if deleted <= 0:
+            return
+        self.pruned += deleted
+        (free,), = connection.execute("PRAGMA freelist_count").fetchall()
+        (pages,), = connection.execute("PRAGMA page_count").fetchall()
+        if free * 4 >= pages:
+            connection.execute("VACUUM")
+        logger.info(f"Pruned {deleted} session history rows older than {SESSION_RETENTION_DAYS:g} days")
+
+    def _select(self, sql: str, parameters: tuple) -> list[tuple]:
+        return self._connect().execute(sql, parameters).fetchall()
+
+    def _close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+session_store = SessionStore(SESSION_DB)
+
+
+class SampleRing:
+    """Fixed-size time series with one array("d") per column; the oldest samples are overwritten
+
+    Missing values are stored as NaN.
+    """
+
+    def __init__(self, columns: tuple[str, ...], size: int):
+        self.size = size
+        self.count = 0
+        self._columns = {name: array("d", bytes(8 * size)) for name in ("time", *columns)}
+
+    def __len__(self) -> int:
+        return min(self.count, self.size)
+
+    def append(self, timestamp: float, **values: float):
+        index = self.count % self.size
+        for name, column in self._columns.items():
+            column[index] = timestamp if name == "time" else values.get(name, math.nan)
+        self.count += 1
+
+    @property
+    def last_time(self) -> Optional[float]:
+        return self._columns["time"][(self.count - 1) % self.size] if self.count else None
+
+    def window(self, since: float = -math.inf) -> dict[str, array]:
+        """Copies of each column's samples taken at or after `since`, oldest first"""
+        if self.count <= self.size:
+            ordered = {name: column[:self.count] for name, column in self._columns.items()}
+        else:
+            start = self.count % self.size
+            ordered = {name: column[start:] + column[:start] for name, column in self._columns.items()}
+        first = bisect_left(ordered["time"], since)
+        return {name: column[first:] for name, column in ordered.items()}
+
+
+def root_mean_square(values: array) -> Optional[float]:
+    return math.sqrt(math.fsum(map(operator.mul, values, values)) / len(values)) if values else None
+
+
+def slope_per_minute(times: array, values: array) -> Optional[float]:
+    """Least-squares trend of values over time, per minute"""
+    if len(values) < 3 or times[-1] - times[0] < 1.0:
+        return None
+    import statistics
+    return statistics.linear_regression(times, values).slope * 60
+
+
+def finite(times: array, values: array) -> tuple[array, array]:
+    """The samples whose value isn't NaN"""
+    present = [value == value for value in values]
+    return array("d", itertools.compress(times, present)), array("d", itertools.compress(values, present))
+
+
+def round_or_none(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+def guide_error(value: Any, scale: float) -> float:
+    """Arcseconds from a guider info error: {"Pixel", "Arcseconds"} as NINA reports it, or a bare number"""
+    if isinstance(value, dict):
+        if value.get("Arcseconds") is not None:
+            return float(value["Arcseconds"])
+        if value.get("Pixel") is not None:
+            return float(value["Pixel"]) * scale
+        return math.nan
+    return float(value) if isinstance(value, (int, float)) else math.nan
+
+
+# Guider states, as stored in the sample buffer (0 for any other state)
+_GUIDING, _SETTLING = 1.0, 2.0
+_GUIDER_STATES = {"guiding": _GUIDING, "settling": _SETTLING, "dithering": _SETTLING}
+
+
+class GuiderSampler:
+    """Background sampling of guider info into a ring buffer of guide errors, for nina_guiding_summary
+
+    Each sample holds the last guide step's RA and Dec error in arcseconds,
+    NINA's running total RMS and the guider state. Repeated reads of the same
+    guide step are skipped. Dither start times, from the event stream or the
+    guider entering a settling state, are kept in a second ring.
+    """
+
+    def __init__(self, size: int):
+        self.samples = SampleRing(("ra", "dec", "rms", "state"), size)
+        self.dithers = SampleRing((), 256)
+        self.reads = 0
+        self.failures = 0
+        self._task: Optional[asyncio.Task] = None
+        self._last_step: Optional[tuple] = None
+        self._state: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Sampling guider info every {GUIDER_SAMPLE_INTERVAL:g} s while guiding")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def mark_dither(self, timestamp: Optional[float] = None):
+        timestamp = timestamp or time.time()
+        last = self.dithers.last_time
+        if last is None or timestamp - last > GUIDER_DITHER_MERGE:
+            self.dithers.append(timestamp)
+
+    async def _run(self):
+        spec = next(spec for spec in OBSERVATORY_INFO_SPECS if spec.device == "guider")
+        while True:
+            try:
+                interval = await self.sample(spec)
+            except Exception as e:
+                self.failures += 1
+                logger.debug(f"Guider sample failed: {error_text(e)}")
+                interval = GUIDER_IDLE_INTERVAL
+            await asyncio.sleep(interval)
+
+    async def sample(self, spec: ToolSpec) -> float:
+        """Read guider info once, store any new guide step, and return the seconds until the next read"""
+        result = await coalesced_read(spec, spec.endpoint, TIMEOUTS["read"], retries=0)()
+        self.reads += 1
+        session_store.record_info("guider", result)
+        info = unwrap_response(result)
+        if not isinstance(info, dict) or not info.get("Connected"):
+            self._state = None
+            return GUIDER_IDLE_INTERVAL
+
+        state = _GUIDER_STATES.get(str(info.get("State", "")).casefold(), 0.0)
+        if state == _SETTLING and self._state != _SETTLING:
+            self.mark_dither()
+        self._state = state
+        if not state:
+            return GUIDER_IDLE_INTERVAL
+
+        scale = float(info.get("PixelScale") or 1.0)
+        total = guide_error(field_value(info, "RMSError.Total"), scale)
+        step = info.get("LastGuideStep")
+        if isinstance(step, dict):
+            key = tuple(step.values())
+            if key == self._last_step:
+                return GUIDER_SAMPLE_INTERVAL
+            self._last_step = key
+            ra = float(step.get("RADistanceRaw", math.nan)) * scale
+            dec = float(step.get("DECDistanceRaw", math.nan)) * scale
+        else:
+            # Without guide steps, fall back to NINA's running RMS of each axis
+            ra = guide_error(field_value(info, "RMSError.RA"), scale)
+            dec = guide_error(field_value(info, "RMSError.Dec"), scale)
+        self.samples.append(time.time(), ra=ra, dec=dec, rms=total, state=state)
+        return GUIDER_SAMPLE_INTERVAL
+
+    def summary(self, window: float, bucket: float) -> dict:
+        """Guiding quality over the last `window` seconds"""
+        now = time.time()
+        columns = self.samples.window(now - window)
+        times, ra, dec, state = columns["time"], columns["ra"], columns["dec"], columns["state"]
+        result: dict[str, Any] = {"window_seconds": window, "samples": len(times), "reads": self.reads}
+        if not len(times):
+            return {**result, "note": "No guide steps sampled in this window yet"}
+
+        # RMS, peak and drift come from steady guiding only; settling after dithers is reported separately
+        steady = [code == _GUIDING and x == x and y == y for code, x, y in zip(state, ra, dec)]  # x == x: not NaN
+        steady_times = array("d", itertools.compress(times, steady))
+        steady_ra = array("d", itertools.compress(ra, steady))
+        steady_dec = array("d", itertools.compress(dec, steady))
+        total = array("d", map(math.hypot, steady_ra, steady_dec))
+
+        if steady_times:
+            ra_rms, dec_rms = root_mean_square(steady_ra), root_mean_square(steady_dec)
+            result.update(
+                guiding_samples=len(steady_times),
+                rms={"ra": round_or_none(ra_rms), "dec": round_or_none(dec_rms),
+                     "total": round_or_none(math.hypot(ra_rms, dec_rms))},
+                peak={"ra": round_or_none(max(map(abs, steady_ra))), "dec": round_or_none(max(map(abs, steady_dec))),
+                      "total": round_or_none(max(total))},
+                mean={"ra": round_or_none(math.fsum(steady_ra) / len(steady_ra)),
+                      "dec": round_or_none(math.fsum(steady_dec) / len(steady_dec))},
+                drift_per_minute={"ra": round_or_none(slope_per_minute(steady_times, steady_ra)),
+                                  "dec": round_or_none(slope_per_minute(steady_times, steady_dec)),
+                                  "total": round_or_none(slope_per_minute(steady_times, total))},
+            )
+            rolling = []
+            start = steady_times[0]
+            while start <= steady_times[-1]:
+                first, last = bisect_left(steady_times, start), bisect_left(steady_times, start + bucket)
+                if last > first:
+                    bucket_rms = math.hypot(root_mean_square(steady_ra[first:last]),
+                                            root_mean_square(steady_dec[first:last]))
+                    rolling.append(
+                        {"start": format_time(start), "samples": last - first, "rms": round_or_none(bucket_rms)}
+                    )
+                start += bucket
+            result["rolling"] = rolling
+
+        latest_rms = columns["rms"][-1]
+        if latest_rms == latest_rms:
+            result["nina_rms_total"] = round_or_none(latest_rms)
+        result["dithers"] = self._settling(times, ra, dec, state, now - window)
+        return result
+
+    def _settling(self, times: array, ra: array, dec: array, state: array, since: float) -> dict:
+        """Settle time of each dither since `since`: until guiding resumes within GUIDER_SETTLE_ARCSEC"""
+        dithers = self.dithers.window(since)["time"]
+        settle_times, unsettled = [], 0
+        for started in dithers:
+            index = bisect_left(times, started)
+            settled = next(
+                (times[i] for i in range(index, len(times))
+                 if state[i] == _GUIDING and math.hypot(ra[i], dec[i]) <= GUIDER_SETTLE_ARCSEC),
+                None
+            )
+            if settled is None:
+                unsettled += 1
+            else:
+                settle_times.append(settled - started)
+        summary: dict[str, Any] = {"count": len(dithers), "unsettled": unsettled}
+        if settle_times:
+            summary.update(
+                settle_seconds_mean=round(math.fsum(settle_times) / len(settle_times), 1),
+                settle_seconds_max=round(max(settle_times), 1),
+                settle_seconds_last=round(settle_times[-1], 1),
+            )
+        return summary
+
+
+guider_sampler = GuiderSampler(GUIDER_BUFFER_SIZE)
+
+
+# Weather info fields kept by the weather sampler, under NINA's names. Samples also hold DewSpread
+# (Temperature - DewPoint, the margin before dew forms) and the safety monitor's IsSafe as 1 or 0
+_WEATHER_FIELDS = (
+    "CloudCover", "Humidity", "DewPoint", "Temperature", "WindSpeed", "WindGust", "SkyQuality",
+    "SkyBrightness", "SkyTemperature", "RainRate", "Pressure",
+)
+_WEATHER_COLUMNS = (*_WEATHER_FIELDS, "DewSpread", "IsSafe")
+
+_WEATHER_RULE = re.compile(
+    r"\s*(?:rate\(\s*(?P<rate>\w+)\s*\)|(?P<field>\w+))\s*(?P<op>==|!=|<=|>=|<|>)\s*(?P<value>[-+]?\d+(?:\.\d*)?)\s*",
+    re.IGNORECASE
+)
+
+
+def weather_column(name: str) -> str:
+    """The sampled column matching a field name case-insensitively"""
+    column = next((column for column in _WEATHER_COLUMNS if column.casefold() == name.strip().casefold()), None)
+    if column is None:
+        raise ValueError(f"Unknown weather field {name!r}; available: {', '.join(_WEATHER_COLUMNS)}")
+    return column
+
+
+@dataclass
+class WeatherRule:
+    """Threshold on a weather field's latest value, or with rate(Field) on its change per hour"""
+    field: str
+    op: str
+    value: float
+    rate: bool = False
+    active: bool = False
+    current: Optional[float] = None
+    changed: Optional[float] = None
+    triggered: int = 0
+    clearing: int = 0  # samples in a row that failed the rule while it was active
+
+    @classmethod
+    def parse(cls, text: str) -> "WeatherRule":
+        match = _WEATHER_RULE.fullmatch(str(text))
+        if match is None:
+            raise ValueError(f"Invalid weather rule {text!r}; expected e.g. Humidity > 90 or rate(Pressure) < -2")
+        return cls(weather_column(match["rate"] or match["field"]), match["op"], float(match["value"]),
+                   rate=bool(match["rate"]))
+
+    def __str__(self) -> str:
+        return f"{f'rate({self.field})' if self.rate else self.field} {self.op} {self.value:g}"
+
+    def update(self, value: float, timestamp: float) -> bool:
+        """Evaluate against a new value (NaN keeps the current state); True if the rule turned on or off"""
+        self.current = value if value == value else None
+        if self.current is None:
+            return False
+        met = _COMPARISONS[self.op](value, self.value)
+        self.clearing = self.clearing + 1 if self.active and not met else 0
+        if met == self.active or 0 < self.clearing < WEATHER_RULE_CLEAR_SAMPLES:
+            return False
+        self.active, self.changed, self.clearing = met, timestamp, 0
+        self.triggered += met
+        return True
+
+    def state(self) -> dict:
+        return {
+            "rule": str(self), "active": self.active, "value": round_or_none(self.current),
+            "since": format_time(self.changed) if self.changed else None, "triggered": self.triggered,
+        }
+
+
+def weather_number(value: Any) -> float:
+    """A weather info value as a float; NaN when missing or not a number (NINA reports unsupported fields as NaN)"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class WeatherSampler:
+    """Background sampling of weather and safety monitor info into a ring buffer, for nina_weather_trend
+
+    Rules are checked on every sample. Rules that turn on or off are logged
+    and recorded in the session history.
+    """
+
+    def __init__(self, size: int, rules: str):
+        self.samples = SampleRing(_WEATHER_COLUMNS, size)
+        self.rules: list[WeatherRule] = []
+        for text in filter(str.strip, rules.split(",")):
+            try:
+                self.rules.append(WeatherRule.parse(text))
+            except ValueError as e:
+                logger.warning(f"Ignoring invalid NINA_MCP_WEATHER_RULES entry: {e}")
+        self.reads = 0
+        self.failures = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self, delay: float = 0.0):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(delay))
+            logger.info(f"Sampling weather and safety monitor info every {WEATHER_SAMPLE_INTERVAL:g} s")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def set_rules(self, texts: list):
+        """Replace the rules, checking the new ones against the samples already taken"""
+        self.rules = [WeatherRule.parse(text) for text in texts]
+        if len(self.samples):
+            self.evaluate(self.samples.last_time)
+
+    async def _run(self, delay: float):
+        await asyncio.sleep(delay)
+        while True:
+            try:
+                await self.sample()
+            except Exception as e:
+                self.failures += 1
+                logger.debug(f"Weather sample failed: {error_text(e)}")
+            await asyncio.sleep(WEATHER_SAMPLE_INTERVAL)
+
+    async def sample(self):
+        """Read weather and safety monitor info once, and store a sample if either is connected"""
+        specs = [spec for spec in OBSERVATORY_INFO_SPECS if spec.device in ("weather", "safetymonitor")]
+        results = await asyncio.gather(
+            *(coalesced_read(spec, spec.endpoint, TIMEOUTS["read"], retries=0)() for spec in specs),
+            return_exceptions=True
+        )
+        self.reads += 1
+        errors = [result for result in results if isinstance(result, Exception)]
+        if len(errors) == len(results):
+            raise errors[0]
+
+        values: dict[str, float] = {}
+        for spec, result in zip(specs, results):
+            if isinstance(result, Exception):
+                continue
+            session_store.record_info(spec.device, result)
+            info = unwrap_response(result)
+            if not isinstance(info, dict) or not info.get("Connected"):
+                continue
+            if spec.device == "safetymonitor":
+                values["IsSafe"] = float(bool(info.get("IsSafe")))
+            else:
+                values.update((name, weather_number(info.get(name))) for name in _WEATHER_FIELDS)
+                values["DewSpread"] = values["Temperature"] - values["DewPoint"]
+        if values:
+            timestamp = time.time()
+            self.samples.append(timestamp, **values)
+            self.evaluate(timestamp)
+
+    def evaluate(self, timestamp: float):
+        """Check every rule against the sample at `timestamp` and the rate over the WEATHER_RATE_WINDOW before it"""
+        recent = self.samples.window(timestamp - WEATHER_RATE_WINDOW)
+        for rule in self.rules:
+            if rule.rate:
+                slope = slope_per_minute(*finite(recent["time"], recent[rule.field]))
+                value = slope * 60 if slope is not None else math.nan
+            else:
+                value = recent[rule.field][-1]
+            if rule.update(value, timestamp):
+                if rule.active:
+                    logger.warning(f"Weather rule {rule} triggered ({value:g})")
+                else:
+                    logger.info(f"Weather rule {rule} cleared ({value:g})")
+                session_store.record("weather", "weather", rule.state(), name=str(rule))
+
+    def summary(self, window: float, fields: tuple[str, ...], bucket: float) -> dict:
+        """Weather trends, safety and rule states over the last `window` seconds"""
+        now = time.time()
+        columns = self.samples.window(now - window)
+        times = columns["time"]
+        result: dict[str, Any] = {
+            "window_seconds": window, "interval_seconds": WEATHER_SAMPLE_INTERVAL, "samples": len(times),
+            "reads": self.reads,
+        }
+        if len(times):
+            result["latest_sample"] = format_time(times[-1])
+            trends = {}
+            for name in fields:
+                field_times, values = finite(times, columns[name])
+                if not values:
+                    continue
+                slope = slope_per_minute(field_times, values)
+                trends[name] = {
+                    "latest": round_or_none(values[-1]), "min": round_or_none(min(values)),
+                    "max": round_or_none(max(values)), "mean": round_or_none(math.fsum(values) / len(values)),
+                    "change": round_or_none(values[-1] - values[0]),
+                    "rate_per_hour": round_or_none(slope * 60 if slope is not None else None),
+                }
+            result["fields"] = trends
+
+            safe_times, safe = finite(times, columns["IsSafe"])
+            if safe:
+                ends = itertools.chain(safe_times[1:], [now])
+                unsafe = math.fsum(end - start for start, end, value in zip(safe_times, ends, safe) if not value)
+                result["safety"] = {
+                    "is_safe": bool(safe[-1]), "unsafe_seconds": round(unsafe),
+                    "changes": sum(map(operator.ne, safe, safe[1:])),
+                }
+            if bucket:
+                result["series"] = self._series(times, columns, fields, bucket)
+        else:
+            result["note"] = "No weather or safety monitor samples in this window; are the devices connected?"
+        result["rules"] = [rule.state() for rule in self.rules]
+        result["active_rules"] = [str(rule) for rule in self.rules if rule.active]
+        return result
+
+    @staticmethod
+    def _series(times: array, columns: dict[str, array], fields: tuple[str, ...], bucket: float) -> list[dict]:
+        """Mean of each field per `bucket` seconds"""
+        series = []
+        start = times[0]
+        while start <= times[-1]:
+            first, last = bisect_left(times, start), bisect_left(times, start + bucket)
+            if last > first:
+                point: dict[str, Any] = {"start": format_time(start)}
+                for name in fields:
+                    values = finite(times[first:last], columns[name][first:last])[1]
+                    if values:
+                        point[name] = round_or_none(math.fsum(values) / len(values))
+                series.append(point)
+            start += bucket
+        return series
+
+
+weather_sampler = WeatherSampler(WEATHER_BUFFER_SIZE, WEATHER_RULES)
+
+
+def start_background_tasks():
+    """Start the session history writer and the optional equipment poller and event stream"""
+    session_store.start()
+    if GUIDER_SAMPLING_ENABLED:
+        guider_sampler.start()
+    if WEATHER_SAMPLING_ENABLED:
+        weather_sampler.start()
+    if POLL_ENABLED:
+        poller.start()
+    if EVENTS_ENABLED:
+        event_stream.start(EVENTS_URL or events_url(BASE_URL))
+
+
+async def stop_background_tasks():
+    await event_stream.stop()
+    await poller.stop()
+    await guider_sampler.stop()
+    await weather_sampler.stop()
+    await session_store.stop()
+
+
+async def handle_job_status(args: dict) -> Any:
+    """Status of one job, or of every retained job when no id is given"""
+    job_id = args.get('job_id')
+    if job_id:
+        return jobs.get(job_id).status()
+    return [job.status() for job in jobs.list()]
+
+
+async def handle_job_result(args: dict) -> Any:
+    """Result of a finished job, or its status while it is still running"""
+    job = jobs.get(args.get('job_id', ''))
+    status = job.status()
+    if job.state == "succeeded":
+        status["result"] = job.result
+    return status
+
+
+async def handle_job_cancel(args: dict) -> Any:
+    """Cancel a running job"""
+    job = await jobs.cancel(args.get('job_id', ''))
+    return job.status()
+
+
+async def handle_transport_stats(args: dict) -> Any:
+    """NINA API connection reuse and retry counters"""
+    return transport_stats.stats()
+
+
+async def handle_server_metrics(args: dict) -> Any:
+    """Per-tool latency, error, byte and cache counters, optionally resetting them"""
+    snapshot = server_metrics.snapshot(args.get('tool'))
+    if args.get('reset', False):
+        server_metrics.reset()
+    return snapshot
+
+
+async def handle_cache_stats(args: dict) -> Any:
+    """Response cache, request coalescing and poller counters, optionally clearing the cache"""
+    stats = {**response_cache.stats(), "coalescing": single_flight.stats()}
+    if poller.running:
+        stats["poller"] = poller.stats()
+    if args.get('clear', False):
+        response_cache.clear()
+    return stats
+
+
+async def handle_batch(args: dict) -> Any:
+    """Run many tool calls in one request
+
+    Consecutive read-only calls run concurrently (bounded by max_concurrency);
+    any other call waits for the calls before it and runs on its own, so
+    commands keep their order relative to the reads around them.
+    """
+    requests = args.get('requests', [])
+    if not isinstance(requests, list):
+        raise ValueError("requests must be a list of {tool, arguments, id} objects")
+    for index, request in enumerate(requests):
+        if not isinstance(request, dict) or not isinstance(request.get('tool'), str):
+            raise ValueError(f"Request {index} must be an object with a tool name, e.g. "
+                             f'{{"tool": "nina_get_camera_info"}}')
+        if not isinstance(request.get('arguments') or {}, dict):
+            raise ValueError(f"Request {index}: arguments must be an object")
+    limit = asyncio.Semaphore(max(1, min(int(args.get('max_concurrency', BATCH_CONCURRENCY)), BATCH_MAX_CONCURRENCY)))
+    keys = [str(request.get('id', index)) for index, request in enumerate(requests)]
+    duplicates = sorted({key for key in keys if keys.count(key) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate request id {', '.join(duplicates)}; each request needs a unique id "
+                         f"(requests without one use their position)")
+    results = dict.fromkeys(keys)
+
+    async def run(index: int, request: dict):
+        key = keys[index]
+        name = request.get('tool', '')
+        try:
+            if name == "nina_batch":
+                raise ValueError("nina_batch can't be nested")
+            async with limit:
+                results[key] = {"tool": name, "result": await run_tool(name, request.get('arguments') or {})}
+        except Exception as e:
+            results[key] = {"tool": name, "error": error_text(e)}
+
+    reads = []
+    for index, request in enumerate(requests):
+        spec = TOOL_REGISTRY.get(request.get('tool', ''))
+        if spec is not None and spec.is_read:
+            reads.append(run(index, request))
+            continue
+        await asyncio.gather(*reads)
+        reads = []
+        await run(index, request)
+    await asyncio.gather(*reads)
+
+    return results
+
+
+def unwrap_response(result: Any) -> Any:
+    """Extract the payload from a NINA API envelope, raising its error when the call failed"""
+    if isinstance(result, dict) and "Response" in result:
+        if result.get("Success") is False:
+            raise ValueError(result.get("Error") or "NINA reported a failure")
+        return result["Response"]
+    return result
+
+
+def compact(value: Any) -> Any:
+    """Drop null and empty fields from a nested API payload"""
+    if isinstance(value, dict):
+        return {key: compact(item) for key, item in value.items() if item not in (None, "", [], {})}
+    if isinstance(value, list):
+        return [compact(item) for item in value]
+    return value
+
+
+async def handle_image_stats(args: dict) -> Any:
+    """Statistics and a small preview of a captured image, without sending the full frame to the client"""
+    if args.get('index') is not None:
+        index = int(args['index'])
+    else:
+        count = unwrap_response(await call_nina_api("image-history?count=true", TIMEOUTS["read"], READ_RETRIES))
+        if not count:
+            raise ValueError("NINA has no captured images yet")
+        index = int(count) - 1
+
+    history = unwrap_response(await call_nina_api(f"image-history?index={index}", TIMEOUTS["read"], READ_RETRIES))
+    if isinstance(history, list):
+        history = history[0] if history else {}
+    result = ImageResult(index=index, nina=compact(history))
+
+    if args.get('analyze', True):
+        analysis = image_analysis()
+        if analysis is None:
+            result["analysis"] = "unavailable, install numpy for server-side statistics"
+        else:
+            stream = analysis.FitsStream(max(64, int(args.get('max_size', IMAGE_ANALYSIS_SIZE))))
+            await stream_nina_api(f"image/{index}?raw_fits=true&stream=true", stream.feed, TIMEOUTS["command"])
+            result["analysis"] = await asyncio.to_thread(analysis.frame_statistics, stream.finish())
+
+    if args.get('preview', True):
+        size = max(16, int(args.get('preview_size', IMAGE_PREVIEW_SIZE)))
+        data = bytearray()
+
+        def collect(chunk: bytes):
+            data.extend(chunk)
+            if len(data) > IMAGE_PREVIEW_MAX_BYTES:
+                raise ValueError(f"Preview exceeds {IMAGE_PREVIEW_MAX_BYTES} bytes")
+
+        endpoint = (f"image/{index}?resize=true&size={size}x{size}&quality={IMAGE_PREVIEW_QUALITY}"
+                    f"&autoPrepare=true&stream=true")
+        mime_type = await stream_nina_api(endpoint, collect, TIMEOUTS["command"])
+        result.images.append(ImageContent(type="image", data=base64.b64encode(data).decode(), mimeType=mime_type))
+        result["preview"] = {"mime_type": mime_type, "bytes": len(data)}
+    return result
+
+
+class ImageIndex:
+    """Statistics of FITS files in capture directories, saved to IMAGE_INDEX_FILE between runs
+
+    Files are remembered with their size and modification time, so a rescan
+    only analyzes new or changed files. Analysis runs in a process pool.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._files: Optional[dict[str, dict]] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def files(self) -> dict[str, dict]:
+        """Entries keyed by absolute path: size, mtime and either stats or error"""
+        if self._files is None:
+            self._files = self._load()
+        return self._files
+
+    def in_directory(self, directory: str, recursive: bool = True) -> dict[str, dict]:
+        prefix = os.path.join(directory, "")
+        return {
+            path: entry for path, entry in self.files.items()
+            if path.startswith(prefix) and (recursive or os.path.dirname(path) == directory)
+        }
+
+    async def scan(self, directory: str, recursive: bool, max_size: int) -> dict:
+        """Bring the index up to date with a directory and return what changed"""
+        analysis = image_analysis()
+        if analysis is None:
+            raise ValueError("Scanning images needs numpy")
+        start = time.perf_counter()
+
+        # One scan at a time, so concurrent scans never analyze a file twice
+        async with self._lock:
+            found = await asyncio.to_thread(analysis.find_fits_files, directory, recursive)
+            present = {path for path, _, _ in found}
+            removed = [path for path in self.in_directory(directory, recursive) if path not in present]
+            for path in removed:
+                del self.files[path]
+
+            changed = []
+            for path, size, mtime in found:
+                entry = self.files.get(path)
+                if entry is None or (entry["size"], entry["mtime"]) != (size, mtime):
+                    changed.append((path, size, mtime))
+
+            failed = 0
+            try:
+                if changed:
+                    failed = await self._analyze(analysis, changed, max_size)
+            finally:
+                if changed or removed:
+                    self._save()
+
+        return {
+            "directory": directory,
+            "files": len(found),
+            "analyzed": len(changed) - failed,
+            "failed": failed,
+            "unchanged": len(found) - len(changed),
+            "removed": len(removed),
+            "seconds": round(time.perf_counter() - start, 2),
+        }
+
+    async def _analyze(self, analysis: Any, files: list[tuple[str, int, int]], max_size: int) -> int:
+        """Analyze files in worker processes, recording each result as it arrives; returns the failure count"""
+        from concurrent.futures import ProcessPoolExecutor
+        loop = asyncio.get_running_loop()
+        pool = ProcessPoolExecutor(min(IMAGE_SCAN_WORKERS, len(files)))
+        failed = 0
+
+        async def analyze(path: str, size: int, mtime: int):
+            nonlocal failed
+            try:
+                entry = {"stats": await loop.run_in_executor(pool, analysis.analyze_file, path, max_size)}
+            except (OSError, ValueError) as e:
+                # Unreadable or unsupported files are remembered too, until they change
+                entry = {"error": error_text(e)}
+                failed += 1
+            self.files[path] = {"size": size, "mtime": mtime, **entry}
+
+        try:
+            await asyncio.gather(*(analyze(*file) for file in files))
+        finally:
+            # Don't block the event loop on cancellation; results already recorded are kept
+            pool.shutdown(wait=False, cancel_futures=True)
+        return failed
+
+    def _load(self) -> dict[str, dict]:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "rb") as f:
+                data = from_json(f.read())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read the image index {self.path}: {error_text(e)}")
+            return {}
+        return data.get("files", {}) if isinstance(data, dict) else {}
+
+    def _save(self):
+        if not self.path:
+            return
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(to_json({"version": 1, "files": self.files}))
+        os.replace(temporary, self.path)
+
+
+image_index = ImageIndex(IMAGE_INDEX_FILE)
+
+
+def image_directory(args: dict) -> str:
+    """Absolute capture directory from the tool arguments or NINA_MCP_IMAGE_DIR"""
+    directory = args.get('directory') or IMAGE_DIRECTORY
+    if not directory:
+        raise ValueError("directory is required (or set NINA_MCP_IMAGE_DIR)")
+    directory = os.path.abspath(os.path.expanduser(directory))
+    if not os.path.isdir(directory):
+        raise ValueError(f"Not a directory: {directory}")
+    return directory
+
+
+async def handle_scan_images(args: dict) -> Any:
+    """Start indexing a capture directory as a background job, or wait for it when wait is set"""
+    directory = image_directory(args)
+    scan = partial(image_index.scan, directory, bool(args.get('recursive', True)),
+                   max(64, int(args.get('max_size', IMAGE_ANALYSIS_SIZE))))
+    if args.get('wait', False):
+        return await scan()
+    return jobs.start(TOOL_REGISTRY["nina_scan_images"], None, run=scan).status()
+
+
+# Fields nina_get_image_directory_stats can sort frames by
+_IMAGE_SORT_FIELDS = ("date", "file", "hfr", "stars", "median", "noise", "saturated_fraction")
+
+
+async def handle_image_directory_stats(args: dict) -> Any:
+    """Summarize the indexed frames of a capture directory without reading any files"""
+    directory = image_directory(args)
+    sort = args.get('sort', 'date')
+    if sort not in _IMAGE_SORT_FIELDS:
+        raise ValueError(f"sort must be one of {', '.join(_IMAGE_SORT_FIELDS)}")
+    analysis = image_analysis()
+    if analysis is None:
+        raise ValueError("Image statistics need numpy")
+
+    entries = image_index.in_directory(directory, bool(args.get('recursive', True)))
+    frames, failed = [], []
+    for path, entry in entries.items():
+        file = os.path.relpath(path, directory)
+        if "stats" in entry:
+            frames.append({"file": file, **entry["stats"]})
+        else:
+            failed.append({"file": file, "error": entry.get("error")})
+    for key in ('filter', 'object'):
+        if args.get(key):
+            wanted = str(args[key]).casefold()
+            frames = [frame for frame in frames if str(frame.get(key, "")).casefold() == wanted]
+    if not frames and not failed:
+        raise ValueError(f"No indexed frames in {directory}; run nina_scan_images first")
+
+    summary, outliers = analysis.summarize(frames)
+    filters = {}
+    for frame in frames:
+        filters.setdefault(frame.get("filter", ""), []).append(frame)
+
+    # Frames missing the sort field go last either way
+    ordered = sorted((frame for frame in frames if frame.get(sort) is not None),
+                     key=operator.itemgetter(sort), reverse=bool(args.get('descending', False)))
+    ordered += [frame for frame in frames if frame.get(sort) is None]
+    limit = max(0, int(args.get('limit', 20)))
+    return {
+        "directory": directory,
+        "frames": len(frames),
+        "failed": failed,
+        "summary": summary,
+        "filters": {
+            name or "none": {"frames": len(group), **{
+                field: values["median"] for field, values in analysis.summarize(group)[0].items()
+            }}
+            for name, group in filters.items()
+        },
+        "outliers": [frames[index]["file"] for index in outliers],
+        "items": ordered[:limit],
+    }
+
+
+def session_filters(args: dict) -> tuple[str, tuple]:
+    """WHERE clause and parameters for the device, kind, name, since and until arguments"""
+    clauses, parameters = [], []
+    for column in ("device", "kind", "name"):
+        if args.get(column):
+            clauses.append(f"{column} = ?")
+            parameters.append(args[column])
+    for column, comparison, value in (("since", ">=", args.get('since')), ("until", "<=", args.get('until'))):
+        timestamp = parse_time(value)
+        if timestamp is not None:
+            clauses.append(f"time {comparison} ?")
+            parameters.append(timestamp)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", tuple(parameters)
+
+
+def field_value(data: Any, field_name: str) -> Any:
+    """Value of a dot-separated field (names match case-insensitively), or None"""
+    for name in field_name.split("."):
+        if not isinstance(data, dict):
+            return None
+        data = next((value for key, value in data.items() if key.casefold() == name.casefold()), None)
+    return data
+
+
+async def handle_session_history(args: dict) -> Any:
+    """Recorded session entries matching the filters, newest first"""
+    where, parameters = session_filters(args)
+    limit = max(1, min(int(args.get('limit', 50)), 1000))
+    rows = await session_store.select(
+        f"SELECT time, device, kind, name, data FROM records{where} ORDER BY time DESC LIMIT ?", (*parameters, limit)
+    )
+    records = []
+    for timestamp, device, kind, name, data in rows:
+        value = from_json(data)
+        if args.get('fields'):
+            value = {field_name: field_value(value, field_name) for field_name in args['fields']}
+        record = {"time": format_time(timestamp), "device": device, "kind": kind}
+        if name:
+            record["name"] = name
+        record["data"] = value
+        records.append(record)
+    return {"count": len(records), "records": records}
+
+
+async def handle_session_stats(args: dict) -> Any:
+    """Aggregate one field of the recorded entries, overall and per time bucket"""
+    where, parameters = session_filters(args)
+    latest = await session_store.select(f"SELECT data FROM records{where} ORDER BY time DESC LIMIT 1", parameters)
+    if not latest:
+        raise ValueError("No recorded entries match the filters")
+    path = json_path(from_json(latest[0][0]), args.get('field', ''))
+
+    values = f"SELECT time, json_extract(data, ?) AS value FROM records{where}"
+    parameters = (path, *parameters)
+    ends = await session_store.select(
+        f"SELECT * FROM (SELECT time, value FROM ({values}) WHERE value IS NOT NULL ORDER BY time LIMIT 1) "
+        f"UNION ALL SELECT * FROM (SELECT time, value FROM ({values}) WHERE value IS NOT NULL "
+        f"ORDER BY time DESC LIMIT 1)",
+        parameters * 2
+    )
+    if not ends:
+        raise ValueError(f"No recorded entry has the field {args.get('field')}")
+    (first_time, first), (last_time, last) = ends
+    result = {
+        "field": path,
+        "first": {"time": format_time(first_time), "value": first},
+        "last": {"time": format_time(last_time), "value": last},
+    }
+
+    if isinstance(first, str):
+        # Text fields (e.g. guider State): how often each value was recorded
+        counts = await session_store.select(
+            f"SELECT value, COUNT(*) FROM ({values}) WHERE value IS NOT NULL GROUP BY value ORDER BY 2 DESC", parameters
+        )
+        return {**result, "count": sum(count for _, count in counts), "values": dict(counts)}
+
+    aggregates = "COUNT(value), MIN(value), MAX(value), AVG(value)"
+    (count, low, high, mean), = await session_store.select(
+        f"SELECT {aggregates} FROM ({values}) WHERE value IS NOT NULL", parameters
+    )
+    result.update(count=count, min=low, max=high, mean=round(mean, 4), change=round(last - first, 4))
+
+    bucket = float(args.get('bucket', 0))
+    if bucket > 0:
+        rows = await session_store.select(
+            f"SELECT CAST(time / ? AS INTEGER) AS bucket, {aggregates} FROM ({values}) WHERE value IS NOT NULL "
+            f"GROUP BY bucket ORDER BY bucket",
+            (bucket, *parameters)
+        )
+        result["buckets"] = [
+            {"start": format_time(index * bucket), "count": count, "min": low, "max": high, "mean": round(mean, 4)}
+            for index, count, low, high, mean in rows
+        ]
+    return result
+
+
+async def handle_guiding_summary(args: dict) -> Any:
+    """Guiding quality over a recent window, from the background guider samples"""
+    if not guider_sampler.running:
+        guider_sampler.start()
+        return {"note": "Guider sampling started; call again once guiding has run for a while"}
+    window = max(10.0, float(args.get('window', 600)))
+    bucket = float(args.get('bucket', 0)) or window / 10
+    return guider_sampler.summary(window, max(1.0, bucket))
+
+
+async def handle_weather_trend(args: dict) -> Any:
+    """Weather and safety trends over a recent window, from the background weather samples"""
+    if args.get('rules') is not None:
+        weather_sampler.set_rules(args['rules'])
+    if not weather_sampler.running:
+        # One sample right away so the first call already has current values and rule states
+        await weather_sampler.sample()
+        weather_sampler.start(delay=WEATHER_SAMPLE_INTERVAL)
+    window = max(60.0, float(args.get('window', 3600)))
+    fields = tuple(map(weather_column, args.get('fields') or ())) or _WEATHER_COLUMNS[:-1]
+    bucket = float(args.get('bucket', 0))
+    return weather_sampler.summary(window, fields, max(bucket, WEATHER_SAMPLE_INTERVAL) if bucket else 0.0)
+
+
+async def handle_events(args: dict) -> Any:
+    """Recent NINA events from the event stream log"""
+    prefix = str(args.get('event', '')).upper()
+    events = event_stream.query(int(args.get('since', 0)), prefix, int(args.get('limit', 50)))
+    return {**event_stream.stats(), "last_id": event_stream.last_id, "events": events}
+
+
+# Comparison operators accepted by nina_wait_until
+_COMPARISONS: dict[str, Callable[[Any, Any], bool]] = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+@dataclass(frozen=True)
+class Condition:
+    """Predicate on one (possibly nested, dot-separated) field of a device's info"""
+    field: str
+    op: str = "=="
+    value: Any = None
+    tolerance: float = 0.0
+
+    def __post_init__(self):
+        if self.op not in _COMPARISONS:
+            raise ValueError(f"Unknown operator {self.op!r}, expected one of {', '.join(_COMPARISONS)}")
+
+    def __str__(self) -> str:
+        tolerance = f" ± {self.tolerance:g}" if self.tolerance else ""
+        return f"{self.field} {self.op} {self.value}{tolerance}"
+
+    def lookup(self, info: dict) -> Any:
+        """The field's current value (names match case-insensitively), raising if the device doesn't report it"""
+        value: Any = info
+        for name in self.field.split("."):
+            key = next((key for key in value if key.casefold() == name.casefold()), None) \
+                if isinstance(value, dict) else None
+            if key is None:
+                raise ValueError(f"Unknown field {self.field}; available: {', '.join(sorted(info))}")
+            value = value[key]
+        return value
+
+    def expected(self, actual: Any) -> Any:
+        """The target value converted to the type of the field's current value"""
+        if isinstance(actual, bool):
+            if isinstance(self.value, str):
+                return self.value.strip().lower() in ("true", "1", "yes", "on")
+            return bool(self.value)
+        if isinstance(actual, (int, float)):
+            try:
+                return float(self.value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{self.field} is numeric, got {self.value!r}") from None
+        if isinstance(actual, str):
+            return str(self.value)
+        return self.value
+
+    def test(self, info: dict) -> tuple[bool, Any]:
+        """Whether the info meets the condition, and the field's value"""
+        actual = self.lookup(info)
+        expected = self.expected(actual)
+        if isinstance(actual, str):
+            return _COMPARISONS[self.op](actual.casefold(), expected.casefold()), actual
+        if self.tolerance and isinstance(actual, (int, float)) and not isinstance(actual, bool):
+            if self.op == "==":
+                return abs(actual - expected) <= self.tolerance, actual
+            if self.op == "!=":
+                return abs(actual - expected) > self.tolerance, actual
+            expected += self.tolerance if self.op in ("<", "<=") else -self.tolerance
+        return _COMPARISONS[self.op](actual, expected), actual
+
+
+async def read_info(device: str) -> dict:
+    """Fresh info of a device class, bypassing the cache, which could predate a change being waited for"""
+    spec = next((spec for spec in OBSERVATORY_INFO_SPECS if spec.device == device), None)
+    if spec is None:
+        raise ValueError(f"Unknown device {device!r}, expected one of {', '.join(OBSERVATORY_DEVICES)}")
+    info = unwrap_response(await coalesced_read(spec, spec.endpoint, TIMEOUTS["read"])())
+    if not isinstance(info, dict):
+        raise ValueError(f"Unexpected {device} info: {to_json(info)[:200]}")
+    return info
+
+
+async def handle_wait_until(args: dict) -> Any:
+    """Re-read a device's info until a condition holds or the timeout expires
+
+    Reads back off from WAIT_UNTIL_POLL_MIN to WAIT_UNTIL_POLL_MAX seconds
+    apart, and a NINA event about the device (when the event stream is on)
+    triggers the next read right away.
+    """
+    device = args.get('device', '')
+    condition = Condition(
+        args.get('field', ''), args.get('operator', '=='), args.get('value'), float(args.get('tolerance', 0))
+    )
+    timeout = min(max(0.0, float(args.get('timeout', WAIT_UNTIL_TIMEOUT))), WAIT_UNTIL_MAX_TIMEOUT)
+
+    start = time.monotonic()
+    delay = WAIT_UNTIL_POLL_MIN
+    polls = 0
+    while True:
+        info = await read_info(device)
+        polls += 1
+        if not info.get("Connected", True) and condition.field != "Connected":
+            raise ValueError(f"{device.capitalize()} is not connected")
+
+        met, value = condition.test(info)
+        remaining = start + timeout - time.monotonic()
+        if met or remaining <= 0:
+            break
+        await event_stream.wait_device(device, min(delay, remaining))
+        delay = min(delay * 1.5, WAIT_UNTIL_POLL_MAX)
+
+    return {
+        "met": met,
+        "condition": f"{device} {condition}",
+        "value": value,
+        "elapsed_seconds": round(time.monotonic() - start, 1),
+        "polls": polls,
+        "info": compact(info),
+    }
+
+
+# Placeholders such as {temperature} in macro step arguments, filled in from the macro's parameters
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+# Tools a macro step can't call
+_MACRO_EXCLUDED_TOOLS = frozenset({"nina_run_macro", "nina_define_macro", "nina_batch"})
+
+# What a failed step does to the macro: stop it, or record the error and carry on
+_ON_ERROR = ("abort", "continue")
+
+# Macros available out of the box; nina_define_macro adds more in the same format
+BUILTIN_MACROS = (
+    {
+        "name": "cool_camera",
+        "description": "Start cooling the camera and wait until it reaches the target temperature",
+        "parameters": {
+            "temperature": {"type": "number", "default": -10, "description": "Target temperature in Celsius"},
+            "tolerance": {"type": "number", "default": 1, "description": "Accepted difference in Celsius"},
+            "timeout": {"type": "number", "default": 1200, "description": "Seconds to wait for the temperature"},
+        },
+        "steps": [
+            {"id": "cool", "tool": "nina_start_cooling", "arguments": {"temperature": "{temperature}"}},
+            {"id": "wait_cool", "tool": "nina_wait_until", "arguments": {
+                "device": "camera", "field": "Temperature", "operator": "<=", "value": "{temperature}",
+                "tolerance": "{tolerance}", "timeout": "{timeout}"}},
+        ],
+    },
+    {
+        "name": "center_target",
+        "description": "Unpark the mount if needed, then slew to and center the coordinates with plate solving",
+        "parameters": {
+            "ra": {"type": "number", "description": "Right Ascension in hours"},
+            "dec": {"type": "number", "description": "Declination in degrees"},
+        },
+        "steps": [
+            {"id": "unpark", "tool": "nina_unpark_telescope",
+             "when": {"device": "telescope", "field": "AtPark", "value": "true"}},
+            {"id": "center", "tool": "nina_platesolve_center", "arguments": {"ra": "{ra}", "dec": "{dec}"}},
+        ],
+    },
+    {
+        "name": "start_imaging",
+        "description": "Cool the camera while unparking, centering the target and starting guiding, "
+                       "then take the first exposure once guiding is running and the camera is cold",
+        "parameters": {
+            "ra": {"type": "number", "description": "Right Ascension in hours"},
+            "dec": {"type": "number", "description": "Declination in degrees"},
+            "temperature": {"type": "number", "default": -10, "description": "Camera temperature in Celsius"},
+            "exposure_time": {"type": "number", "default": 60, "description": "Exposure time in seconds"},
+            "binning": {"type": "integer", "default": 1},
+            "gain": {"type": "integer", "default": 0},
+        },
+        "steps": [
+            {"id": "cool", "tool": "nina_start_cooling", "arguments": {"temperature": "{temperature}"}, "after": []},
+            {"id": "unpark", "tool": "nina_unpark_telescope", "after": [],
+             "when": {"device": "telescope", "field": "AtPark", "value": "true"}},
+            {"id": "center", "tool": "nina_platesolve_center", "arguments": {"ra": "{ra}", "dec": "{dec}"}},
+            {"id": "guide", "tool": "nina_start_guiding"},
+            {"id": "wait_guiding", "tool": "nina_wait_until", "arguments": {
+                "device": "guider", "field": "State", "value": "Guiding", "timeout": 120}},
+            {"id": "wait_cool", "tool": "nina_wait_until", "after": ["cool"], "arguments": {
+                "device": "camera", "field": "Temperature", "operator": "<=", "value": "{temperature}",
+                "tolerance": 1, "timeout": 1200}},
+            {"id": "capture", "tool": "nina_capture_image", "after": ["wait_guiding", "wait_cool"], "arguments": {
+                "exposure_time": "{exposure_time}", "binning": "{binning}", "gain": "{gain}"}},
+        ],
+    },
+    {
+        "name": "end_session",
+        "description": "Stop guiding, park the mount, close the dome shutter and warm up the camera, "
+                       "continuing past any step that fails",
+        "parameters": {},
+        "steps": [
+            {"id": "stop_guiding", "tool": "nina_stop_guiding", "on_error": "continue",
+             "when": {"device": "guider", "field": "Connected", "value": "true"}},
+            {"id": "park", "tool": "nina_park_telescope", "on_error": "continue",
+             "when": {"device": "telescope", "field": "AtPark", "value": "false"}},
+            {"id": "wait_parked", "tool": "nina_wait_until", "on_error": "continue",
+             "arguments": {"device": "telescope", "field": "AtPark", "value": "true", "timeout": 300},
+             "when": {"device": "telescope", "field": "Connected", "value": "true"}},
+            {"id": "close_shutter", "tool": "nina_close_dome_shutter", "on_error": "continue",
+             "when": {"device": "dome", "field": "Connected", "value": "true"}},
+            {"id": "warm_camera", "tool": "nina_stop_cooling", "after": [], "on_error": "continue",
+             "when": {"device": "camera", "field": "CoolerOn", "value": "true"}},
+        ],
+    },
+)
+
+
+def fill_placeholders(value: Any, parameters: dict) -> Any:
+    """Replace {name} placeholders in nested step arguments; a string that is only "{name}" takes the value's type"""
+    if isinstance(value, dict):
+        return {key: fill_placeholders(item, parameters) for key, item in value.items()}
+    if isinstance(value, list):
+        return [fill_placeholders(item, parameters) for item in value]
+    if isinstance(value, str):
+        whole = _PLACEHOLDER.fullmatch(value)
+        if whole is not None:
+            return parameters[whole.group(1)]
+        return _PLACEHOLDER.sub(lambda match: str(parameters[match.group(1)]), value)
+    return value
+
+
+def find_placeholders(value: Any) -> set[str]:
+    """Names of the {name} placeholders in nested step arguments"""
+    if isinstance(value, dict):
+        return set().union(*map(find_placeholders, value.values()))
+    if isinstance(value, list):
+        return set().union(*map(find_placeholders, value))
+    if isinstance(value, str):
+        return set(_PLACEHOLDER.findall(value))
+    return set()
+
+
+@dataclass(frozen=True)
+class MacroStep:
+    """One tool call in a macro
+
+    The step starts once every step in `after` has finished (by default the
+    step before it), is skipped unless its `when` condition holds, and fails
+    if it takes longer than `timeout` seconds. `on_error` says whether a
+    failure aborts the macro or is recorded and ignored.
+    """
+    id: str
+    tool: str
+    arguments: dict = field(default_factory=dict)
+    after: tuple = ()
+    when: Optional[dict] = None
+    timeout: Optional[float] = None
+    on_error: str = "abort"
+
+    def to_dict(self) -> dict:
+        step = {"id": self.id, "tool": self.tool, "after": list(self.after)}
+        if self.arguments:
+            step["arguments"] = self.arguments
+        if self.when is not None:
+            step["when"] = self.when
+        if self.timeout is not None:
+            step["timeout"] = self.timeout
+        if self.on_error != "abort":
+            step["on_error"] = self.on_error
+        return step
+
+
+@dataclass(frozen=True)
+class Macro:
+    """A named graph of tool calls with parameters"""
+    name: str
+    description: str
+    parameters: dict
+    steps: tuple[MacroStep, ...]
+    builtin: bool = False
+
+    @classmethod
+    def from_dict(cls, data: dict, builtin: bool = False) -> "Macro":
+        """Validate a definition in nina_define_macro's format"""
+        name = str(data.get("name", ""))
+        if not re.fullmatch(r"[A-Za-z][\w-]*", name):
+            raise ValueError("Macro names start with a letter and contain only letters, digits, _ and -")
+
+        parameters = data.get("parameters") or {}
+        if not isinstance(parameters, dict):
+            raise ValueError("parameters must map names to {type, default, description}")
+        parameters = {key: spec if isinstance(spec, dict) else {"default": spec} for key, spec in parameters.items()}
+
+        definitions = data.get("steps") or []
+        if not isinstance(definitions, list) or not definitions:
+            raise ValueError(f"Macro {name} needs at least one step")
+
+        steps: list[MacroStep] = []
+        for index, definition in enumerate(definitions):
+            if not isinstance(definition, dict):
+                raise ValueError(f"Step {index + 1} of {name} must be an object")
+            step_id = str(definition.get("id") or f"step{index + 1}")
+            where = f"Step {step_id} of {name}"
+            if any(step.id == step_id for step in steps):
+                raise ValueError(f"{where}: duplicate step id")
+
+            tool = definition.get("tool", "")
+            if tool not in TOOL_REGISTRY or tool in _MACRO_EXCLUDED_TOOLS:
+                raise ValueError(f"{where}: unknown or unsupported tool {tool!r}")
+            arguments = definition.get("arguments") or {}
+            if not isinstance(arguments, dict):
+                raise ValueError(f"{where}: arguments must be an object")
+
+            after = definition.get("after", [steps[-1].id] if steps else [])
+            after = [after] if isinstance(after, str) else list(after)
+            unknown = [str(other) for other in after if not any(step.id == other for step in steps)]
+            if unknown:
+                raise ValueError(f"{where}: after must name earlier steps, got {', '.join(unknown)}")
+
+            when = definition.get("when")
+            if when is not None and (not isinstance(when, dict) or when.get("device") not in OBSERVATORY_DEVICES
+                                     or not when.get("field") or when.get("operator", "==") not in _COMPARISONS):
+                raise ValueError(f"{where}: when needs a device ({', '.join(OBSERVATORY_DEVICES)}), a field, "
+                                 f"a value and optionally an operator ({', '.join(_COMPARISONS)})")
+
+            on_error = definition.get("on_error", "abort")
+            if on_error not in _ON_ERROR:
+                raise ValueError(f"{where}: on_error must be one of {', '.join(_ON_ERROR)}")
+
+            undefined = find_placeholders([arguments, when]) - parameters.keys()
+            if undefined:
+                raise ValueError(f"{where}: undefined parameters {', '.join(sorted(undefined))}")
+
+            timeout = definition.get("timeout")
+            steps.append(MacroStep(
+                step_id, tool, arguments, tuple(after), when,
+                float(timeout) if timeout is not None else None, on_error
+            ))
+
+        return cls(name, str(data.get("description", "")), parameters, tuple(steps), builtin)
+
+    def bind(self, values: dict) -> dict:
+        """Parameter values for a run: the given values over the defaults"""
+        unknown = set(values) - self.parameters.keys()
+        if unknown:
+            raise ValueError(f"Unknown parameters for {self.name}: {', '.join(sorted(unknown))}")
+        missing = [key for key, spec in self.parameters.items() if key not in values and "default" not in spec]
+        if missing:
+            raise ValueError(f"Missing parameters for {self.name}: {', '.join(missing)}")
+        return {key: values.get(key, spec.get("default")) for key, spec in self.parameters.items()}
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "description": self.description,
+            "parameters": self.parameters,
+            "steps": [step.to_dict() for step in self.steps],
+        }
+
+
+class MacroLibrary:
+    """Built-in macros plus user-defined ones, which are saved to MACROS_FILE when it is set"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._macros: Optional[dict[str, Macro]] = None
+
+    @property
+    def macros(self) -> dict[str, Macro]:
+        if self._macros is None:
+            self._macros = {data["name"]: Macro.from_dict(data, builtin=True) for data in BUILTIN_MACROS}
+            for data in self._load():
+                try:
+                    macro = Macro.from_dict(data)
+                except (ValueError, AttributeError) as e:
+                    logger.warning(f"Skipping a macro in {self.path}: {error_text(e)}")
+                    continue
+                if macro.name not in self._macros:
+                    self._macros[macro.name] = macro
+        return self._macros
+
+    def get(self, name: str) -> Macro:
+        macro = self.macros.get(name)
+        if macro is None:
+            raise ValueError(f"Unknown macro {name!r}; available: {', '.join(self.macros)}")
+        return macro
+
+    def define(self, data: dict) -> Macro:
+        """Add or replace a user macro"""
+        macro = Macro.from_dict(data)
+        self._check_user_macro(macro.name, must_exist=False)
+        self.macros[macro.name] = macro
+        self._save()
+        return macro
+
+    def remove(self, name: str):
+        self._check_user_macro(name, must_exist=True)
+        del self.macros[name]
+        self._save()
+
+    def _check_user_macro(self, name: str, must_exist: bool):
+        existing = self.macros.get(name)
+        if existing is not None and existing.builtin:
+            raise ValueError(f"{name} is a built-in macro")
+        if existing is None and must_exist:
+            raise ValueError(f"Unknown macro {name!r}")
+
+    def _load(self) -> list:
+        if not self.path or not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, "rb") as f:
+                data = from_json(f.read())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read macros from {self.path}: {error_text(e)}")
+            return []
+        return data if isinstance(data, list) else []
+
+    def _save(self):
+        if not self.path:
+            return
+        macros = [macro.to_dict() for macro in self.macros.values() if not macro.builtin]
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(to_json(macros))
+        os.replace(temporary, self.path)
+
+
+macro_library = MacroLibrary(MACROS_FILE)
+
+
+class MacroRun:
+    """One run of a macro: executes its steps as a dependency graph and records a trace
+
+    Steps start as soon as the steps they come after have finished, so
+    independent branches run concurrently. Long-running tools are started as
+    jobs and awaited, so a step ends when its operation does. A failing step
+    with on_error "abort" cancels the running steps and skips the rest.
+    """
+
+    def __init__(self, macro: Macro, parameters: dict, timeout: Optional[float] = None):
+        self.macro = macro
+        self.parameters = parameters
+        self.timeout = timeout
+        self.aborted = False
+        self.trace = {step.id: {"id": step.id, "tool": step.tool, "status": "pending"} for step in macro.steps}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._start = 0.0
+
+    async def run(self) -> dict:
+        self._start = time.monotonic()
+        for step in self.macro.steps:
+            self._tasks[step.id] = asyncio.create_task(self._run_step(step))
+        try:
+            _, pending = await asyncio.wait(self._tasks.values(), timeout=self.timeout)
+        finally:
+            for task in self._tasks.values():
+                task.cancel()
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+        if pending:
+            status = "timed_out"
+        elif self.aborted:
+            status = "failed"
+        elif any(entry["status"] in ("failed", "timed_out") for entry in self.trace.values()):
+            status = "completed_with_errors"
+        else:
+            status = "succeeded"
+        return {
+            "macro": self.macro.name,
+            "status": status,
+            "parameters": self.parameters,
+            "elapsed_seconds": round(time.monotonic() - self._start, 1),
+            "steps": list(self.trace.values()),
+        }
+
+    def abort(self):
+        """Cancel every other step after a failure"""
+        self.aborted = True
+        for task in self._tasks.values():
+            if task is not asyncio.current_task():
+                task.cancel()
+
+    async def _run_step(self, step: MacroStep):
+        entry = self.trace[step.id]
+        try:
+            if step.after:
+                await asyncio.wait([self._tasks[other] for other in step.after])
+            if self.aborted:
+                entry["status"] = "not_run"
+                return
+
+            entry["started_at"] = round(time.monotonic() - self._start, 2)
+            start = time.monotonic()
+            try:
+                if step.when is not None and not await self._condition(fill_placeholders(step.when, self.parameters)):
+                    entry["status"] = "skipped"
+                    return
+                arguments = fill_placeholders(step.arguments, self.parameters)
+                entry["arguments"] = arguments
+                entry["status"] = "running"
+                result = await asyncio.wait_for(self._call(step.tool, arguments, entry), step.timeout)
+                entry["status"] = "succeeded"
+                text = to_json(result)
+                entry["result"] = result if len(text) <= MACRO_RESULT_CHARS else {
+                    "truncated": True, "preview": text[:MACRO_RESULT_CHARS]
+                }
+            except asyncio.TimeoutError:
+                entry["status"] = "timed_out"
+                entry["error"] = f"Step did not finish within {step.timeout:g} s"
+            except Exception as e:
+                entry["status"] = "failed"
+                entry["error"] = error_text(e)
+            finally:
+                entry["elapsed_seconds"] = round(time.monotonic() - start, 2)
+
+            if entry["status"] in ("failed", "timed_out") and step.on_error == "abort":
+                self.abort()
+        except asyncio.CancelledError:
+            entry["status"] = "cancelled" if entry["status"] == "running" else "not_run"
+            raise
+
+    async def _condition(self, when: dict) -> bool:
+        condition = Condition(
+            when["field"], when.get("operator", "=="), when.get("value"), float(when.get("tolerance", 0))
+        )
+        info = await read_info(when["device"])
+        if not info.get("Connected", True) and condition.field != "Connected":
+            return False
+        return condition.test(info)[0]
+
+    async def _call(self, tool: str, arguments: dict, entry: dict) -> Any:
+        spec = TOOL_REGISTRY[tool]
+        if spec.long_running:
+            # Run the job here rather than through run_tool, so the step lasts as long as the operation
+            job = jobs.start(spec, map_tool_to_endpoint(tool, arguments), timeout_policy.deadline(spec, arguments),
+                             arguments=arguments)
+            entry["job_id"] = job.id
+            try:
+                await asyncio.wait((job.task,))
+            except asyncio.CancelledError:
+                await jobs.cancel(job.id)
+                raise
+            if job.state != "succeeded":
+                raise ValueError(job.error or f"{tool} {job.state.replace('_', ' ')}")
+            result = job.result
+        else:
+            result = await run_tool(tool, arguments)
+
+        if isinstance(result, dict) and result.get("met") is False:
+            # nina_wait_until gave up before its condition held
+            raise TimeoutError(f"{result.get('condition')} not met within {result.get('elapsed_seconds')} s")
+        return unwrap_response(result)
+
+
+async def handle_list_macros(args: dict) -> Any:
+    """Built-in and user-defined macros with their parameters and steps"""
+    return {"macros": [{**macro.to_dict(), "builtin": macro.builtin} for macro in macro_library.macros.values()]}
+
+
+async def handle_run_macro(args: dict) -> Any:
+    """Start a macro as a background job, or run it to completion when wait is set"""
+    macro = macro_library.get(args.get('macro', ''))
+    timeout = float(args.get('timeout', MACRO_TIMEOUT))
+    run = MacroRun(macro, macro.bind(args.get('parameters') or {}), timeout if timeout > 0 else None)
+    if args.get('wait', False):
+        return await run.run()
+    return jobs.start(TOOL_REGISTRY["nina_run_macro"], None, run=run.run).status()
+
+
+async def handle_define_macro(args: dict) -> Any:
+    """Add, replace or delete a user macro"""
+    if args.get('delete', False):
+        macro_library.remove(args.get('name', ''))
+        return {"deleted": args.get('name')}
+    return macro_library.define(args).to_dict()
+
+
+async def handle_observatory_status(args: dict) -> Any:
+    """Query every equipment info endpoint in parallel and return one normalized snapshot"""
+    wanted = set(args.get('devices') or OBSERVATORY_DEVICES)
+    specs = [spec for spec in OBSERVATORY_INFO_SPECS if spec.device in wanted]
+    devices = {}
+
+    async def query(spec: ToolSpec):
+        start = time.perf_counter()
+        try:
+            info = compact(unwrap_response(await execute_api_tool(spec, spec.endpoint)))
+            connected = bool(isinstance(info, dict) and info.get("Connected"))
+            # Disconnected devices only report defaults, so leave them out
+            status = {"connected": True, "info": info} if connected else {"connected": False}
+        except Exception as e:
+            status = {"connected": False, "error": error_text(e)}
+        status["ms"] = round((time.perf_counter() - start) * 1000, 1)
+        devices[spec.device] = status
+
+    start = time.perf_counter()
+    await asyncio.gather(*(query(spec) for spec in specs))
+
+    return {
+        "connected": [spec.device for spec in specs if devices[spec.device]["connected"]],
+        "errors": [spec.device for spec in specs if "error" in devices[spec.device]],
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        "devices": {spec.device: devices[spec.device] for spec in specs},
+    }
+
+
+_JOB_ID = {"job_id": {"type": "string", "description": "Job id returned by a long-running tool"}}
+
+_SESSION_FILTERS = {
+    "device": {"type": "string", "description": "Device class, e.g. focuser"},
+    "kind": {"type": "string", "enum": ["info", "capture", "image", "autofocus", "guider", "weather", "event"]},
+    "name": {"type": "string", "description": "Tool or event name, e.g. nina_start_autofocus or IMAGE-SAVE"},
+    "since": {"type": "string", "description": "Start time: ISO 8601 or a duration ago such as 90m, 8h or 1d"},
+    "until": {"type": "string", "description": "End time, in the same formats"}
+}
+
+
+# Every equipment/*/info tool, queried together by nina_get_observatory_status
+OBSERVATORY_INFO_SPECS: tuple[ToolSpec, ...] = tuple(
+    spec for spec in TOOL_SPECS if spec.path == f"equipment/{spec.device}/info"
+)
+OBSERVATORY_DEVICES: tuple[str, ...] = tuple(spec.device for spec in OBSERVATORY_INFO_SPECS)
+
+
+# Tools executed inside the MCP server rather than mapped to a single API endpoint
+SERVER_TOOL_SPECS: tuple[ToolSpec, ...] = (
+    # Jobs
+    ToolSpec(
+        "nina_job_status",
+        None,
+        "Get the status of a background job, or of all recent jobs when no job id is given",
+        _JOB_ID,
+        handler=handle_job_status
+    ),
+    ToolSpec(
+        "nina_job_result",
+        None,
+        "Get the result of a finished background job",
+        _JOB_ID,
+        ("job_id",),
+        handler=handle_job_result
+    ),
+    ToolSpec(
+        "nina_job_cancel",
+        None,
+        "Cancel a running background job",
+        _JOB_ID,
+        ("job_id",),
+        handler=handle_job_cancel
+    ),
+
+    # Observatory
+    ToolSpec(
+        "nina_get_observatory_status",
+        None,
+        "Get the status of all equipment (camera, mount, focuser, filter wheel, rotator, flat panel, "
+        "weather, safety monitor, guider, dome) in one call, with per-device errors and timing",
+        {
+            "devices": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Only include these device classes (default: all)"
             }
-        ),
-        Tool(
-            name="nina_platesolve_sync",
-            description="Plate solve and sync mount",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "blind": {"type": "boolean", "description": "Use blind solve", "default": False}
-                },
-                "required": []
+        },
+        handler=handle_observatory_status
+    ),
+
+    # Images
+    ToolSpec(
+        "nina_get_image_stats",
+        None,
+        "Get quality statistics (median, noise, saturation, star count, HFR) and a small preview of a "
+        "captured image, computed by the MCP server from the streamed frame so the full image is never sent",
+        {
+            "index": {"type": "integer", "description": "Position in NINA's image history (defaults to the latest)"},
+            "analyze": {"type": "boolean", "description": "Compute statistics from the frame", "default": True},
+            "max_size": {
+                "type": "integer",
+                "description": "Longer side in pixels the frame is binned to for analysis",
+                "default": IMAGE_ANALYSIS_SIZE
+            },
+            "preview": {"type": "boolean", "description": "Include a preview image", "default": True},
+            "preview_size": {
+                "type": "integer",
+                "description": "Longer side of the preview in pixels",
+                "default": IMAGE_PREVIEW_SIZE
             }
-        ),
-        Tool(
-            name="nina_platesolve_center",
-            description="Center on coordinates using plate solving",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "ra": {"type": "number", "description": "Right Ascension in hours"},
-                    "dec": {"type": "number", "description": "Declination in degrees"}
-                },
-                "required": ["ra", "dec"]
+        },
+        handler=handle_image_stats
+    ),
+    ToolSpec(
+        "nina_scan_images",
+        None,
+        "Index the FITS frames saved in a capture directory: computes background, noise, saturation, star "
+        "count and HFR of each new or changed file in parallel and keeps them in an on-disk index. Runs as "
+        "a background job unless wait is set; then use nina_get_image_directory_stats",
+        {
+            "directory": {"type": "string", "description": "Capture directory (defaults to NINA_MCP_IMAGE_DIR)"},
+            "recursive": {"type": "boolean", "description": "Include subdirectories", "default": True},
+            "max_size": {
+                "type": "integer",
+                "description": "Longer side in pixels frames are binned to for analysis",
+                "default": IMAGE_ANALYSIS_SIZE
+            },
+            "wait": {"type": "boolean", "description": "Wait for the scan instead of starting a job", "default": False}
+        },
+        handler=handle_scan_images
+    ),
+    ToolSpec(
+        "nina_get_image_directory_stats",
+        None,
+        "Summarize the indexed frames of a capture directory: min/median/max of each statistic, medians per "
+        "filter, frames that stand out (high HFR or few stars) and a sorted list of frames",
+        {
+            "directory": {"type": "string", "description": "Capture directory (defaults to NINA_MCP_IMAGE_DIR)"},
+            "recursive": {"type": "boolean", "description": "Include subdirectories", "default": True},
+            "filter": {"type": "string", "description": "Only frames taken with this filter"},
+            "object": {"type": "string", "description": "Only frames of this target (FITS OBJECT)"},
+            "sort": {"type": "string", "enum": list(_IMAGE_SORT_FIELDS), "default": "date"},
+            "descending": {"type": "boolean", "default": False},
+            "limit": {"type": "integer", "description": "Number of frames to list", "default": 20}
+        },
+        handler=handle_image_directory_stats
+    ),
+
+    # Waiting
+    ToolSpec(
+        "nina_wait_until",
+        None,
+        "Wait until a device info field meets a condition, for example telescope Slewing == false, "
+        "camera Temperature <= -10 with tolerance 0.5, or guider State == Guiding. The server re-checks "
+        "with backoff, so use this instead of repeated info/nina_wait calls. Returns whether the condition "
+        "was met, the final value and the device info",
+        {
+            "device": {"type": "string", "enum": list(OBSERVATORY_DEVICES), "description": "Device class"},
+            "field": {
+                "type": "string",
+                "description": "Info field, e.g. Slewing, IsExposing, Temperature, Position, State, "
+                               "or a nested field such as RMSError.Total.Arcseconds"
+            },
+            "operator": {"type": "string", "enum": list(_COMPARISONS), "default": "=="},
+            "value": {"type": "string", "description": "Target value, e.g. false, -10 or Guiding"},
+            "tolerance": {
+                "type": "number",
+                "description": "Allowed difference for numeric fields (Temperature <= -10 with 0.5 accepts -9.5)",
+                "default": 0
+            },
+            "timeout": {
+                "type": "number",
+                "description": f"Seconds to wait at most (up to {WAIT_UNTIL_MAX_TIMEOUT:g})",
+                "default": WAIT_UNTIL_TIMEOUT
             }
-        ),
-        
-        # Framing Assistant
-        Tool(
-            name="nina_framing_get_info",
-            description="Get framing assistant information",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_framing_set_source",
-            description="Set framing target source",
-            inputSchema={
+        },
+        ("device", "field", "value"),
+        handler=handle_wait_until
+    ),
+
+    # Macros
+    ToolSpec(
+        "nina_list_macros",
+        None,
+        "List the macros nina_run_macro can run, built-in and user-defined, with their parameters and steps",
+        handler=handle_list_macros
+    ),
+    ToolSpec(
+        "nina_run_macro",
+        None,
+        "Run a multi-step workflow on the server in one call instead of one tool call per step, e.g. "
+        "cool_camera, center_target, start_imaging or end_session. Runs as a background job and returns a job id "
+        "unless wait is true. The result is a trace with each step's status, timing and result",
+        {
+            "macro": {"type": "string", "description": "Macro name from nina_list_macros"},
+            "parameters": {"type": "object", "description": "Macro parameters, e.g. {\"ra\": 5.59, \"dec\": -5.39}"},
+            "wait": {
+                "type": "boolean",
+                "description": "Wait for the macro to finish and return its trace",
+                "default": False
+            },
+            "timeout": {"type": "number", "description": "Seconds the whole macro may take", "default": MACRO_TIMEOUT}
+        },
+        ("macro",),
+        handler=handle_run_macro
+    ),
+    ToolSpec(
+        "nina_define_macro",
+        None,
+        "Define or replace a user macro made of steps that call other tools. Step fields: id, tool, "
+        "arguments (\"{name}\" inserts a macro parameter), after (ids of steps to wait for; defaults to the "
+        "previous step, [] runs in parallel), when (device, field, operator, value; the step is skipped "
+        "unless it holds), timeout (seconds) and on_error (abort or continue)",
+        {
+            "name": {"type": "string", "description": "Macro name"},
+            "description": {"type": "string", "description": "What the macro does"},
+            "parameters": {
                 "type": "object",
-                "properties": {
-                    "source": {"type": "string", "description": "Target name or coordinates"}
-                },
-                "required": ["source"]
+                "description": "Parameter name -> {type, default, description}; "
+                               "parameters without a default are required"
+            },
+            "steps": {"type": "array", "items": {"type": "object"}, "description": "Steps, in order"},
+            "delete": {"type": "boolean", "description": "Delete the named user macro instead", "default": False}
+        },
+        ("name",),
+        handler=handle_define_macro
+    ),
+
+    # Events
+    ToolSpec(
+        "nina_get_events",
+        None,
+        "Get recent NINA events (image saved, autofocus finished, mount parked, guider started, ...) "
+        "received over NINA's event stream. Pass the last_id of a previous call as since to get only newer events",
+        {
+            "since": {"type": "integer", "description": "Only events with a larger id", "default": 0},
+            "event": {"type": "string", "description": "Only events whose name starts with this, e.g. GUIDER"},
+            "limit": {"type": "integer", "description": "Maximum number of events, keeping the latest", "default": 50}
+        },
+        handler=handle_events
+    ),
+
+    # Guiding
+    ToolSpec(
+        "nina_guiding_summary",
+        None,
+        "Summarize guiding quality over a recent window from guide steps sampled in the background: RMS and "
+        "peak error (arcsec) in RA, Dec and total, mean offset, drift per minute, RMS per time bucket, and "
+        "dither count and settle times. The first call starts sampling if it isn't running",
+        {
+            "window": {"type": "number", "description": "Seconds of history to summarize", "default": 600},
+            "bucket": {"type": "number", "description": "Seconds per rolling RMS bucket (default: window / 10)"}
+        },
+        handler=handle_guiding_summary
+    ),
+
+    # Weather
+    ToolSpec(
+        "nina_weather_trend",
+        None,
+        "Summarize weather and safety over a recent window from readings sampled in the background: latest, "
+        "min, max, mean, change and rate per hour of cloud cover, humidity, dew point, wind, sky quality and "
+        "the other weather fields, time unsafe, and which threshold and rate-of-change rules are active. "
+        "The first call starts sampling if it isn't running",
+        {
+            "window": {"type": "number", "description": "Seconds of history to summarize", "default": 3600},
+            "fields": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Fields to report (default: all), e.g. [\"CloudCover\", \"Humidity\", \"DewSpread\"]"
+            },
+            "bucket": {"type": "number", "description": "Seconds per bucket for a series of means (default: none)"},
+            "rules": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Replace the rules checked on every sample, e.g. [\"Humidity > 90\", \"DewSpread < 2\", "
+                               "\"IsSafe == 0\", \"rate(Pressure) < -2\"]; rates are per hour"
             }
-        ),
-        Tool(
-            name="nina_framing_slew",
-            description="Slew to framing target",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        
-        # Utility
-        Tool(
-            name="nina_time_now",
-            description="Get current system time",
-            inputSchema={"type": "object", "properties": {}, "required": []}
-        ),
-        Tool(
-            name="nina_wait",
-            description="Wait for specified duration",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "seconds": {"type": "integer", "description": "Seconds to wait"}
-                },
-                "required": ["seconds"]
+        },
+        handler=handle_weather_trend
+    ),
+
+    # Session history
+    ToolSpec(
+        "nina_get_session_history",
+        None,
+        "Get recorded history, newest first: equipment info snapshots, capture, image statistics, autofocus "
+        "and guider results, weather rule changes, and NINA events, with their times. Answers from the local "
+        "store without calling NINA",
+        {
+            **_SESSION_FILTERS,
+            "fields": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Only these fields of each entry, dot-separated for nested ones, e.g. result.HFR"
+            },
+            "limit": {"type": "integer", "description": "Maximum number of entries", "default": 50}
+        },
+        handler=handle_session_history
+    ),
+    ToolSpec(
+        "nina_get_session_stats",
+        None,
+        "Aggregate one recorded field over a time range, e.g. focuser Position or Temperature, guider "
+        "RMSError.Total.Arcseconds or image result.analysis.hfr: count, min, max, mean, first, last and change, "
+        "optionally per time bucket. Text fields return how often each value was seen",
+        {
+            **_SESSION_FILTERS,
+            "field": {"type": "string", "description": "Field to aggregate, dot-separated for nested fields"},
+            "bucket": {"type": "number", "description": "Bucket size in seconds (0 for no buckets)", "default": 0}
+        },
+        ("field",),
+        handler=handle_session_stats
+    ),
+
+    # Batching
+    ToolSpec(
+        "nina_batch",
+        None,
+        "Run several tools in one call. Read-only tools (info, list, status) run in parallel, "
+        "other tools run in the given order. Returns each result keyed by request id",
+        {
+            "requests": {
+                "type": "array",
+                "description": "Tool calls to run",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "id": {"type": "string", "description": "Key for this result (defaults to its index)"},
+                        "tool": {"type": "string", "description": "Tool name, e.g. nina_get_camera_info"},
+                        "arguments": {"type": "object", "description": "Tool arguments"}
+                    },
+                    "required": ["tool"]
+                }
+            },
+            "max_concurrency": {
+                "type": "integer",
+                "description": f"Maximum parallel API requests (1-{BATCH_MAX_CONCURRENCY})",
+                "default": BATCH_CONCURRENCY
             }
-        ),
-    ]
-    
+        },
+        ("requests",),
+        handler=handle_batch
+    ),
+
+    # Server
+    ToolSpec(
+        "nina_cache_stats",
+        None,
+        "Get response cache hit/miss counters for equipment info and list tools, and how many "
+        "identical concurrent read requests were coalesced into one",
+        {"clear": {"type": "boolean", "description": "Clear the cache after reading the counters", "default": False}},
+        handler=handle_cache_stats
+    ),
+    ToolSpec(
+        "nina_server_metrics",
+        None,
+        "Get per-tool call counts, errors, latency percentiles, time spent waiting on NINA, bytes in/out "
+        "and cache hits, to see whether NINA or the MCP server is slow",
+        {
+            "tool": {"type": "string", "description": "Only this tool, with its latency histogram"},
+            "reset": {"type": "boolean", "description": "Reset the metrics after reading them", "default": False}
+        },
+        handler=handle_server_metrics
+    ),
+    ToolSpec(
+        "nina_transport_stats",
+        None,
+        "Get NINA API connection pool settings, connection reuse and retry counters",
+        handler=handle_transport_stats
+    ),
+)
+
+
+ALL_TOOL_SPECS: tuple[ToolSpec, ...] = TOOL_SPECS + SERVER_TOOL_SPECS
+
+
+def build_tool_catalog() -> tuple[Tool, ...]:
+    """Build the MCP Tool objects for every registered tool spec"""
+    return tuple(spec.to_tool() for spec in ALL_TOOL_SPECS)
+
+
+# Dispatch tables are built once at import and never mutated afterwards
+TOOL_REGISTRY: dict[str, ToolSpec] = {spec.name: spec for spec in ALL_TOOL_SPECS}
+TOOL_DISPATCH: dict[str, Callable[[dict], str]] = {spec.name: spec.compile_binder() for spec in TOOL_SPECS}
+
+
+@lru_cache(maxsize=1)
+def get_tool_catalog() -> tuple[Tool, ...]:
+    """The MCP tool catalog, built on the first tools/list rather than before the handshake"""
+    return build_tool_catalog()
+
+
+async def run_tool(name: str, arguments: dict) -> Any:
+    """Run a tool by name and return its result"""
+    spec = TOOL_REGISTRY.get(name)
+    if spec is None:
+        raise ValueError(f"Unknown tool {name}")
+
+    if spec.handler is not None:
+        result = await spec.handler(arguments)
+        session_store.record_result(spec, arguments, result)
+        return result
+
+    if spec.is_paged and arguments.get('cursor'):
+        return result_pager.next_page(arguments['cursor'], name, arguments)
+
+    # Map tool name to API endpoint
+    endpoint = map_tool_to_endpoint(name, arguments)
+
+    if spec.long_running:
+        return jobs.start(spec, endpoint, timeout_policy.deadline(spec, arguments), arguments=arguments).status()
+
+    result = await execute_api_tool(spec, endpoint, arguments)
+    session_store.record_result(spec, arguments, result)
+    if arguments.get('fields'):
+        result = project_fields(result, arguments['fields'])
+    if spec.is_paged:
+        result = result_pager.first_page(result, name, arguments)
+    return result
+
+
+@server.list_tools()
+async def handle_list_tools() -> list[Tool]:
+    """List all available NINA Advanced API tools"""
+
+    # Hand out a shallow copy so callers can't mutate the cached catalog
+    tools = list(get_tool_catalog())
+
     logger.info(f"Listing {len(tools)} tools")
     return tools
 
 
 @server.call_tool()
-async def handle_call_tool(name: str, arguments: dict) -> list[TextContent]:
+async def handle_call_tool(name: str, arguments: dict) -> list[TextContent | ImageContent]:
     """Execute NINA Advanced API tool"""
     
+    call = CallStats()
+    token = current_call.set(call)
+    start = time.perf_counter()
     try:
         logger.info(f"Calling tool: {name} with args: {arguments}")
         
-        # Map tool name to API endpoint
-        endpoint = map_tool_to_endpoint(name, arguments)
-        
-        if not endpoint:
-            return [TextContent(
-                type="text",
-                text=f"Error: Unknown tool {name}"
-            )]
-        
-        # Make API call
-        url = f"{BASE_URL}/{endpoint}"
-        logger.info(f"API call: {url}")
-        
-        response = await http_client.get(url)
-        response.raise_for_status()
-        
-        result = response.json()
-        
-        return [TextContent(
-            type="text",
-            text=str(result)
-        )]
+        result = await run_tool(name, arguments or {})
+        text = to_json(result)
+        images = result.images if isinstance(result, ImageResult) else []
+        failed = isinstance(result, dict) and result.get("Success") is False
         
     except Exception as e:
-        logger.error(f"Tool execution failed: {str(e)}")
-        return [TextContent(
-            type="text",
-            text=f"Error: {str(e)}"
-        )]
+        logger.error(f"Tool execution failed: {error_text(e)}")
+        text = f"Error: {error_text(e)}"
+        images = []
+        failed = True
+    finally:
+        current_call.reset(token)
+
+    server_metrics.record(
+        name if name in TOOL_REGISTRY else "unknown",
+        time.perf_counter() - start,
+        failed,
+        len(to_json(arguments)) if arguments else 0,
+        len(text.encode()) + sum(len(image.data) for image in images),
+        call
+    )
+    return [TextContent(
+        type="text",
+        text=text
+    ), *images]
+
+
+async def handle_list_resources() -> list[Resource]:
+    """One resource per device class with the poller's latest snapshot"""
+    return [
+        Resource(
+            uri=equipment_uri(device),
+            name=f"{device} state",
+            description=f"Latest polled {device} info; subscribe to be notified when it changes",
+            mimeType="application/json"
+        )
+        for device in OBSERVATORY_DEVICES
+    ]
+
+
+async def handle_read_resource(uri: Any) -> str:
+    """Return a device's polled snapshot, polling it now if there is none yet"""
+    device = str(uri).rsplit("/", 1)[-1]
+    if str(uri) != equipment_uri(device) or device not in OBSERVATORY_DEVICES:
+        raise ValueError(f"Unknown resource: {uri}")
+    if device not in poller.snapshots:
+        await poller.poll(next(spec for spec in OBSERVATORY_INFO_SPECS if spec.device == device))
+    return to_json(poller.snapshots[device])
+
+
+async def handle_subscribe_resource(uri: Any):
+    poller.subscribe(str(uri), server.request_context.session)
+
+
+async def handle_unsubscribe_resource(uri: Any):
+    poller.unsubscribe(str(uri), server.request_context.session)
+
+
+# Equipment resources only exist while polling, so clients without it see the same capabilities as before
+if POLL_ENABLED:
+    server.list_resources()(handle_list_resources)
+    server.read_resource()(handle_read_resource)
+    server.subscribe_resource()(handle_subscribe_resource)
+    server.unsubscribe_resource()(handle_unsubscribe_resource)
 
 
 def map_tool_to_endpoint(tool_name: str, args: dict) -> Optional[str]:
     """Map tool name to NINA Advanced API endpoint"""
-    
-    # System
-    if tool_name == "nina_get_version":
-        return "version"
-    
-    # Camera
-    elif tool_name == "nina_connect_camera":
-        return f"equipment/camera/connect?to={args.get('device_id', '')}"
-    elif tool_name == "nina_disconnect_camera":
-        return "equipment/camera/disconnect"
-    elif tool_name == "nina_get_camera_info":
-        return "equipment/camera/info"
-    elif tool_name == "nina_list_cameras":
-        return "equipment/camera/list"
-    elif tool_name == "nina_capture_image":
-        exp = args.get('exposure_time', 1)
-        binning = args.get('binning', 1)
-        gain = args.get('gain', 0)
-        return f"equipment/camera/capture?exposuretime={exp}&binning={binning}&gain={gain}"
-    elif tool_name == "nina_start_cooling":
-        temp = args.get('temperature', -10)
-        duration = args.get('duration', 0)
-        return f"equipment/camera/cooling?temperature={temp}&duration={duration}"
-    elif tool_name == "nina_stop_cooling":
-        return "equipment/camera/warmup"
-    elif tool_name == "nina_set_binning":
-        binning = args.get('binning', 1)
-        return f"equipment/camera/binning?x={binning}&y={binning}"
-    elif tool_name == "nina_control_dew_heater":
-        on = str(args.get('on', False)).lower()
-        return f"equipment/camera/dew-heater?on={on}"
-    elif tool_name == "nina_set_gain":
-        gain = args.get('gain', 0)
-        return f"equipment/camera/gain?gain={gain}"
-    elif tool_name == "nina_set_offset":
-        offset = args.get('offset', 0)
-        return f"equipment/camera/offset?offset={offset}"
-    elif tool_name == "nina_start_warming":
-        duration = args.get('duration', 10)
-        return f"equipment/camera/warmup?duration={duration}"
-    
-    # Mount
-    elif tool_name == "nina_connect_telescope":
-        return f"equipment/telescope/connect?to={args.get('device_id', '')}"
-    elif tool_name == "nina_disconnect_telescope":
-        return "equipment/telescope/disconnect"
-    elif tool_name == "nina_get_telescope_info":
-        return "equipment/telescope/info"
-    elif tool_name == "nina_list_telescopes":
-        return "equipment/telescope/list"
-    elif tool_name == "nina_slew_telescope":
-        ra = args.get('ra', 0)
-        dec = args.get('dec', 0)
-        return f"equipment/telescope/slew?rightascension={ra}&declination={dec}"
-    elif tool_name == "nina_park_telescope":
-        return "equipment/telescope/park"
-    elif tool_name == "nina_unpark_telescope":
-        return "equipment/telescope/unpark"
-    elif tool_name == "nina_stop_telescope":
-        return "equipment/telescope/abort-slew"
-    
-    # Focuser
-    elif tool_name == "nina_connect_focuser":
-        return f"equipment/focuser/connect?to={args.get('device_id', '')}"
-    elif tool_name == "nina_disconnect_focuser":
-        return "equipment/focuser/disconnect"
-    elif tool_name == "nina_get_focuser_info":
-        return "equipment/focuser/info"
-    elif tool_name == "nina_list_focusers":
-        return "equipment/focuser/list"
-    elif tool_name == "nina_move_focuser":
-        pos = args.get('position', 0)
-        return f"equipment/focuser/move?position={pos}"
-    elif tool_name == "nina_start_autofocus":
-        method = args.get('method', '')
-        if method:
-            return f"equipment/focuser/autofocus?method={method}"
-        return "equipment/focuser/autofocus"
-    elif tool_name == "nina_cancel_autofocus":
-        return "equipment/focuser/autofocus-cancel"
-    elif tool_name == "nina_get_autofocus_status":
-        return "equipment/focuser/autofocus-status"
-    elif tool_name == "nina_halt_focuser":
-        return "equipment/focuser/halt"
-    
-    # Filter Wheel
-    elif tool_name == "nina_connect_filterwheel":
-        return f"equipment/filterwheel/connect?to={args.get('device_id', '')}"
-    elif tool_name == "nina_disconnect_filterwheel":
-        return "equipment/filterwheel/disconnect"
-    elif tool_name == "nina_get_filterwheel_info":
-        return "equipment/filterwheel/info"
-    elif tool_name == "nina_list_filterwheels":
-        return "equipment/filterwheel/list"
-    elif tool_name == "nina_change_filter":
-        filter_name = args.get('filter', '')
-        return f"equipment/filterwheel/set-filter?filter={filter_name}"
-    
-    # Rotator
-    elif tool_name == "nina_connect_rotator":
-        return f"equipment/rotator/connect?to={args.get('device_id', '')}"
-    elif tool_name == "nina_disconnect_rotator":
-        return "equipment/rotator/disconnect"
-    elif tool_name == "nina_list_rotators":
-        return "equipment/rotator/list"
-    elif tool_name == "nina_get_rotator_info":
-        return "equipment/rotator/info"
-    elif tool_name == "nina_move_rotator":
-        pos = args.get('position', 0)
-        rel = str(args.get('relative', False)).lower()
-        return f"equipment/rotator/move?position={pos}&relative={rel}"
-    elif tool_name == "nina_halt_rotator":
-        return "equipment/rotator/halt"
-    elif tool_name == "nina_sync_rotator":
-        pos = args.get('position', 0)
-        return f"equipment/rotator/sync?mechanicalposition={pos}"
-    elif tool_name == "nina_set_rotator_reverse":
-        reverse = str(args.get('reverse', False)).lower()
-        return f"equipment/rotator/reverse?reverse={reverse}"
-    
-    # Flat Panel
-    elif tool_name == "nina_connect_flatpanel":
-        return f"equipment/flatdevice/connect?to={args.get('device_id', '')}"
-    elif tool_name == "nina_disconnect_flatpanel":
-        return "equipment/flatdevice/disconnect"
-    elif tool_name == "nina_list_flatpanels":
-        return "equipment/flatdevice/list"
-    elif tool_name == "nina_get_flatpanel_info":
-        return "equipment/flatdevice/info"
-    elif tool_name == "nina_set_flatpanel_light":
-        power = str(args.get('power', False)).lower()
-        return f"equipment/flatdevice/set-light?power={power}"
-    elif tool_name == "nina_set_flatpanel_cover":
-        open_cover = str(args.get('open', False)).lower()
-        return f"equipment/flatdevice/set-cover?open={open_cover}"
-    elif tool_name == "nina_set_flatpanel_brightness":
-        brightness = args.get('brightness', 50)
-        return f"equipment/flatdevice/set-brightness?brightness={brightness}"
-    
-    # Switch
-    elif tool_name == "nina_connect_switch":
-        return f"equipment/switch/connect?to={args.get('device_id', '')}"
-    elif tool_name == "nina_disconnect_switch":
-        return "equipment/switch/disconnect"
-    elif tool_name == "nina_list_switches":
-        return "equipment/switch/list"
-    elif tool_name == "nina_get_switch_channels":
-        return "equipment/switch/channels"
-    elif tool_name == "nina_set_switch":
-        index = args.get('index', 0)
-        value = args.get('value', 0)
-        return f"equipment/switch/set?index={index}&value={value}"
-    
-    # Weather
-    elif tool_name == "nina_connect_weather":
-        return f"equipment/weather/connect?to={args.get('device_id', '')}"
-    elif tool_name == "nina_disconnect_weather":
-        return "equipment/weather/disconnect"
-    elif tool_name == "nina_get_weather_info":
-        return "equipment/weather/info"
-    elif tool_name == "nina_list_weather_sources":
-        return "equipment/weather/list"
-    
-    # Safety Monitor
-    elif tool_name == "nina_connect_safetymonitor":
-        return f"equipment/safetymonitor/connect?to={args.get('device_id', '')}"
-    elif tool_name == "nina_disconnect_safetymonitor":
-        return "equipment/safetymonitor/disconnect"
-    elif tool_name == "nina_get_safetymonitor_info":
-        return "equipment/safetymonitor/info"
-    elif tool_name == "nina_list_safetymonitors":
-        return "equipment/safetymonitor/list"
-    
-    # Guider
-    elif tool_name == "nina_connect_guider":
-        return f"equipment/guider/connect?to={args.get('device_id', '')}"
-    elif tool_name == "nina_disconnect_guider":
-        return "equipment/guider/disconnect"
-    elif tool_name == "nina_get_guider_info":
-        return "equipment/guider/info"
-    elif tool_name == "nina_list_guiders":
-        return "equipment/guider/list"
-    elif tool_name == "nina_start_guiding":
-        return "equipment/guider/start-guiding"
-    elif tool_name == "nina_stop_guiding":
-        return "equipment/guider/stop-guiding"
-    elif tool_name == "nina_dither":
-        pixels = args.get('pixels', 5)
-        return f"equipment/guider/dither?pixels={pixels}"
-    
-    # Dome
-    elif tool_name == "nina_connect_dome":
-        return f"equipment/dome/connect?to={args.get('device_id', '')}"
-    elif tool_name == "nina_disconnect_dome":
-        return "equipment/dome/disconnect"
-    elif tool_name == "nina_get_dome_info":
-        return "equipment/dome/info"
-    elif tool_name == "nina_list_domes":
-        return "equipment/dome/list"
-    elif tool_name == "nina_open_dome_shutter":
-        return "equipment/dome/open-shutter"
-    elif tool_name == "nina_close_dome_shutter":
-        return "equipment/dome/close-shutter"
-    elif tool_name == "nina_slew_dome":
-        azimuth = args.get('azimuth', 0)
-        return f"equipment/dome/slew?azimuth={azimuth}"
-    
-    # Sequences
-    elif tool_name == "nina_sequence_start":
-        skip = str(args.get('skipValidation', False)).lower()
-        return f"sequence/start?skipValidation={skip}"
-    elif tool_name == "nina_sequence_stop":
-        return "sequence/stop"
-    elif tool_name == "nina_sequence_load":
-        filepath = args.get('filepath', '')
-        return f"sequence/load?filepath={filepath}"
-    elif tool_name == "nina_sequence_json":
-        return "sequence/json"
-    
-    # Plate Solving
-    elif tool_name == "nina_platesolve_capsolve":
-        blind = str(args.get('blind', False)).lower()
-        return f"plate-solve/capsolve?blind={blind}"
-    elif tool_name == "nina_platesolve_sync":
-        blind = str(args.get('blind', False)).lower()
-        return f"plate-solve/sync?blind={blind}"
-    elif tool_name == "nina_platesolve_center":
-        ra = args.get('ra', 0)
-        dec = args.get('dec', 0)
-        return f"plate-solve/center?rightascension={ra}&declination={dec}"
-    
-    # Framing
-    elif tool_name == "nina_framing_get_info":
-        return "framing/info"
-    elif tool_name == "nina_framing_set_source":
-        source = args.get('source', '')
-        return f"framing/set-source?source={source}"
-    elif tool_name == "nina_framing_slew":
-        return "framing/slew"
-    
-    # Utility
-    elif tool_name == "nina_time_now":
-        return "time/now"
-    elif tool_name == "nina_wait":
-        seconds = args.get('seconds', 1)
-        return f"time/wait?seconds={seconds}"
-    
-    return None
+    binder = TOOL_DISPATCH.get(tool_name)
+    if binder is None:
+        return None
+    return binder(args)
 
 
 async def main():
@@ -1057,19 +4299,106 @@ async def main():
     logger.info("Starting NINA Advanced API MCP Server...")
     
     async with stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(
-                server_name="nina-advanced-api-server",
-                server_version="1.0.0",
-                capabilities=server.get_capabilities(
-                    notification_options=NotificationOptions(),
-                    experimental_capabilities={},
-                )
+        start_background_tasks()
+        try:
+            await server.run(
+                read_stream,
+                write_stream,
+                server.create_initialization_options()
             )
-        )
+        finally:
+            await stop_background_tasks()
+
+
+def daemon_security(host: str) -> Any:
+    """DNS rebinding protection for the daemon
+
+    A web page the user opens can send requests to 127.0.0.1, but its browser
+    sends the page's own Host and Origin. Only requests addressed to this
+    machine by a local name (or one of DAEMON_ALLOWED_HOSTS), from no page or
+    from a page served by such a name, are accepted.
+    """
+    from mcp.server.transport_security import TransportSecuritySettings
+
+    names = ["127.0.0.1", "localhost", "[::1]", *DAEMON_ALLOWED_HOSTS]
+    if host not in ("0.0.0.0", "::", ""):
+        names.append(f"[{host}]" if ":" in host else host)
+    return TransportSecuritySettings(
+        enable_dns_rebinding_protection=True,
+        allowed_hosts=[form for name in names for form in (name, f"{name}:*")],
+        allowed_origins=[form for name in names for form in (f"http://{name}", f"http://{name}:*")],
+    )
+
+
+def create_daemon_app(host: str = DAEMON_HOST):
+    """ASGI app serving MCP over streamable HTTP at /mcp and over SSE at /sse
+
+    Every client shares this process, so the response cache, connection pool,
+    jobs and metrics outlive individual sessions. Needs mcp>=1.10 (and the
+    starlette/uvicorn packages it installs).
+    """
+    from contextlib import asynccontextmanager
+    from mcp.server.sse import SseServerTransport
+    from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+    from starlette.applications import Starlette
+    from starlette.responses import Response
+    from starlette.routing import Mount, Route
+
+    security = daemon_security(host)
+    # Plain JSON responses keep simple clients (and nina_mcp_bridge.py) from having to parse SSE
+    sessions = StreamableHTTPSessionManager(app=server, json_response=True, security_settings=security)
+    sse = SseServerTransport("/messages/", security_settings=security)
+
+    class StreamableHTTP:
+        async def __call__(self, scope, receive, send):
+            await sessions.handle_request(scope, receive, send)
+
+    async def handle_sse(request):
+        async with sse.connect_sse(request.scope, request.receive, request._send) as (read_stream, write_stream):
+            await server.run(read_stream, write_stream, server.create_initialization_options())
+        return Response()
+
+    @asynccontextmanager
+    async def lifespan(app):
+        async with sessions.run():
+            start_background_tasks()
+            yield
+        await stop_background_tasks()
+        if http_client is not None:
+            await http_client.aclose()
+
+    return Starlette(
+        routes=[
+            Route("/mcp", endpoint=StreamableHTTP()),
+            Route("/sse", endpoint=handle_sse),
+            Mount("/messages/", app=sse.handle_post_message),
+        ],
+        lifespan=lifespan
+    )
+
+
+async def serve_daemon(host: str, port: int, socket_path: Optional[str] = None):
+    """Run the long-lived server on localhost HTTP, or on a Unix socket when socket_path is given"""
+    import uvicorn
+
+    config = uvicorn.Config(create_daemon_app(host), host=host, port=port, uds=socket_path, log_level="warning")
+    where = socket_path or f"http://{host}:{port}"
+    logger.info(f"Starting NINA Advanced API MCP Server daemon on {where} (streamable HTTP at /mcp, SSE at /sse)")
+    await uvicorn.Server(config).serve()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    import argparse
+
+    parser = argparse.ArgumentParser(description="NINA Advanced API MCP server")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Serve many clients from one long-lived process over HTTP instead of stdio")
+    parser.add_argument("--host", default=DAEMON_HOST, help=f"Daemon address (default: {DAEMON_HOST})")
+    parser.add_argument("--port", type=int, default=DAEMON_PORT, help=f"Daemon port (default: {DAEMON_PORT})")
+    parser.add_argument("--socket", help="Serve the daemon on this Unix socket instead of a TCP port")
+    args = parser.parse_args()
+
+    if args.daemon:
+        asyncio.run(serve_daemon(args.host, args.port, args.socket))
+    else:
+        asyncio.run(main())
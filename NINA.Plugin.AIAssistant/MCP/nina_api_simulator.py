@@ -0,0 +1,890 @@
+#!/usr/bin/env python3
+"""
+NINA Advanced API simulator
+Serves every endpoint used by nina_advanced_api_mcp_server.py from simulated
+equipment, plus the /v2/socket event stream, for offline testing and
+benchmarking without a NINA install
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import math
+import operator
+import random
+import struct
+import sys
+import time
+import zlib
+from array import array
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from itertools import repeat
+from typing import Any, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger("nina-api-simulator")
+
+API_PREFIX = "/v2/api/"
+SOCKET_PATH = "/v2/socket"
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+DEVICES = (
+    "camera", "telescope", "focuser", "filterwheel", "rotator", "flatdevice",
+    "switch", "weather", "safetymonitor", "guider", "dome",
+)
+
+# Prefix of each device's events, e.g. MOUNT-CONNECTED
+EVENT_PREFIXES = {
+    "camera": "CAMERA", "telescope": "MOUNT", "focuser": "FOCUSER", "filterwheel": "FILTERWHEEL",
+    "rotator": "ROTATOR", "flatdevice": "FLAT", "switch": "SWITCH", "weather": "WEATHER",
+    "safetymonitor": "SAFETY", "guider": "GUIDER", "dome": "DOME",
+}
+
+
+@dataclass
+class SimulatorConfig:
+    """Behaviour of the simulated API"""
+    latency_ms: float = 5.0        # base delay added to every response
+    jitter_ms: float = 2.0         # random extra delay, uniform in [0, jitter_ms]
+    error_rate: float = 0.0        # fraction of requests answered with HTTP 500
+    payload_padding: int = 0       # extra bytes added to every *_info response
+    time_scale: float = 1.0        # multiplier for simulated operation durations
+    slew_seconds: float = 10.0     # duration of a telescope or dome slew
+    autofocus_seconds: float = 60.0
+    solve_seconds: float = 5.0
+    sequence_depth: int = 3        # nesting depth of the sequence/json tree
+    sequence_breadth: int = 4      # children per sequence container
+    image_width: int = 1600        # size of the synthetic frames served by image/{index}
+    image_height: int = 1200
+
+
+@dataclass
+class Binary:
+    """A response sent as raw bytes instead of a JSON envelope"""
+    content_type: str
+    data: bytes
+
+
+def envelope(response: Any, success: bool = True, error: str = "", status: int = 200, kind: str = "API") -> dict:
+    """Wrap a payload in NINA's response envelope"""
+    return {"Response": response, "Error": error, "StatusCode": status, "Success": success, "Type": kind}
+
+
+def websocket_frame(opcode: int, data: bytes) -> bytes:
+    """Encode an unmasked, unfragmented server-to-client WebSocket frame"""
+    length = len(data)
+    if length < 126:
+        header = bytes((0x80 | opcode, length))
+    elif length < 1 << 16:
+        header = bytes((0x80 | opcode, 126)) + length.to_bytes(2, "big")
+    else:
+        header = bytes((0x80 | opcode, 127)) + length.to_bytes(8, "big")
+    return header + data
+
+
+def fits_card(key: str, value: Any) -> bytes:
+    """Encode one 80-character FITS header card"""
+    if isinstance(value, bool):
+        text = ("T" if value else "F").rjust(20)
+    elif isinstance(value, str):
+        text = f"'{value:<8}'"
+    else:
+        text = str(value).rjust(20)
+    return f"{key:<8}= {text}".ljust(80).encode("ascii")
+
+
+def png_image(rows: list[bytes], width: int) -> bytes:
+    """Encode 8-bit grayscale rows as a PNG file"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, len(rows), 8, 0, 0, 0, 0)
+    pixels = zlib.compress(b"".join(b"\x00" + row for row in rows))
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", pixels) + chunk(b"IEND", b"")
+
+
+async def read_websocket_frame(reader: asyncio.StreamReader) -> tuple[int, bytes]:
+    """Read one client-to-server WebSocket frame and return its opcode and unmasked payload"""
+    head = await reader.readexactly(2)
+    length = head[1] & 0x7F
+    if length == 126:
+        length = int.from_bytes(await reader.readexactly(2), "big")
+    elif length == 127:
+        length = int.from_bytes(await reader.readexactly(8), "big")
+    mask = await reader.readexactly(4) if head[1] & 0x80 else b""
+    data = await reader.readexactly(length)
+    if mask:
+        data = bytes(byte ^ mask[index % 4] for index, byte in enumerate(data))
+    return head[0] & 0x0F, data
+
+
+class SimulatedObservatory:
+    """Equipment state and the endpoint handlers that act on it"""
+
+    def __init__(self, config: SimulatorConfig):
+        self.config = config
+        self.devices = {device: {"Connected": False, "Name": "", "DeviceId": ""} for device in DEVICES}
+        self.camera = {"Gain": 100, "Offset": 50, "BinX": 1, "BinY": 1, "Temperature": 20.0, "TargetTemp": 20.0,
+                       "CoolerOn": False, "CoolerPower": 0.0, "DewHeaterOn": False, "IsExposing": False}
+        self.telescope = {"RightAscension": 0.0, "Declination": 90.0, "AtPark": True, "Slewing": False,
+                          "Tracking": False}
+        self.focuser = {"Position": 10000, "IsMoving": False, "Temperature": 12.5}
+        self.autofocus = {"Running": False, "LastHFR": None, "LastPosition": None}
+        self.filterwheel = {"SelectedFilter": "L", "Filters": ["L", "R", "G", "B", "Ha", "OIII", "SII"]}
+        self.rotator = {"Position": 0.0, "MechanicalPosition": 0.0, "Reverse": False, "IsMoving": False}
+        self.flatdevice = {"LightOn": False, "CoverState": "Closed", "Brightness": 0}
+        self.switches = [{"Id": index, "Name": f"Power {index + 1}", "Value": 0.0} for index in range(4)]
+        self.guider = {"State": "Idle", "PixelScale": 1.2, "LastGuideStep": None}
+        self.guide_steps: deque = deque(maxlen=50)  # (RA, Dec) errors in pixels, for RMSError
+        self.guider["RMSError"] = self.guide_rms()
+        self.dither_offset = (0.0, 0.0)
+        self.dome = {"Azimuth": 0.0, "ShutterStatus": "ShutterClosed", "Slewing": False}
+        self.sequence = {"Running": False, "Loaded": "Default"}
+        self.framing = {"Source": "", "RightAscension": 0.0, "Declination": 0.0}
+        self.images = 0
+        self.image_history: list[dict] = []
+        self._frame: Optional[tuple[int, list[array]]] = None
+        self._exposure: Optional[asyncio.Task] = None
+        self.listeners: set[asyncio.Queue] = set()
+
+    # Helpers
+
+    async def operation(self, seconds: float):
+        """Simulate a blocking operation of the given (unscaled) duration"""
+        await asyncio.sleep(max(0.0, float(seconds)) * self.config.time_scale)
+
+    def require(self, device: str):
+        if not self.devices[device]["Connected"]:
+            raise LookupError(f"{device.capitalize()} not connected")
+
+    def publish(self, event: str, **data: Any):
+        """Send an event to every connected /v2/socket client"""
+        message = envelope({"Event": event, **data}, kind="Socket")
+        for listener in self.listeners:
+            listener.put_nowait(message)
+
+    def info(self, device: str, state: Optional[dict] = None) -> dict:
+        info = {**self.devices[device], **(state or {})}
+        if self.config.payload_padding:
+            info["Padding"] = "x" * self.config.payload_padding
+        return info
+
+    # Routing
+
+    async def handle(self, path: str, query: dict) -> Any:
+        """Dispatch an API path (without the /v2/api/ prefix) to its handler"""
+        parts = path.strip("/").split("/")
+
+        if parts == ["version"]:
+            return "2.2.0.9001"
+        if parts == ["time", "now"]:
+            return datetime.now(timezone.utc).isoformat()
+        if parts == ["time", "wait"]:
+            await self.operation(float(query.get("seconds", 1)))
+            return "Waited"
+
+        if parts[0] == "equipment" and len(parts) == 3 and parts[1] in self.devices:
+            return await self.equipment(parts[1], parts[2], query)
+        if parts[0] == "image" and len(parts) == 2:
+            return await self.image(int(parts[1]), query)
+
+        handler = getattr(self, "do_" + "_".join(parts).replace("-", "_"), None)
+        if handler is None:
+            raise KeyError(path)
+        return await handler(query)
+
+    async def equipment(self, device: str, action: str, query: dict) -> Any:
+        if action == "connect":
+            name = query.get("to") or f"Simulated {device}"
+            self.devices[device].update(Connected=True, Name=name, DeviceId=name)
+            self.publish(f"{EVENT_PREFIXES[device]}-CONNECTED")
+            return "Connected"
+        if action == "disconnect":
+            self.devices[device].update(Connected=False)
+            self.publish(f"{EVENT_PREFIXES[device]}-DISCONNECTED")
+            return "Disconnected"
+        if action == "list":
+            return [{"Name": f"Simulated {device} {index}", "Id": f"sim-{device}-{index}"} for index in range(3)]
+
+        handler = getattr(self, f"{device}_{action.replace('-', '_')}", None)
+        if handler is None:
+            raise KeyError(f"equipment/{device}/{action}")
+        return await handler(query)
+
+    # Camera
+
+    async def camera_info(self, query: dict) -> Any:
+        return self.info("camera", {**self.camera, "XSize": 6248, "YSize": 4176, "PixelSize": 3.76})
+
+    async def camera_capture(self, query: dict) -> Any:
+        """Start an exposure; like NINA, only answer once it is saved when waitForResult=true"""
+        self.require("camera")
+        if self._exposure is not None and not self._exposure.done():
+            raise LookupError("Camera is already exposing")
+        exposure = self._exposure = asyncio.create_task(self.expose(float(query.get("exposuretime", 1))))
+        if query.get("waitForResult") != "true":
+            return "Capture started"
+        try:
+            # The exposure carries on if the client goes away, as in NINA
+            return await asyncio.shield(exposure)
+        except asyncio.CancelledError:
+            if exposure.cancelled():
+                raise LookupError("Exposure aborted") from None
+            raise
+
+    async def expose(self, exposure: float) -> dict:
+        self.camera["IsExposing"] = True
+        try:
+            await self.operation(exposure + 1.0)  # exposure plus readout
+        finally:
+            self.camera["IsExposing"] = False
+        self.images += 1
+        image = {"ImageIndex": self.images, "ExposureTime": exposure, "HFR": round(random.uniform(1.8, 3.2), 2),
+                 "Stars": random.randint(200, 1500)}
+        median = round(random.uniform(800, 1500), 1)
+        self.image_history.append({
+            "Index": len(self.image_history), "ExposureTime": exposure, "HFR": image["HFR"], "Stars": image["Stars"],
+            "Median": median, "Mean": round(median * 1.02, 1), "StDev": round(random.uniform(15, 40), 1),
+            "Filter": self.filterwheel["SelectedFilter"], "Date": datetime.now(timezone.utc).isoformat(),
+            "CameraName": self.devices["camera"]["Name"], "Gain": self.camera["Gain"], "Offset": self.camera["Offset"],
+        })
+        self.publish("IMAGE-SAVE", ImageStatistics=image)
+        self.publish("API-CAPTURE-FINISHED")
+        return image
+
+    async def camera_abort_exposure(self, query: dict) -> Any:
+        if self._exposure is not None:
+            self._exposure.cancel()
+        self.camera["IsExposing"] = False
+        return "Exposure aborted"
+
+    async def camera_cooling(self, query: dict) -> Any:
+        self.require("camera")
+        target = float(query.get("temperature", -10))
+        self.camera.update(TargetTemp=target, CoolerOn=True, CoolerPower=55.0, Temperature=target)
+        return "Cooling started"
+
+    async def camera_warmup(self, query: dict) -> Any:
+        self.camera.update(TargetTemp=20.0, CoolerOn=False, CoolerPower=0.0, Temperature=20.0)
+        return "Warming started"
+
+    async def camera_binning(self, query: dict) -> Any:
+        self.camera.update(BinX=int(query.get("x", 1)), BinY=int(query.get("y", 1)))
+        return "Binning set"
+
+    async def camera_dew_heater(self, query: dict) -> Any:
+        self.camera["DewHeaterOn"] = query.get("on") == "true"
+        return "Dew heater set"
+
+    async def camera_gain(self, query: dict) -> Any:
+        self.camera["Gain"] = int(float(query.get("gain", 0)))
+        return "Gain set"
+
+    async def camera_offset(self, query: dict) -> Any:
+        self.camera["Offset"] = int(float(query.get("offset", 0)))
+        return "Offset set"
+
+    # Telescope
+
+    async def telescope_info(self, query: dict) -> Any:
+        return self.info("telescope", self.telescope)
+
+    async def telescope_slew(self, query: dict) -> Any:
+        self.require("telescope")
+        if self.telescope["AtPark"]:
+            raise LookupError("Telescope is parked")
+        self.telescope["Slewing"] = True
+        try:
+            await self.operation(self.config.slew_seconds)
+        finally:
+            self.telescope["Slewing"] = False
+        self.telescope.update(RightAscension=float(query.get("rightascension", 0)),
+                              Declination=float(query.get("declination", 0)), Tracking=True)
+        return "Slew finished"
+
+    async def telescope_park(self, query: dict) -> Any:
+        self.require("telescope")
+        self.telescope.update(Slewing=True)
+        await self.operation(self.config.slew_seconds)
+        self.telescope.update(Slewing=False, AtPark=True, Tracking=False, RightAscension=0.0, Declination=90.0)
+        self.publish("MOUNT-PARKED")
+        return "Parked"
+
+    async def telescope_unpark(self, query: dict) -> Any:
+        self.require("telescope")
+        self.telescope.update(AtPark=False, Tracking=True)
+        self.publish("MOUNT-UNPARKED")
+        return "Unparked"
+
+    async def telescope_abort_slew(self, query: dict) -> Any:
+        self.telescope["Slewing"] = False
+        return "Slew aborted"
+
+    # Focuser
+
+    async def focuser_info(self, query: dict) -> Any:
+        return self.info("focuser", self.focuser)
+
+    async def focuser_move(self, query: dict) -> Any:
+        self.require("focuser")
+        self.focuser["IsMoving"] = True
+        await self.operation(1.0)
+        self.focuser.update(IsMoving=False, Position=int(float(query.get("position", 0))))
+        return "Move finished"
+
+    async def focuser_autofocus(self, query: dict) -> Any:
+        self.require("focuser")
+        self.require("camera")
+        self.autofocus["Running"] = True
+        try:
+            await self.operation(self.config.autofocus_seconds)
+        finally:
+            self.autofocus["Running"] = False
+        position = self.focuser["Position"] + random.randint(-50, 50)
+        hfr = round(random.uniform(1.6, 2.4), 2)
+        self.focuser["Position"] = position
+        self.autofocus.update(LastHFR=hfr, LastPosition=position)
+        self.publish("AUTOFOCUS-FINISHED", Position=position, HFR=hfr)
+        return {"Position": position, "HFR": hfr}
+
+    async def focuser_autofocus_cancel(self, query: dict) -> Any:
+        self.autofocus["Running"] = False
+        return "Autofocus cancelled"
+
+    async def focuser_autofocus_status(self, query: dict) -> Any:
+        return self.autofocus
+
+    async def focuser_halt(self, query: dict) -> Any:
+        self.focuser["IsMoving"] = False
+        return "Focuser halted"
+
+    # Filter wheel
+
+    async def filterwheel_info(self, query: dict) -> Any:
+        return self.info("filterwheel", self.filterwheel)
+
+    async def filterwheel_set_filter(self, query: dict) -> Any:
+        self.require("filterwheel")
+        name = query.get("filter", "")
+        if name not in self.filterwheel["Filters"]:
+            raise LookupError(f"Unknown filter {name}")
+        await self.operation(2.0)
+        previous, self.filterwheel["SelectedFilter"] = self.filterwheel["SelectedFilter"], name
+        self.publish("FILTERWHEEL-CHANGED", Previous={"Name": previous}, New={"Name": name})
+        return "Filter changed"
+
+    # Rotator
+
+    async def rotator_info(self, query: dict) -> Any:
+        return self.info("rotator", self.rotator)
+
+    async def rotator_move(self, query: dict) -> Any:
+        self.require("rotator")
+        position = float(query.get("position", 0))
+        if query.get("relative") == "true":
+            position += self.rotator["Position"]
+        self.rotator["IsMoving"] = True
+        await self.operation(2.0)
+        self.rotator.update(IsMoving=False, Position=position % 360, MechanicalPosition=position % 360)
+        self.publish("ROTATOR-MOVED", To=position % 360)
+        return "Move finished"
+
+    async def rotator_halt(self, query: dict) -> Any:
+        self.rotator["IsMoving"] = False
+        return "Rotator halted"
+
+    async def rotator_sync(self, query: dict) -> Any:
+        self.rotator["MechanicalPosition"] = float(query.get("mechanicalposition", 0))
+        return "Rotator synced"
+
+    async def rotator_reverse(self, query: dict) -> Any:
+        self.rotator["Reverse"] = query.get("reverse") == "true"
+        return "Reverse set"
+
+    # Flat panel
+
+    async def flatdevice_info(self, query: dict) -> Any:
+        return self.info("flatdevice", self.flatdevice)
+
+    async def flatdevice_set_light(self, query: dict) -> Any:
+        self.flatdevice["LightOn"] = query.get("power") == "true"
+        self.publish("FLAT-LIGHT-TOGGLED")
+        return "Light set"
+
+    async def flatdevice_set_cover(self, query: dict) -> Any:
+        self.flatdevice["CoverState"] = "Open" if query.get("open") == "true" else "Closed"
+        self.publish("FLAT-COVER-OPENED" if self.flatdevice["CoverState"] == "Open" else "FLAT-COVER-CLOSED")
+        return "Cover set"
+
+    async def flatdevice_set_brightness(self, query: dict) -> Any:
+        self.flatdevice["Brightness"] = int(float(query.get("brightness", 0)))
+        return "Brightness set"
+
+    # Switch
+
+    async def switch_channels(self, query: dict) -> Any:
+        return self.switches
+
+    async def switch_set(self, query: dict) -> Any:
+        index = int(query.get("index", 0))
+        if not 0 <= index < len(self.switches):
+            raise LookupError(f"Unknown switch {index}")
+        self.switches[index]["Value"] = float(query.get("value", 0))
+        return "Switch set"
+
+    # Weather and safety
+
+    async def weather_info(self, query: dict) -> Any:
+        hour = time.time() / 3600
+        return self.info("weather", {
+            "Temperature": round(8.0 + random.gauss(0, 0.2), 2),
+            "Humidity": round(70.0 + 10 * ((hour % 6) / 6) + random.gauss(0, 0.5), 1),
+            "DewPoint": round(3.5 + random.gauss(0, 0.2), 2),
+            "CloudCover": round(max(0.0, 10.0 + random.gauss(0, 3)), 1),
+            "WindSpeed": round(abs(random.gauss(2.5, 1.0)), 1),
+            "SkyQuality": round(21.2 + random.gauss(0, 0.05), 2),
+            "Pressure": 1013.0,
+        })
+
+    async def safetymonitor_info(self, query: dict) -> Any:
+        return self.info("safetymonitor", {"IsSafe": True})
+
+    # Guider
+
+    def guide_rms(self) -> dict:
+        """NINA's RMSError block over the recent guide steps"""
+        steps = self.guide_steps
+        scale = self.guider["PixelScale"]
+
+        def error(pixels: float) -> dict:
+            return {"Pixel": round(pixels, 3), "Arcseconds": round(pixels * scale, 3)}
+
+        if not steps:
+            return {name: error(0.0) for name in ("RA", "Dec", "Total", "PeakRA", "PeakDec")}
+        ra = math.sqrt(sum(step[0] ** 2 for step in steps) / len(steps))
+        dec = math.sqrt(sum(step[1] ** 2 for step in steps) / len(steps))
+        return {
+            "RA": error(ra), "Dec": error(dec), "Total": error(math.hypot(ra, dec)),
+            "PeakRA": error(max(abs(step[0]) for step in steps)), "PeakDec": error(max(abs(step[1]) for step in steps)),
+        }
+
+    async def guider_info(self, query: dict) -> Any:
+        # Every read while guiding stands for a new guide step; a dither offset decays over a few steps
+        if self.guider["State"] in ("Guiding", "Settling"):
+            offset_ra, offset_dec = self.dither_offset
+            ra, dec = random.gauss(offset_ra, 0.35), random.gauss(offset_dec, 0.3)
+            self.dither_offset = (offset_ra * 0.5, offset_dec * 0.5)
+            self.guide_steps.append((ra, dec))
+            self.guider["LastGuideStep"] = {"RADistanceRaw": round(ra, 3), "DECDistanceRaw": round(dec, 3),
+                                            "RADuration": round(abs(ra) * 150), "DECDuration": round(abs(dec) * 150)}
+            self.guider["RMSError"] = self.guide_rms()
+        return self.info("guider", self.guider)
+
+    async def guider_start_guiding(self, query: dict) -> Any:
+        self.require("guider")
+        await self.operation(3.0)
+        self.guider["State"] = "Guiding"
+        self.publish("GUIDER-START")
+        return "Guiding started"
+
+    async def guider_stop_guiding(self, query: dict) -> Any:
+        self.guider["State"] = "Idle"
+        self.publish("GUIDER-STOP")
+        return "Guiding stopped"
+
+    async def guider_dither(self, query: dict) -> Any:
+        self.require("guider")
+        self.guider["State"] = "Settling"
+        pixels = float(query.get("pixels", 5))
+        self.dither_offset = (random.uniform(-pixels, pixels), random.uniform(-pixels, pixels))
+        self.publish("GUIDER-DITHER")
+        await self.operation(5.0)
+        self.guider["State"] = "Guiding"
+        return "Dither finished"
+
+    # Dome
+
+    async def dome_info(self, query: dict) -> Any:
+        return self.info("dome", self.dome)
+
+    async def dome_open_shutter(self, query: dict) -> Any:
+        self.require("dome")
+        await self.operation(self.config.slew_seconds)
+        self.dome["ShutterStatus"] = "ShutterOpen"
+        self.publish("DOME-SHUTTER-OPENED")
+        return "Shutter opened"
+
+    async def dome_close_shutter(self, query: dict) -> Any:
+        self.require("dome")
+        await self.operation(self.config.slew_seconds)
+        self.dome["ShutterStatus"] = "ShutterClosed"
+        self.publish("DOME-SHUTTER-CLOSED")
+        return "Shutter closed"
+
+    async def dome_slew(self, query: dict) -> Any:
+        self.require("dome")
+        self.dome["Slewing"] = True
+        try:
+            await self.operation(self.config.slew_seconds)
+        finally:
+            self.dome["Slewing"] = False
+        self.dome["Azimuth"] = float(query.get("azimuth", 0))
+        self.publish("DOME-SLEWED", To=self.dome["Azimuth"])
+        return "Dome slew finished"
+
+    # Sequence
+
+    async def do_sequence_start(self, query: dict) -> Any:
+        self.sequence["Running"] = True
+        self.publish("SEQUENCE-STARTING")
+        return "Sequence started"
+
+    async def do_sequence_stop(self, query: dict) -> Any:
+        self.sequence["Running"] = False
+        self.publish("SEQUENCE-FINISHED")
+        return "Sequence stopped"
+
+    async def do_sequence_load(self, query: dict) -> Any:
+        self.sequence["Loaded"] = query.get("filepath", "")
+        return "Sequence loaded"
+
+    async def do_sequence_json(self, query: dict) -> Any:
+        depth, breadth = self.config.sequence_depth, self.config.sequence_breadth
+
+        def container(level: int, index: int) -> dict:
+            status = "RUNNING" if self.sequence["Running"] else "CREATED"
+            node = {"Name": f"Container {level}.{index}", "Status": status,
+                    "Conditions": [{"Name": "Loop For Iterations", "Iterations": 10, "CompletedIterations": 0}],
+                    "Triggers": []}
+            if level < depth:
+                node["Items"] = [container(level + 1, child) for child in range(breadth)]
+            else:
+                node["Items"] = [{"Name": "Take Exposure", "ExposureTime": 300, "ImageType": "LIGHT",
+                                  "Status": "CREATED"} for _ in range(breadth)]
+            return node
+
+        return [container(1, 0)]
+
+    # Plate solving
+
+    async def solve(self) -> dict:
+        self.require("camera")
+        await self.operation(self.config.solve_seconds)
+        return {"Success": True, "RightAscension": self.telescope["RightAscension"],
+                "Declination": self.telescope["Declination"], "Rotation": self.rotator["Position"],
+                "PixelScale": 1.2}
+
+    async def do_plate_solve_capsolve(self, query: dict) -> Any:
+        return await self.solve()
+
+    async def do_plate_solve_sync(self, query: dict) -> Any:
+        self.require("telescope")
+        return await self.solve()
+
+    async def do_plate_solve_center(self, query: dict) -> Any:
+        await self.telescope_slew(query)
+        return await self.solve()
+
+    # Framing
+
+    async def do_framing_info(self, query: dict) -> Any:
+        return self.framing
+
+    async def do_framing_set_source(self, query: dict) -> Any:
+        self.framing["Source"] = query.get("source", "")
+        return "Source set"
+
+    async def do_framing_slew(self, query: dict) -> Any:
+        return await self.telescope_slew({"rightascension": self.framing["RightAscension"],
+                                          "declination": self.framing["Declination"]})
+
+    # Images
+
+    async def do_image_history(self, query: dict) -> Any:
+        if query.get("count", "").lower() == "true":
+            return len(self.image_history)
+        if "index" in query:
+            index = int(query["index"])
+            if not 0 <= index < len(self.image_history):
+                raise LookupError(f"No image at index {index}")
+            return self.image_history[index]
+        return self.image_history
+
+    def render_frame(self, index: int) -> list[array]:
+        """Rows of a synthetic 16-bit star field matching a history entry, the same every time"""
+        if self._frame and self._frame[0] == index:
+            return self._frame[1]
+        stats = self.image_history[index]
+        rng = random.Random(index)
+        width, height = self.config.image_width, self.config.image_height
+        background, noise = stats["Median"], stats["StDev"]
+
+        # Reusing a few noise rows keeps rendering fast enough for large frames
+        templates = [array("H", (min(65535, max(0, int(rng.gauss(background, noise)))) for _ in range(width)))
+                     for _ in range(16)]
+        rows = [array("H", rng.choice(templates)) for _ in range(height)]
+
+        sigma = stats["HFR"] / 1.1774  # HFR of a Gaussian star is about 1.18 sigma
+        reach = int(4 * sigma) + 1
+        for _ in range(stats["Stars"]):
+            cx, cy = rng.uniform(reach, width - reach - 1), rng.uniform(reach, height - reach - 1)
+            peak = noise * 10 ** rng.uniform(0.5, 3.0)
+            for y in range(int(cy) - reach, int(cy) + reach + 1):
+                row, dy2 = rows[y], (y - cy) ** 2
+                for x in range(int(cx) - reach, int(cx) + reach + 1):
+                    value = row[x] + int(peak * math.exp(-((x - cx) ** 2 + dy2) / (2 * sigma * sigma)))
+                    row[x] = min(65535, value)
+        self._frame = (index, rows)
+        return rows
+
+    def fits_file(self, index: int) -> bytes:
+        """The frame as a FITS file: unsigned 16-bit data stored with BZERO 32768, like NINA writes it"""
+        rows = self.render_frame(index)
+        stats = self.image_history[index]
+        cards = [
+            fits_card("SIMPLE", True), fits_card("BITPIX", 16), fits_card("NAXIS", 2),
+            fits_card("NAXIS1", self.config.image_width), fits_card("NAXIS2", self.config.image_height),
+            fits_card("BZERO", 32768), fits_card("BSCALE", 1), fits_card("EXPTIME", stats["ExposureTime"]),
+            fits_card("FILTER", stats["Filter"]), b"END".ljust(80),
+        ]
+        header = b"".join(cards)
+        data = bytearray(header + b" " * (-len(header) % 2880))
+        for row in rows:
+            stored = array("H", map(operator.xor, row, repeat(0x8000)))
+            if sys.byteorder == "little":
+                stored.byteswap()
+            data += stored.tobytes()
+        data += bytes(-len(data) % 2880)
+        return bytes(data)
+
+    def preview(self, index: int, size: str) -> bytes:
+        """A stretched, downscaled grayscale PNG of the frame"""
+        rows = self.render_frame(index)
+        width, height = self.config.image_width, self.config.image_height
+        target_width, _, target_height = size.partition("x")
+        step = max(1, math.ceil(width / int(target_width or width)), math.ceil(height / int(target_height or height)))
+        stats = self.image_history[index]
+        low, scale = stats["Median"] - 2 * stats["StDev"], 255 / (12 * stats["StDev"])
+        scaled = [bytes(min(255, max(0, int((value - low) * scale))) for value in row[::step]) for row in rows[::step]]
+        return png_image(scaled, len(scaled[0]))
+
+    async def image(self, index: int, query: dict) -> Any:
+        if not 0 <= index < len(self.image_history):
+            raise LookupError(f"No image at index {index}")
+        if query.get("raw_fits", "").lower() == "true":
+            result = Binary("image/fits", self.fits_file(index))
+        else:
+            size = query.get("size", "") if query.get("resize", "").lower() == "true" else ""
+            result = Binary("image/png", self.preview(index, size))
+        if query.get("stream", "").lower() == "true":
+            return result
+        return base64.b64encode(result.data).decode()
+
+
+class SimulatorServer:
+    """Minimal HTTP/1.1 server (keep-alive, GET only) in front of a SimulatedObservatory"""
+
+    def __init__(self, config: SimulatorConfig):
+        self.config = config
+        self.observatory = SimulatedObservatory(config)
+        self.requests = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: set[asyncio.Task] = set()
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}/v2/api"
+
+    @property
+    def socket_url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"ws://{host}:{port}{SOCKET_PATH}"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> "SimulatorServer":
+        """Start listening; port 0 picks a free port"""
+        self._server = await asyncio.start_server(self._serve, host, port)
+        return self
+
+    async def close(self):
+        self._server.close()
+        for connection in list(self._connections):
+            connection.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(asyncio.current_task())
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                if headers.get("upgrade", "").lower() == "websocket" and urlsplit(target).path == SOCKET_PATH:
+                    await self._stream_events(reader, writer, headers)
+                    break
+                status, body, content_type = await self._respond(method, target)
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(asyncio.current_task())
+            writer.close()
+
+    async def _stream_events(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, headers: dict):
+        """Upgrade the connection to a WebSocket and push observatory events to it until the client leaves"""
+        digest = hashlib.sha1((headers.get("sec-websocket-key", "") + WEBSOCKET_GUID).encode()).digest()
+        writer.write(
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {base64.b64encode(digest).decode()}\r\n\r\n".encode("latin-1")
+        )
+        await writer.drain()
+
+        async def receive():
+            # Answer pings; return once the client closes or drops the connection
+            try:
+                while True:
+                    opcode, data = await read_websocket_frame(reader)
+                    if opcode == 0x8:
+                        writer.write(websocket_frame(0x8, data[:2]))
+                        return
+                    if opcode == 0x9:
+                        writer.write(websocket_frame(0xA, data))
+            except (ConnectionError, asyncio.IncompleteReadError):
+                return
+
+        queue: asyncio.Queue = asyncio.Queue()
+        self.observatory.listeners.add(queue)
+        closed = asyncio.ensure_future(receive())
+        try:
+            while True:
+                message = asyncio.ensure_future(queue.get())
+                await asyncio.wait((message, closed), return_when=asyncio.FIRST_COMPLETED)
+                if not message.done():
+                    message.cancel()
+                    break
+                writer.write(websocket_frame(0x1, json.dumps(message.result()).encode()))
+                await writer.drain()
+        finally:
+            closed.cancel()
+            self.observatory.listeners.discard(queue)
+
+    async def _respond(self, method: str, target: str) -> tuple[int, bytes, str]:
+        self.requests += 1
+        config = self.config
+        await asyncio.sleep((config.latency_ms + random.uniform(0, config.jitter_ms)) / 1000)
+
+        url = urlsplit(target)
+        if method != "GET" or not url.path.startswith(API_PREFIX):
+            return 404, json.dumps(envelope("", False, "Not found", 404)).encode(), "application/json"
+        if config.error_rate and random.random() < config.error_rate:
+            return 500, json.dumps(envelope("", False, "Simulated failure", 500)).encode(), "application/json"
+
+        try:
+            result = await self.observatory.handle(url.path[len(API_PREFIX):], dict(parse_qsl(url.query)))
+            if isinstance(result, Binary):
+                return 200, result.data, result.content_type
+            payload = envelope(result)
+        except KeyError as e:
+            payload = envelope("", False, f"Unknown endpoint {e.args[0]}", 404)
+            return 404, json.dumps(payload).encode(), "application/json"
+        except (LookupError, ValueError) as e:
+            payload = envelope("", False, str(e), 400)
+        return 200, json.dumps(payload).encode(), "application/json"
+
+
+def missing_routes(endpoints: list[str]) -> list[str]:
+    """Endpoint paths (without query) that the simulator would answer with 404"""
+    observatory = SimulatedObservatory(SimulatorConfig())
+    missing = []
+    for endpoint in endpoints:
+        parts = endpoint.partition("?")[0].strip("/").split("/")
+        if parts in (["version"], ["time", "now"], ["time", "wait"]) or (parts[0] == "image" and len(parts) == 2):
+            continue
+        if parts[0] == "equipment" and len(parts) == 3 and parts[1] in observatory.devices:
+            handler = f"{parts[1]}_{parts[2].replace('-', '_')}"
+            if parts[2] in ("connect", "disconnect", "list") or hasattr(observatory, handler):
+                continue
+        elif hasattr(observatory, "do_" + "_".join(parts).replace("-", "_")):
+            continue
+        missing.append(endpoint)
+    return missing
+
+
+async def serve(config: SimulatorConfig, host: str, port: int):
+    simulator = await SimulatorServer(config).start(host, port)
+    logger.info(f"Simulated NINA Advanced API listening on {simulator.base_url} (events on {simulator.socket_url})")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated NINA Advanced API for offline testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1888)
+    parser.add_argument("--latency-ms", type=float, default=SimulatorConfig.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=SimulatorConfig.jitter_ms)
+    parser.add_argument("--error-rate", type=float, default=SimulatorConfig.error_rate)
+    parser.add_argument("--payload-padding", type=int, default=SimulatorConfig.payload_padding,
+                        help="Extra bytes in every *_info response")
+    parser.add_argument("--time-scale", type=float, default=SimulatorConfig.time_scale,
+                        help="Multiplier for capture, slew, autofocus and other operation durations")
+    parser.add_argument("--sequence-depth", type=int, default=SimulatorConfig.sequence_depth)
+    parser.add_argument("--sequence-breadth", type=int, default=SimulatorConfig.sequence_breadth)
+    parser.add_argument("--image-size", default=f"{SimulatorConfig.image_width}x{SimulatorConfig.image_height}",
+                        help="Size of the synthetic frames served by image/{index}, as WIDTHxHEIGHT")
+    args = parser.parse_args()
+
+    config = SimulatorConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        payload_padding=args.payload_padding,
+        time_scale=args.time_scale,
+        sequence_depth=args.sequence_depth,
+        sequence_breadth=args.sequence_breadth,
+        image_width=int(args.image_size.partition("x")[0]),
+        image_height=int(args.image_size.partition("x")[2]),
+    )
+    try:
+        asyncio.run(serve(config, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+NINA image analysis
+FITS parsing and frame statistics (background, noise, saturation, stars, HFR)
+for nina_advanced_api_mcp_server.py. Frames are binned down while they stream
+in or are read through a memory map, so memory stays bounded even for 60 MP
+sensors. Needs NumPy.
+"""
+
+import math
+import os
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+
+BLOCK_SIZE = 2880  # FITS headers and data are stored in blocks of this many bytes
+CARD_SIZE = 80
+
+# NumPy type of each FITS BITPIX value; FITS data is big-endian
+BITPIX_TYPES = {8: ">u1", 16: ">i2", 32: ">i4", 64: ">i8", -32: ">f4", -64: ">f8"}
+
+# Side of the full-resolution centre crop kept for HFR measurement, in pixels
+CROP_SIZE = 512
+
+# Star detection: peaks this many noise sigmas above the background. HFR is measured within
+# STAR_RADIUS first, then again within a radius of about 2.5 times that first HFR (up to
+# MAX_STAR_RADIUS), counting only pixels STAR_CLIP sigmas above the background
+STAR_THRESHOLD = 5.0
+STAR_RADIUS = 4
+MAX_STAR_RADIUS = 12
+STAR_CLIP = 2.0
+MAX_STARS = 500
+
+# FITS files recognized in capture directories
+FITS_EXTENSIONS = (".fits", ".fit", ".fts")
+
+# Header cards copied into per-file statistics, under these names
+HEADER_FIELDS = {
+    "DATE-OBS": "date",
+    "OBJECT": "object",
+    "IMAGETYP": "image_type",
+    "FILTER": "filter",
+    "EXPTIME": "exposure",
+    "GAIN": "gain",
+    "CCD-TEMP": "temperature",
+}
+
+
+def parse_header(data: bytes) -> Optional[tuple[dict, int]]:
+    """Parse the primary header at the start of data
+
+    Returns the header cards and the header's length in bytes, or None when
+    the END card hasn't arrived yet.
+    """
+    cards = {}
+    for offset in range(0, len(data) - CARD_SIZE + 1, CARD_SIZE):
+        card = bytes(data[offset:offset + CARD_SIZE]).decode("ascii", "replace")
+        key = card[:8].strip()
+        if key == "END":
+            length = offset + CARD_SIZE
+            return cards, -(-length // BLOCK_SIZE) * BLOCK_SIZE
+        if card[8:10] != "= ":
+            continue
+        value = card[10:]
+        if value.lstrip().startswith("'"):
+            cards[key] = value.split("'")[1].rstrip()
+            continue
+        value = value.split("/", 1)[0].strip()
+        if value in ("T", "F"):
+            cards[key] = value == "T"
+            continue
+        try:
+            cards[key] = int(value)
+        except ValueError:
+            try:
+                cards[key] = float(value)
+            except ValueError:
+                cards[key] = value
+    return None
+
+
+@dataclass(frozen=True)
+class FitsLayout:
+    """Size, pixel type and scaling of the first image plane of a FITS file"""
+    width: int
+    height: int
+    dtype: np.dtype
+    bzero: float
+    bscale: float
+    header_bytes: int
+    saturation: Optional[float]
+
+    @classmethod
+    def from_header(cls, cards: dict, header_bytes: int) -> "FitsLayout":
+        if cards.get("NAXIS", 0) < 2:
+            raise ValueError("FITS file has no image data")
+        bitpix = cards.get("BITPIX")
+        if bitpix not in BITPIX_TYPES:
+            raise ValueError(f"Unsupported FITS BITPIX {bitpix}")
+        dtype = np.dtype(BITPIX_TYPES[bitpix])
+        bzero, bscale = float(cards.get("BZERO", 0.0)), float(cards.get("BSCALE", 1.0))
+
+        saturation = cards.get("SATURATE")
+        if saturation is None and dtype.kind in "iu":
+            saturation = bzero + bscale * np.iinfo(dtype).max
+        return cls(cards["NAXIS1"], cards["NAXIS2"], dtype, bzero, bscale, header_bytes,
+                   float(saturation) if saturation is not None else None)
+
+    @property
+    def row_bytes(self) -> int:
+        return self.width * self.dtype.itemsize
+
+    def binning_for(self, max_size: int) -> int:
+        """Smallest bin factor that fits the frame into max_size pixels on its longer side"""
+        return max(1, math.ceil(max(self.width, self.height) / max(1, max_size)))
+
+
+class BinnedFrame:
+    """A frame reduced to block means of factor x factor pixels, built band by band
+
+    Also counts saturated pixels and keeps a full-resolution crop of the
+    frame's centre for measuring star sizes.
+    """
+
+    def __init__(self, layout: FitsLayout, factor: int):
+        self.layout = layout
+        self.factor = factor
+        self.image = np.empty((layout.height // factor, layout.width // factor), np.float32)
+        self.rows = 0
+        self.saturated = 0
+        crop = min(CROP_SIZE, layout.width, layout.height)
+        self._crop_top = (layout.height - crop) // 2
+        self._crop_left = (layout.width - crop) // 2
+        self.crop = np.empty((crop, crop), np.float32)
+
+    @property
+    def complete(self) -> bool:
+        return self.rows >= self.image.shape[0] * self.factor
+
+    def add_rows(self, rows: np.ndarray):
+        """Add the next whole bands of raw rows (a multiple of factor rows, each layout.width wide)"""
+        layout, factor = self.layout, self.factor
+        first = self.rows
+        rows = rows[:max(0, self.image.shape[0] * factor - first)]
+        if not len(rows):
+            return
+        values = rows.astype(np.float32)
+        if layout.bscale != 1.0 or layout.bzero != 0.0:
+            values = values * np.float32(layout.bscale) + np.float32(layout.bzero)
+        if layout.saturation is not None:
+            self.saturated += int(np.count_nonzero(values >= layout.saturation))
+
+        top, left, size = self._crop_top, self._crop_left, self.crop.shape[0]
+        overlap = slice(max(top, first) - first, min(top + size, first + len(values)) - first)
+        if overlap.start < overlap.stop:
+            self.crop[first + overlap.start - top:first + overlap.stop - top] = values[overlap, left:left + size]
+
+        bands, columns = len(values) // factor, self.image.shape[1]
+        binned = values[:, :columns * factor].reshape(bands, factor, columns, factor).mean(axis=(1, 3))
+        self.image[first // factor:first // factor + bands] = binned
+        self.rows += len(values)
+
+
+class FitsStream:
+    """Incremental FITS reader: feed it the chunks of a download and it bins the first image plane
+
+    Only the header, the binned frame and one partial band are held in memory.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.frame: Optional[BinnedFrame] = None
+        self._buffer = bytearray()
+
+    def feed(self, chunk: bytes):
+        if self.frame is not None and self.frame.complete:
+            return
+        self._buffer += chunk
+
+        if self.frame is None:
+            parsed = parse_header(self._buffer)
+            if parsed is None:
+                if len(self._buffer) > 100 * BLOCK_SIZE:
+                    raise ValueError("No FITS header found")
+                return
+            layout = FitsLayout.from_header(*parsed)
+            self.frame = BinnedFrame(layout, layout.binning_for(self.max_size))
+            del self._buffer[:layout.header_bytes]
+
+        band_bytes = self.frame.layout.row_bytes * self.frame.factor
+        usable = len(self._buffer) // band_bytes * band_bytes
+        if usable:
+            rows = np.frombuffer(bytes(self._buffer[:usable]), self.frame.layout.dtype)
+            self.frame.add_rows(rows.reshape(-1, self.frame.layout.width))
+            del self._buffer[:usable]
+
+    def finish(self) -> BinnedFrame:
+        if self.frame is None or not self.frame.complete:
+            raise ValueError("Incomplete FITS image")
+        return self.frame
+
+
+def read_fits(path: str, max_size: int) -> tuple[dict, BinnedFrame]:
+    """Read a FITS file's header and bin its first image plane through a memory map, a band at a time"""
+    with open(path, "rb") as f:
+        header = bytearray()
+        parsed = None
+        while parsed is None:
+            block = f.read(BLOCK_SIZE)
+            if len(block) < BLOCK_SIZE:
+                raise ValueError("No FITS header found")
+            header += block
+            parsed = parse_header(header)
+    layout = FitsLayout.from_header(*parsed)
+    frame = BinnedFrame(layout, layout.binning_for(max_size))
+
+    data = np.memmap(path, layout.dtype, "r", offset=layout.header_bytes, shape=(layout.height, layout.width))
+    band = frame.factor * max(1, (4 << 20) // (layout.row_bytes * frame.factor))  # about 4 MB per read
+    for top in range(0, frame.image.shape[0] * frame.factor, band):
+        frame.add_rows(data[top:top + band])
+    del data
+    return parsed[0], frame
+
+
+def find_stars(image: np.ndarray, background: float, noise: float,
+               radius: int = STAR_RADIUS) -> tuple[int, np.ndarray]:
+    """Count local maxima above the detection threshold and measure the HFR of the brightest
+
+    HFR is the flux-weighted mean distance from the peak within radius, in
+    pixels of the given image.
+    """
+    height, width = image.shape
+    if noise <= 0 or height <= 2 * radius or width <= 2 * radius:
+        return 0, np.empty(0, np.float32)
+
+    core = image[1:-1, 1:-1]
+    peaks = core > background + STAR_THRESHOLD * noise
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            if dy or dx:
+                neighbour = image[1 + dy:height - 1 + dy, 1 + dx:width - 1 + dx]
+                # Strict on one side so a flat-topped (saturated) peak is counted once
+                peaks &= core > neighbour if (dy, dx) < (0, 0) else core >= neighbour
+    ys, xs = np.nonzero(peaks)
+    ys, xs = ys + 1, xs + 1
+    count = len(ys)
+
+    inside = (ys >= radius) & (ys < height - radius) & (xs >= radius) & (xs < width - radius)
+    ys, xs = ys[inside], xs[inside]
+    brightest = np.argsort(image[ys, xs])[::-1][:MAX_STARS]
+    ys, xs = ys[brightest], xs[brightest]
+
+    offsets = np.arange(-radius, radius + 1)
+    windows = image[ys[:, None, None] + offsets[None, :, None], xs[:, None, None] + offsets[None, None, :]]
+    windows = windows - background
+    windows[windows < STAR_CLIP * noise] = 0
+    distance = np.hypot(offsets[:, None], offsets[None, :])
+    flux = windows.sum(axis=(1, 2))
+    hfr = (windows * distance).sum(axis=(1, 2)) / np.where(flux > 0, flux, 1)
+    # Single hot pixels have an HFR near zero
+    return count, hfr[hfr > 0.5]
+
+
+def measure_hfr(image: np.ndarray, background: float, noise: float) -> tuple[int, np.ndarray]:
+    """find_stars with the measuring radius adapted to the stars' size"""
+    count, hfr = find_stars(image, background, noise)
+    if len(hfr):
+        radius = min(MAX_STAR_RADIUS, max(STAR_RADIUS, math.ceil(2.5 * float(np.median(hfr)))))
+        if radius > STAR_RADIUS:
+            count, hfr = find_stars(image, background, noise, radius)
+    return count, hfr
+
+
+def frame_statistics(frame: BinnedFrame) -> dict[str, Any]:
+    """Background, noise, saturation, star count and HFR of a binned frame
+
+    Noise is estimated from the median absolute deviation and scaled back to
+    full resolution assuming white noise. HFR is measured on the
+    full-resolution centre crop when it holds enough stars, and otherwise
+    on the binned frame scaled by the bin factor (an overestimate).
+    """
+    image, factor = frame.image, frame.factor
+    background = float(np.median(image))
+    noise = 1.4826 * float(np.median(np.abs(image - background)))
+    stars, hfr = measure_hfr(image, background, noise)
+
+    crop_background = float(np.median(frame.crop))
+    crop_noise = 1.4826 * float(np.median(np.abs(frame.crop - crop_background)))
+    _, crop_hfr = measure_hfr(frame.crop, crop_background, crop_noise)
+    if len(crop_hfr) >= 3:
+        hfr_value, hfr_source = float(np.median(crop_hfr)), "center crop"
+    elif len(hfr):
+        hfr_value, hfr_source = float(np.median(hfr)) * factor, "binned frame"
+    else:
+        hfr_value, hfr_source = None, None
+
+    layout = frame.layout
+    return {
+        "width": layout.width,
+        "height": layout.height,
+        "binning": factor,
+        "median": round(background, 2),
+        "mean": round(float(image.mean()), 2),
+        "min": round(float(image.min()), 2),
+        "max": round(float(image.max()), 2),
+        "noise": round(noise * factor, 2),
+        "saturated_fraction": round(frame.saturated / (layout.width * layout.height), 6),
+        "stars": stars,
+        "hfr": round(hfr_value, 2) if hfr_value is not None else None,
+        "hfr_source": hfr_source,
+    }
+
+
+def find_fits_files(directory: str, recursive: bool = True) -> list[tuple[str, int, int]]:
+    """Path, size and modification time (ns) of every FITS file in a directory"""
+    found = []
+    pending = [directory]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        pending.append(entry.path)
+                elif entry.name.lower().endswith(FITS_EXTENSIONS):
+                    stat = entry.stat()
+                    found.append((os.path.abspath(entry.path), stat.st_size, stat.st_mtime_ns))
+    return found
+
+
+def analyze_file(path: str, max_size: int) -> dict[str, Any]:
+    """Statistics of one FITS file plus its main header cards; runs in worker processes"""
+    cards, frame = read_fits(path, max_size)
+    header = {name: cards[key] for key, name in HEADER_FIELDS.items() if key in cards}
+    return {**header, **frame_statistics(frame)}
+
+
+# Statistics summarized over many frames
+SUMMARY_FIELDS = ("hfr", "stars", "median", "noise", "saturated_fraction")
+
+
+def summarize(frames: list[dict]) -> tuple[dict[str, dict], list[int]]:
+    """Min, median and max of each statistic over many frames, and the indexes of frames that stand out
+
+    A frame stands out when its HFR is over 1.5 times the median (focus,
+    tracking) or it has fewer than half the median star count (clouds).
+    """
+    columns = {
+        name: np.array([frame.get(name) for frame in frames], dtype=np.float64)  # None becomes NaN
+        for name in SUMMARY_FIELDS
+    }
+    summary, medians = {}, {}
+    for name, values in columns.items():
+        valid = values[~np.isnan(values)]
+        if len(valid):
+            medians[name] = float(np.median(valid))
+            summary[name] = {
+                "min": round(float(valid.min()), 6),
+                "median": round(medians[name], 6),
+                "max": round(float(valid.max()), 6),
+            }
+
+    suspect = np.zeros(len(frames), dtype=bool)
+    with np.errstate(invalid="ignore"):
+        if "hfr" in medians:
+            suspect |= columns["hfr"] > 1.5 * medians["hfr"]
+        if "stars" in medians:
+            suspect |= columns["stars"] < 0.5 * medians["stars"]
+    return summary, np.nonzero(suspect)[0].tolist()
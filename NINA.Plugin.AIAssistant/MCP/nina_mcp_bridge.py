@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+NINA Advanced API MCP bridge
+Connects a stdio MCP client (such as the NINA plugin) to a long-lived
+`nina_advanced_api_mcp_server.py --daemon`, starting the daemon when it isn't running.
+Uses only the standard library so it starts in a few tens of milliseconds.
+"""
+
+import http.client
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Iterator, Optional
+from urllib.parse import urlsplit
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger("nina-mcp-bridge")
+
+# Daemon address: streamable HTTP endpoint, or a Unix socket when NINA_MCP_DAEMON_SOCKET is set
+DAEMON_URL = os.environ.get(
+    "NINA_MCP_DAEMON_URL", f"http://127.0.0.1:{os.environ.get('NINA_MCP_DAEMON_PORT', 8765)}/mcp"
+)
+DAEMON_SOCKET = os.environ.get("NINA_MCP_DAEMON_SOCKET", "")
+
+# Start a local daemon on the first connection failure, then wait up to STARTUP_TIMEOUT seconds for it
+AUTOSTART = os.environ.get("NINA_MCP_DAEMON_AUTOSTART", "1").lower() not in ("0", "false", "no")
+STARTUP_TIMEOUT = 30.0
+
+# Reconnect instead of reusing a connection idle for longer than this (uvicorn closes them after 5 s)
+KEEPALIVE_IDLE = 4.0
+
+# Wait this long before reopening the notification stream after it drops
+LISTEN_RETRY = 1.0
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nina_advanced_api_mcp_server.py")
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a Unix domain socket"""
+
+    def __init__(self, path: str):
+        super().__init__("localhost")
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+class DaemonClient:
+    """Forwards JSON-RPC messages to the daemon's streamable HTTP endpoint, keeping the MCP session id
+
+    Requests may be sent from several threads at once; each takes its own connection from a small
+    pool, so a slow tool call doesn't hold up the others.
+    """
+
+    def __init__(self, url: str, socket_path: str = ""):
+        self.url = urlsplit(url)
+        self.socket_path = socket_path
+        self.session_id: Optional[str] = None
+        self.initialize: Optional[bytes] = None
+        self._idle: list[tuple[http.client.HTTPConnection, float]] = []
+        self._lock = threading.Lock()
+        self._reinitialize = threading.Lock()
+        self._session_changed = threading.Condition(self._lock)
+
+    @property
+    def is_local(self) -> bool:
+        return bool(self.socket_path) or self.url.hostname in ("127.0.0.1", "localhost", "::1")
+
+    def new_connection(self) -> http.client.HTTPConnection:
+        if self.socket_path:
+            return UnixHTTPConnection(self.socket_path)
+        return http.client.HTTPConnection(self.url.hostname, self.url.port or 80)
+
+    def connection(self) -> http.client.HTTPConnection:
+        """An idle pooled connection, or a new one"""
+        with self._lock:
+            while self._idle:
+                connection, last_used = self._idle.pop()
+                if time.monotonic() - last_used <= KEEPALIVE_IDLE:
+                    return connection
+                connection.close()
+        return self.new_connection()
+
+    def release(self, connection: http.client.HTTPConnection):
+        with self._lock:
+            self._idle.append((connection, time.monotonic()))
+
+    def set_session(self, session_id: Optional[str]):
+        with self._lock:
+            if session_id != self.session_id:
+                self.session_id = session_id
+                self._session_changed.notify_all()
+
+    def headers(self, accept: str) -> dict[str, str]:
+        headers = {"Accept": accept}
+        if self.session_id:
+            headers["Mcp-Session-Id"] = self.session_id
+        return headers
+
+    def post(self, message: bytes) -> tuple[int, list[bytes]]:
+        """POST one message; returns the HTTP status and every JSON-RPC message the daemon sent back
+
+        Only failures while sending are retried (after starting the daemon if it is down), so a
+        request the daemon may already have received is never delivered twice.
+        """
+        headers = self.headers("application/json, text/event-stream")
+        headers["Content-Type"] = "application/json"
+        started = False
+        for attempt in range(3):
+            connection = self.connection()
+            try:
+                connection.request("POST", self.url.path or "/mcp", body=message, headers=headers)
+                break
+            except (ConnectionRefusedError, FileNotFoundError):
+                connection.close()
+                if started or not AUTOSTART or not self.is_local:
+                    raise
+                started = True
+                start_daemon(self)
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                if attempt == 2:
+                    raise
+        else:
+            raise ConnectionError("Could not send the request to the MCP daemon")
+        try:
+            response = connection.getresponse()
+            if response.getheader("content-type", "").startswith("text/event-stream"):
+                messages = list(read_events(response))
+            else:
+                body = response.read()
+                messages = [body] if body else []
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            raise
+        self.release(connection)
+
+        session_id = response.getheader("mcp-session-id")
+        if session_id:
+            self.set_session(session_id)
+        if response.status == 202:
+            return response.status, []
+        return response.status, messages
+
+    def send(self, message: bytes) -> list[bytes]:
+        """Forward a message, re-initializing transparently if the daemon restarted and lost the session"""
+        if b'"initialize"' in message and json.loads(message).get("method") == "initialize":
+            self.initialize = message
+            self.set_session(None)
+
+        session_id = self.session_id
+        status, messages = self.post(message)
+        if status == 404 and session_id and self.initialize is not None:
+            with self._reinitialize:
+                # Requests failing together re-initialize once
+                if self.session_id == session_id:
+                    logger.warning("Daemon session expired; re-initializing")
+                    self.set_session(None)
+                    self.post(self.initialize)
+                    self.post(b'{"jsonrpc":"2.0","method":"notifications/initialized"}')
+            status, messages = self.post(message)
+        return messages
+
+    def listen(self, emit: Callable[[bytes], None]):
+        """Relay messages the daemon sends outside any request (such as resources/updated) to emit
+
+        Holds the session's GET stream open, reopening it after the daemon restarts or the
+        session is re-initialized. Returns if the daemon doesn't offer the stream.
+        """
+        session_id = None
+        while True:
+            with self._lock:
+                while self.session_id is None or self.session_id == session_id:
+                    self._session_changed.wait()
+                session_id = self.session_id
+            connection = self.new_connection()
+            try:
+                connection.request("GET", self.url.path or "/mcp", headers=self.headers("text/event-stream"))
+                response = connection.getresponse()
+                if response.status == 200:
+                    # Read until the daemon closes the stream; the same session may then be reopened
+                    for event in read_events(response):
+                        emit(event)
+                    session_id = None
+                elif response.status in (405, 406):
+                    logger.info("Daemon does not offer a notification stream")
+                    return
+                else:
+                    # 404 waits for the next session; anything else (409 while the old stream closes) retries
+                    response.read()
+                    if response.status != 404:
+                        session_id = None
+            except (OSError, http.client.HTTPException) as e:
+                logger.debug(f"Notification stream closed: {e}")
+                session_id = None
+            finally:
+                connection.close()
+            if session_id is None:
+                time.sleep(LISTEN_RETRY)
+
+    def close(self):
+        with self._lock:
+            for connection, _ in self._idle:
+                connection.close()
+            self._idle.clear()
+
+
+def read_events(response: http.client.HTTPResponse) -> Iterator[bytes]:
+    """The data of each server-sent event, as it arrives"""
+    data: list[bytes] = []
+    for line in response:
+        line = line.rstrip(b"\r\n")
+        if not line:
+            if data:
+                yield b"\n".join(data)
+            data = []
+        elif line.startswith(b"data:"):
+            data.append(line[5:].lstrip(b" "))
+    if data:
+        yield b"\n".join(data)
+
+
+def start_daemon(client: DaemonClient):
+    """Launch the daemon in the background and wait until it accepts connections"""
+    command = [sys.executable, SERVER_SCRIPT, "--daemon"]
+    if client.socket_path:
+        command += ["--socket", client.socket_path]
+    else:
+        command += ["--host", client.url.hostname, "--port", str(client.url.port or 80)]
+    logger.info(f"Starting MCP daemon: {' '.join(command)}")
+
+    if os.name == "nt":
+        flags = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+        subprocess.Popen(command, creationflags=flags, stdin=subprocess.DEVNULL,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    else:
+        subprocess.Popen(command, start_new_session=True, stdin=subprocess.DEVNULL,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        connection = client.new_connection()
+        try:
+            connection.connect()
+            client.release(connection)
+            return
+        except OSError:
+            connection.close()
+            time.sleep(0.1)
+    raise TimeoutError(f"MCP daemon did not start within {STARTUP_TIMEOUT:.0f}s")
+
+
+def error_response(message: bytes, error: BaseException) -> Optional[bytes]:
+    """JSON-RPC error for a request the daemon couldn't answer (None for notifications)"""
+    try:
+        request_id = json.loads(message).get("id")
+    except (ValueError, AttributeError):
+        request_id = None
+    if request_id is None:
+        return None
+    text = str(error) or type(error).__name__
+    return json.dumps({"jsonrpc": "2.0", "id": request_id,
+                       "error": {"code": -32603, "message": f"MCP daemon unavailable: {text}"}}).encode()
+
+
+class StdoutWriter:
+    """Writes JSON-RPC messages to stdout, one per line, from any thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def write(self, message: bytes):
+        if b"\n" in message:
+            message = json.dumps(json.loads(message), separators=(",", ":")).encode()
+        with self._lock:
+            sys.stdout.buffer.write(message + b"\n")
+            sys.stdout.buffer.flush()
+
+
+def forward(client: DaemonClient, stdout: StdoutWriter, message: bytes):
+    try:
+        responses = client.send(message)
+    except Exception as e:
+        logger.error(f"Forwarding failed: {e}")
+        response = error_response(message, e)
+        responses = [response] if response is not None else []
+    for response in responses:
+        stdout.write(response)
+
+
+def main():
+    client = DaemonClient(DAEMON_URL, DAEMON_SOCKET)
+    stdout = StdoutWriter()
+    threading.Thread(target=client.listen, args=(stdout.write,), name="listen", daemon=True).start()
+
+    requests: set[threading.Thread] = set()
+    for line in sys.stdin.buffer:
+        message = line.strip()
+        if not message:
+            continue
+        try:
+            parsed = json.loads(message)
+        except ValueError:
+            parsed = None
+        if isinstance(parsed, dict) and "id" in parsed and parsed.get("method") not in (None, "initialize"):
+            # Requests run side by side; initialize, notifications and responses keep their order
+            thread = threading.Thread(target=forward, args=(client, stdout, message), daemon=True)
+            requests.add(thread)
+            thread.start()
+            requests = {thread for thread in requests if thread.is_alive()}
+        else:
+            forward(client, stdout, message)
+
+    for thread in requests:
+        thread.join()
+    client.close()
+
+
+if __name__ == "__main__":
+    main()